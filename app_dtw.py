@@ -1,8 +1,10 @@
+import sys
+
 from heuristic_dtw1 import *
 
 if __name__ == "__main__":
-    # Caminho para a pasta SVG
-    svg_folder_path = '/content/svg_harry'
+    # Caminho para a pasta SVG (o padrão é o do Colab)
+    svg_folder_path = sys.argv[1] if len(sys.argv) > 1 else '/content/svg_harry'
 
     # Executa o fluxo principal
-    main(svg_folder_path)
\ No newline at end of file
+    main(svg_folder_path)
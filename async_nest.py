@@ -0,0 +1,299 @@
+"""
+API assíncrona (asyncio) de nesting, com resultados parciais e cancelamento.
+
+main() das variantes é uma chamada bloqueante que só plota e imprime. Aqui
+um NestingJob roda o mesmo pipeline (carga, ordenação, empacotamento, a troca
+por folhas mais baratas com um estoque de folhas e, se configurada, a
+compactação) numa thread de trabalho, sem bloquear o laço de eventos, e:
+
+- envia eventos de progresso (dicionários, como os da telemetria): o início
+  de cada etapa, cada peça posicionada (com a quantidade de folhas e o
+  aproveitamento) e o fim do trabalho;
+- expõe a qualquer momento o melhor layout até ali (`best`, `document`),
+  com as peças ainda não posicionadas listadas à parte;
+- pode ser cancelado (`cancel`) ou ter um prazo (`deadline`, em segundos):
+  o empacotamento para antes da próxima peça e o layout parcial vira o
+  resultado. A carga e a ordenação não são interrompidas no meio, e a
+  compactação recebe como orçamento o que restar do prazo.
+
+A configuração é a do nest.py (resolve_config); o otimizador (`optimize`)
+não tem resultados parciais por peça e não é aceito aqui.
+
+Exemplo:
+    async def handler(source):
+        async with NestingJob(source, {'engine': 'raster'}, deadline=2.0) as job:
+            async for event in job.events():
+                if event['event'] == 'placed':
+                    await send_progress(event)
+            return job.document()
+"""
+import asyncio
+import importlib
+import threading
+import time
+from functools import partial
+
+from bin_packing import PackingResult, pack, placement_order
+from nest import layout_document, layout_transforms, ordering_options, resolve_config, search_options
+from parallel_search import ParallelPlacer
+from sheets import sheet_areas
+
+# Estados finais de um trabalho
+STATUSES = ('complete', 'cancelled', 'deadline', 'error')
+
+
+class JobStopped(Exception):
+    """Interrompe o empacotamento quando o trabalho é cancelado ou o prazo acaba."""
+
+
+class SnapshotSheet(list):
+    """Peças de uma folha do LayoutSnapshot, com o tipo da folha (None sem estoque de folhas)."""
+
+    def __init__(self, sheet_type=None):
+        super().__init__()
+        self.sheet_type = sheet_type
+
+
+class LayoutSnapshot:
+    """Layout de um trabalho num dado momento.
+
+    Attributes:
+        result (PackingResult): As peças já posicionadas; as folhas são listas de polígonos
+            (SnapshotSheet, com o tipo de cada folha).
+        pending (list): Índices das peças que ainda não passaram pela busca.
+        stage (str): Etapa do trabalho ('load', 'order', 'pack', 'reduce_cost', 'compact' ou um dos STATUSES).
+        seconds (float): Tempo desde o início do trabalho.
+    """
+
+    def __init__(self, placements, sheet_types, unplaced, pending, stage, seconds):
+        self.result = PackingResult()
+        self.result.sheets = [SnapshotSheet(sheet_type) for sheet_type in sheet_types]
+        for _, sheet_index, placed, _ in placements:
+            self.result.sheets[sheet_index].append(placed)
+        self.result.placements = list(placements)
+        self.result.unplaced = list(unplaced)
+        self.pending = list(pending)
+        self.stage = stage
+        self.seconds = seconds
+
+    @property
+    def complete(self):
+        return not self.pending and self.stage == 'complete'
+
+
+class NestingJob:
+    """Trabalho de nesting de uma fonte, executado numa thread de trabalho.
+
+    Args:
+        source (str): Pasta com os SVGs das peças, ou o SVG do modelo inteiro.
+        config (dict): Opções do nest.py (as ausentes usam os padrões de resolve_config).
+        deadline (float): Prazo em segundos desde `start`; None para ir até o fim.
+        executor (concurrent.futures.Executor): Onde rodar o trabalho; usa o executor
+            padrão do laço de eventos se None.
+    """
+
+    def __init__(self, source, config=None, deadline=None, executor=None):
+        self.source = source
+        self.config = resolve_config(config or {})
+        if self.config['optimize']:
+            raise ValueError("NestingJob reports progress per placed part; optimize is not supported")
+        self.deadline = deadline
+        self.executor = executor
+        self.status = None
+        self.error = None
+        self._stop = threading.Event()
+        self._stop_reason = None
+        self._polygons = None
+        self._snapshot = LayoutSnapshot([], [], [], [], 'load', 0.0)
+        self._loop = None
+        self._queue = None
+        self._future = None
+        self._start = None
+
+    def start(self):
+        """Inicia o trabalho (dentro de um laço de eventos em execução)."""
+        if self._future is not None:
+            raise RuntimeError('NestingJob already started')
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue()
+        self._start = time.monotonic()
+        self._future = self._loop.run_in_executor(self.executor, self._run)
+        return self
+
+    def cancel(self):
+        """Pede o fim do trabalho; o layout parcial vira o resultado."""
+        self._stop_reason = self._stop_reason or 'cancelled'
+        self._stop.set()
+
+    def best(self):
+        """Melhor layout até agora (LayoutSnapshot)."""
+        return self._snapshot
+
+    def document(self):
+        """Melhor layout até agora no formato JSON do nest.py (com as peças pendentes)."""
+        snapshot = self._snapshot
+        if self._polygons is None:
+            transforms = []
+        else:
+            transforms = layout_transforms(self.config, self._polygons, snapshot.result)
+        document = layout_document(self.source, self.config, snapshot.result, transforms)
+        document.update(pending=snapshot.pending, stage=snapshot.stage)
+        return document
+
+    async def events(self):
+        """Eventos de progresso, até o fim do trabalho (o último tem event='done')."""
+        while True:
+            event = await self._queue.get()
+            if event is None:
+                return
+            yield event
+
+    async def wait(self):
+        """Espera o fim do trabalho e devolve o layout final (erros do trabalho são relançados)."""
+        await asyncio.shield(self._future)
+        return self._snapshot
+
+    async def __aenter__(self):
+        return self.start()
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        if self.status is None:
+            self.cancel()
+        try:
+            await self.wait()
+        except Exception:
+            if exc_type is None:
+                raise
+        return False
+
+    # Função para enviar um evento ao laço de eventos (chamada da thread de trabalho)
+    def _emit(self, event, **fields):
+        fields = dict(event=event, seconds=time.monotonic() - self._start, **fields)
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, fields)
+
+    def _expired(self):
+        if self.deadline is not None and time.monotonic() - self._start >= self.deadline:
+            self._stop_reason = self._stop_reason or 'deadline'
+            self._stop.set()
+        return self._stop.is_set()
+
+    def _publish(self, result, pending, stage):
+        self._snapshot = LayoutSnapshot(result.placements, _sheet_types(result), result.unplaced, pending, stage,
+                                        time.monotonic() - self._start)
+
+    def _utilisation(self, result, sheet_size):
+        if not result.sheets:
+            return 0.0
+        return sum(placed.area for _, _, placed, _ in result.placements) / sum(sheet_areas(result.sheets, sheet_size))
+
+    def _run(self):
+        try:
+            self._pipeline()
+        except JobStopped:
+            self.status = self._stop_reason
+        except Exception as error:
+            self.status, self.error = 'error', error
+            self._finish(error=f'{type(error).__name__}: {error}')
+            raise
+        else:
+            self.status = self._stop_reason or 'complete'
+        self._finish()
+
+    # Função para fechar o layout com o estado final e encerrar o fluxo de eventos
+    def _finish(self, **fields):
+        result, pending = self._snapshot.result, self._snapshot.pending
+        self._snapshot = LayoutSnapshot(result.placements, _sheet_types(result), result.unplaced, pending, self.status,
+                                        time.monotonic() - self._start)
+        self._emit('done', status=self.status, placed=len(result.placements), pending=len(pending),
+                   sheets=len(result.sheets), **fields)
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, None)
+
+    def _pipeline(self):
+        config = self.config
+        module = importlib.import_module(config['variant'])
+        options = search_options(config)
+        sheet_size = options['sheet_size']
+
+        self._emit('stage', stage='load')
+        polygons = module.load_part_store(self.source, config['use_cache'], config['cache_dir'], config['scale'])
+        self._polygons = polygons
+        if self._expired():
+            raise JobStopped
+        self._emit('stage', stage='order', parts=len(polygons))
+        order = placement_order(module.order_polygons(polygons, config['ordering'], **ordering_options(config)))
+        if self._expired():
+            raise JobStopped
+
+        # Empacotamento peça a peça: a cada chamada da busca o layout parcial é publicado
+        self._emit('stage', stage='pack', parts=len(polygons))
+        place, new_sheet, packing_area = module.packing_setup(config['engine'], **options)
+        result = PackingResult()
+        done = set()
+        self._publish(result, order, 'pack')
+
+        def report():
+            if len(result.placements) + len(result.unplaced) > len(done):
+                done.update(index for index, _, _, _ in result.placements)
+                done.update(result.unplaced)
+                self._publish(result, [index for index in order if index not in done], 'pack')
+                self._emit('placed', placed=len(result.placements), unplaced=len(result.unplaced),
+                           parts=len(polygons), sheets=len(result.sheets),
+                           utilisation=self._utilisation(result, sheet_size))
+
+        def stoppable(poly, sheets, place):
+            report()
+            if self._expired():
+                raise JobStopped
+            return place(poly, sheets)
+
+        placer = ParallelPlacer(config['workers']) if config['workers'] > 1 else None
+        try:
+            pack(polygons, order, partial(stoppable, place=partial(place, placer=placer)), new_sheet,
+                 packing_area, config['packing'], result)
+        finally:
+            if placer is not None:
+                placer.close()
+            report()
+
+        if hasattr(new_sheet, 'reduce_cost') and not self._expired():
+            # Estoque de folhas: troca as folhas pelas mais baratas em que as suas peças caibam
+            self._emit('stage', stage='reduce_cost')
+            if new_sheet.reduce_cost(result, polygons, place):
+                self._publish(result, [], 'reduce_cost')
+                self._emit('improved', sheets=len(result.sheets), utilisation=self._utilisation(result, sheet_size),
+                           cost=new_sheet.cost(result.sheets))
+
+        if config['compact'] and not self._expired():
+            self._emit('stage', stage='compact')
+            budget = config['compact']
+            if self.deadline is not None:
+                budget = min(budget, self.deadline - (time.monotonic() - self._start))
+            compaction = module.compact_polygons(polygons, result, budget, config['engine'], **options)
+            self._publish(compaction.packing, [], 'compact')
+            self._emit('improved', sheets=len(compaction.packing.sheets),
+                       utilisation=self._utilisation(compaction.packing, sheet_size),
+                       unfilled_before=sum(compaction.unfilled_before),
+                       unfilled_after=sum(compaction.unfilled_after))
+
+
+# Função para obter o tipo de cada folha de um empacotamento (None nas folhas sem tipo)
+def _sheet_types(result):
+    return [getattr(sheet, 'sheet_type', None) for sheet in result.sheets]
+
+
+async def nest_async(source, config=None, deadline=None, on_event=None):
+    """Executa um NestingJob até o fim e devolve o layout final.
+
+    Args:
+        on_event (callable): Chamada com cada evento de progresso (pode ser uma corrotina).
+
+    Returns:
+        LayoutSnapshot: O layout final (parcial, se o prazo acabar antes).
+    """
+    async with NestingJob(source, config, deadline) as job:
+        async for event in job.events():
+            if on_event is not None:
+                handled = on_event(event)
+                if asyncio.iscoroutine(handled):
+                    await handled
+        return await job.wait()
@@ -0,0 +1,92 @@
+"""
+Avaliação em lote das posições candidatas da varredura em grade.
+
+Em vez de criar e testar um objeto shapely por célula da grade dentro de um
+laço Python, todas as translações de uma rotação são montadas de uma vez como
+um array de geometrias, e os testes `within` e de colisão rodam como funções
+vetorizadas do shapely 2. A ordem de varredura (y externo, x interno) é
+preservada, então o resultado é o mesmo da busca first-fit original.
+"""
+import numpy as np
+import shapely
+
+import telemetry
+from spatial_index import as_sheet_layout
+
+
+# Função para gerar as translações na ordem da varredura: para cada y, todos os x
+def grid_offsets(xs, ys):
+    xs = np.asarray(xs, dtype=float)
+    ys = np.asarray(ys, dtype=float)
+    return np.column_stack([np.tile(xs, len(ys)), np.repeat(ys, len(xs))])
+
+
+def translated_copies(poly, offsets):
+    """Cria um array com uma cópia de `poly` transladada por cada linha de `offsets`."""
+    copies = np.full(len(offsets), poly, dtype=object)
+    n_coords = len(shapely.get_coordinates(poly))
+    coords = np.tile(shapely.get_coordinates(poly), (len(offsets), 1)) + np.repeat(offsets, n_coords, axis=0)
+    return shapely.set_coordinates(copies, coords)
+
+
+def first_fit_batch(rotated_poly, current_layout, sheet_box, xs, ys, clearance=0, on_invalid='repair', chunk_size=2048,
+                    region=None):
+    """Encontra a primeira posição viável da grade para um polígono já rotacionado.
+
+    As candidatas são avaliadas em blocos que dobram de tamanho até `chunk_size`,
+    para que a busca ainda termine cedo quando a primeira posição viável aparece logo.
+
+    Args:
+        rotated_poly (shapely.geometry.Polygon): O polígono (já rotacionado) a ser posicionado.
+        current_layout (list | SheetLayout): Peças já posicionadas na folha.
+        sheet_box (shapely.geometry.Polygon): O retângulo da folha.
+        xs (array): Translações em x, na ordem da varredura.
+        ys (array): Translações em y, na ordem da varredura.
+        clearance (float): Folga mínima exigida entre as peças.
+        on_invalid (str): O que fazer com candidatas que ficam inválidas após a
+            translação (erro de arredondamento): 'repair' aplica buffer(0), 'skip' as descarta.
+        chunk_size (int): Quantidade de candidatas avaliadas por bloco.
+        region (sheets.SheetRegion): Região de uma folha irregular, dentro de `sheet_box`;
+            as candidatas também precisam estar dentro dela.
+
+    Returns:
+        shapely.geometry.Polygon: O polígono transladado, ou None se não for encontrado encaixe.
+    """
+    sheet_layout = as_sheet_layout(current_layout, clearance)
+    offsets = grid_offsets(xs, ys)
+
+    # `within` de uma folha retangular equivale a comparar bounding boxes, o que
+    # dispensa criar as geometrias das candidatas que ficariam fora da folha
+    minx, miny, maxx, maxy = rotated_poly.bounds
+    sx0, sy0, sx1, sy1 = sheet_box.bounds
+    inside = ((offsets[:, 0] + minx >= sx0) & (offsets[:, 0] + maxx <= sx1)
+              & (offsets[:, 1] + miny >= sy0) & (offsets[:, 1] + maxy <= sy1))
+    offsets = offsets[inside]
+    telemetry.count('rejected_outside_sheet', len(inside) - len(offsets))
+
+    start, size = 0, min(64, chunk_size)
+    while start < len(offsets):
+        candidates = translated_copies(rotated_poly, offsets[start:start + size])
+        start, size = start + size, min(2 * size, chunk_size)
+        telemetry.count('candidates', len(candidates))
+        valid = shapely.is_valid(candidates)
+        if on_invalid == 'repair':
+            telemetry.count('repairs', int(len(valid) - np.count_nonzero(valid)))
+            candidates[~valid] = shapely.buffer(candidates[~valid], 0)
+            # O reparo pode mover o contorno, então a folha é conferida de novo
+            valid[~valid] = shapely.within(candidates[~valid], sheet_box)
+        telemetry.count('rejected_invalid', int(len(valid) - np.count_nonzero(valid)))
+        candidates = candidates[valid]
+        if region is not None:
+            inside = region.contains_many(candidates)
+            telemetry.count('rejected_outside_sheet', int(len(inside) - np.count_nonzero(inside)))
+            candidates = candidates[inside]
+        if len(candidates) == 0:
+            continue
+        free = ~sheet_layout.collides_many(candidates)
+        if free.any():
+            # As candidatas depois da primeira livre não foram rejeitadas, só não foram necessárias
+            telemetry.count('rejected_collision', int(np.argmax(free)))
+            return candidates[np.argmax(free)]
+        telemetry.count('rejected_collision', len(candidates))
+    return None
@@ -0,0 +1,368 @@
+"""
+Serviço de nesting em lote: uma fila de trabalhos num pool de processos aquecidos.
+
+Cada modelo era uma execução nova do nest.py (ou de separate_comps.py e da
+variante), que importava de novo o shapely, o svgpathtools e o scipy e
+recalculava tudo. Aqui um processo de longa duração lê os trabalhos de uma
+fila e os distribui num pool de processos de trabalho que:
+
+- já chegam com as variantes e a exportação importadas (initializer), e
+  ficam vivos entre os trabalhos, então o custo dos imports é pago uma vez
+  por processo, e os caches em memória (rotações das peças, máscaras do
+  motor 'raster') valem para os trabalhos seguintes;
+- compartilham o cache em disco das peças já extraídas dos SVGs
+  (geometry_cache.py, na pasta `cache_dir` do serviço): um SVG analisado por
+  um trabalho não é analisado de novo por nenhum outro.
+
+A fila é:
+
+- uma pasta com um JSON por trabalho: cada arquivo é reservado movendo-o
+  para `running/` (o rename é atômico, então vários serviços podem dividir a
+  mesma fila) e termina em `done/` ou `failed/`. Com --watch a pasta é
+  relida a cada `poll` segundos e o serviço fica esperando novos trabalhos;
+- ou um arquivo JSON lines, um trabalho por linha.
+
+Um trabalho é {"source": pasta ou SVG, "name": opcional, "config": {...},
+"format": [...]}; a configuração é a do nest.py (ver resolve_config), sobre
+a configuração base do serviço. Caminhos relativos são resolvidos a partir
+da pasta do arquivo do trabalho.
+
+Para cada trabalho são gravados em <output>/<nome>/ o layout (nest.write_layout)
+e um report.json com o tempo de espera na fila, o tempo de cada etapa
+(telemetria: carga, ordenação, empacotamento, compactação, exportação), os
+acertos do cache de peças, o processo que o executou, as folhas e o
+aproveitamento; o mesmo relatório é acrescentado a <output>/reports.jsonl.
+
+Exemplo:
+    python batch_service.py fila --output layouts --workers 4
+    python batch_service.py fila --output layouts --workers 4 --watch --poll 5
+    python batch_service.py trabalhos.jsonl --output layouts --config base.json
+"""
+import argparse
+import importlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import telemetry
+from geometry_cache import DEFAULT_CACHE_DIR
+from nest import DEFAULT_CONFIG, FORMATS, VARIANTS, load_config, nest, resolve_config, search_options, write_layout
+from sheets import sheet_areas
+
+# Subpastas de uma fila em pasta, por estado do trabalho
+QUEUE_STATES = ('running', 'done', 'failed')
+
+# Etapas da telemetria copiadas para o relatório de cada trabalho
+REPORT_STAGES = ('load', 'order', 'pack', 'compact', 'add_parts')
+
+
+class BatchJob:
+    """Um trabalho da fila.
+
+    Args:
+        source (str): Pasta com os SVGs das peças, ou o SVG do modelo inteiro.
+        name (str): Nome do trabalho (a pasta dos resultados); usa o nome da fonte se None.
+        config (dict): Configuração do trabalho, sobre a configuração base do serviço.
+        formats (list): Formatos gravados (ver nest.FORMATS).
+        path (str): Arquivo do trabalho numa fila em pasta (None numa fila em arquivo).
+    """
+
+    def __init__(self, source, name=None, config=None, formats=('json',), path=None):
+        self.source = source
+        self.name = name or os.path.splitext(os.path.basename(os.path.normpath(source)))[0]
+        self.config = dict(config or {})
+        self.formats = list(formats)
+        self.path = path
+        # O nome vira uma pasta dentro de --output: não pode apontar para fora dela
+        if self.name in ('.', '..') or any(sep in self.name for sep in ('/', '\\', os.sep)):
+            raise ValueError(f"Invalid job name {self.name!r}; it must not contain path separators or be '.' or '..'")
+        unknown = set(self.formats) - set(FORMATS)
+        if unknown:
+            raise ValueError(f"Unknown formats {sorted(unknown)} in job {self.name!r}; expected {FORMATS}")
+        unknown = set(self.config) - set(DEFAULT_CONFIG)
+        if unknown:
+            raise ValueError(f"Unknown configuration keys in job {self.name!r}: {sorted(unknown)}")
+
+    @classmethod
+    def from_spec(cls, spec, base_dir='.', path=None):
+        """Monta o trabalho a partir do dicionário lido da fila."""
+        unknown = set(spec) - {'source', 'name', 'config', 'format'}
+        if unknown or 'source' not in spec:
+            raise ValueError(f"Invalid job specification (needs 'source', got keys {sorted(spec)})")
+        source = os.path.join(base_dir, spec['source'])
+        formats = spec.get('format', ['json'])
+        return cls(source, spec.get('name'), spec.get('config'), [formats] if isinstance(formats, str) else formats,
+                   path)
+
+
+def read_job_file(path, base_dir=None):
+    """Lê um trabalho de um arquivo JSON da fila (caminhos relativos a `base_dir`, ou à pasta do arquivo)."""
+    with open(path) as job_file:
+        spec = json.load(job_file)
+    return BatchJob.from_spec(spec, os.path.dirname(os.path.abspath(path)) if base_dir is None else base_dir, path)
+
+
+def read_job_lines(path):
+    """Lê os trabalhos de um arquivo JSON lines (linhas vazias e iniciadas por # são ignoradas)."""
+    base_dir = os.path.dirname(os.path.abspath(path))
+    jobs, names = [], {}
+    with open(path) as jobs_file:
+        for line in jobs_file:
+            if line.strip() and not line.lstrip().startswith('#'):
+                job = BatchJob.from_spec(json.loads(line), base_dir)
+                # Nomes repetidos (a mesma fonte com outra configuração) ganham um sufixo
+                names[job.name] = names.get(job.name, 0) + 1
+                if names[job.name] > 1:
+                    job.name = f'{job.name}-{names[job.name]}'
+                jobs.append(job)
+    return jobs
+
+
+def claim_jobs(queue_dir, limit=None):
+    """Reserva os trabalhos pendentes de uma fila em pasta, movendo-os para `running/`.
+
+    Args:
+        limit (int): Máximo de trabalhos reservados; None para todos.
+
+    Returns:
+        list: Os trabalhos reservados (os arquivos inválidos vão para `failed/`).
+    """
+    for state in QUEUE_STATES:
+        os.makedirs(os.path.join(queue_dir, state), exist_ok=True)
+    jobs = []
+    for filename in sorted(os.listdir(queue_dir)):
+        if limit is not None and len(jobs) >= limit:
+            break
+        if not filename.endswith('.json'):
+            continue
+        running = os.path.join(queue_dir, 'running', filename)
+        try:
+            os.rename(os.path.join(queue_dir, filename), running)
+        except FileNotFoundError:
+            continue  # outro serviço reservou antes
+        try:
+            job = read_job_file(running, queue_dir)
+        except (OSError, ValueError) as error:
+            print(f"{filename}: {type(error).__name__}: {error}", file=sys.stderr)
+            os.replace(running, os.path.join(queue_dir, 'failed', filename))
+            continue
+        jobs.append(job)
+    return jobs
+
+
+# Função de inicialização dos processos de trabalho: paga os imports uma vez por processo
+def _warm_worker(variants):
+    for variant in variants:
+        importlib.import_module(variant)
+    importlib.import_module('export')
+
+
+def run_job(job, base_config, output, submitted, cache_dir=None):
+    """Executa um trabalho (num processo de trabalho) e grava o layout e o relatório.
+
+    Args:
+        job (BatchJob): O trabalho.
+        base_config (dict): Configuração base do serviço.
+        output (str): Pasta dos resultados.
+        submitted (float): Instante (time.time) em que o trabalho entrou no pool.
+        cache_dir (str): Pasta do cache de peças, quando o trabalho não escolhe outra.
+
+    Returns:
+        dict: O relatório do trabalho.
+    """
+    started = time.time()
+    report = {'name': job.name, 'source': job.source, 'status': 'ok', 'pid': os.getpid(),
+              'wait_seconds': started - submitted}
+    sink = telemetry.MemorySink()
+    try:
+        with telemetry.recording(sink):
+            config = resolve_config({'cache_dir': cache_dir}, base_config, job.config)
+            result, transforms = nest(job.source, config)
+            with telemetry.span('export', formats=job.formats):
+                outputs = write_layout(os.path.join(output, job.name, job.name), job.source, config, result,
+                                       transforms, job.formats)
+        areas = sheet_areas(result.sheets, search_options(config)['sheet_size'])
+        report.update(parts=len(result.placements) + len(result.unplaced), sheets=len(result.sheets),
+                      unplaced=len(result.unplaced), outputs=outputs,
+                      utilisation=[sum(poly.area for poly in sheet) / area
+                                   for sheet, area in zip(result.sheets, areas)])
+        if config['sheets']:
+            report['cost'] = sum(sheet.sheet_type.cost for sheet in result.sheets)
+    except Exception as error:  # o erro fica no relatório; o processo continua servindo a fila
+        report.update(status='error', error=f'{type(error).__name__}: {error}')
+    summary = sink.summary()
+    report['stages'] = {stage: summary[stage]['seconds'] for stage in REPORT_STAGES + ('export',)
+                        if stage in summary}
+    load_counters = summary.get('load', {}).get('counters', {})
+    report['cache'] = {'hits': load_counters.get('cache_hits', 0), 'misses': load_counters.get('cache_misses', 0)}
+    report['seconds'] = time.time() - started
+    os.makedirs(os.path.join(output, job.name), exist_ok=True)
+    with open(os.path.join(output, job.name, 'report.json'), 'w') as report_file:
+        json.dump(report, report_file, indent=1)
+    return report
+
+
+class BatchService:
+    """Pool de processos aquecidos que executa trabalhos de nesting.
+
+    Args:
+        output (str): Pasta dos resultados.
+        workers (int): Processos de trabalho.
+        config (dict): Configuração base dos trabalhos (como a de nest.resolve_config).
+        cache_dir (str): Cache de peças compartilhado; usa o do geometry_cache se None.
+    """
+
+    def __init__(self, output, workers=1, config=None, cache_dir=None):
+        self.output = output
+        self.workers = workers
+        self.config = dict(config or {})
+        self.cache_dir = DEFAULT_CACHE_DIR if cache_dir is None else cache_dir
+        resolve_config(self.config)  # confere a configuração base antes de subir o pool
+        os.makedirs(output, exist_ok=True)
+        self._pool = ProcessPoolExecutor(max_workers=workers, initializer=_warm_worker,
+                                         initargs=(tuple(VARIANTS),))
+        self._pending = {}  # future -> trabalho
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+    def close(self):
+        self._pool.shutdown(wait=True, cancel_futures=True)
+
+    def submit(self, job):
+        """Coloca um trabalho no pool."""
+        future = self._pool.submit(run_job, job, self.config, self.output, time.time(), self.cache_dir)
+        self._pending[future] = job
+        return future
+
+    def collect(self, timeout=None):
+        """Espera algum trabalho terminar e registra os relatórios dos que terminaram.
+
+        Returns:
+            list: Os relatórios dos trabalhos terminados.
+        """
+        if not self._pending:
+            return []
+        finished, _ = wait(self._pending, timeout, return_when=FIRST_COMPLETED)
+        reports = []
+        for future in finished:
+            job = self._pending.pop(future)
+            try:
+                report = future.result()
+            except Exception as error:  # o processo de trabalho morreu ou o trabalho não pôde ser enviado
+                report = {'name': job.name, 'source': job.source, 'status': 'error',
+                          'error': f'{type(error).__name__}: {error}'}
+            self._record(job, report)
+            reports.append(report)
+        return reports
+
+    def _record(self, job, report):
+        with open(os.path.join(self.output, 'reports.jsonl'), 'a') as reports_file:
+            reports_file.write(json.dumps(report) + '\n')
+        if job.path is not None:
+            state = 'done' if report['status'] == 'ok' else 'failed'
+            queue_dir = os.path.dirname(os.path.dirname(job.path))
+            os.replace(job.path, os.path.join(queue_dir, state, os.path.basename(job.path)))
+        if report['status'] == 'ok':
+            print(f"{job.name}: {report['parts']} peças em {report['sheets']} folha(s), "
+                  f"{report['unplaced']} não couberam, {report['seconds']:.1f}s "
+                  f"(fila {report['wait_seconds']:.1f}s, cache {report['cache']['hits']}/"
+                  f"{report['cache']['hits'] + report['cache']['misses']})", file=sys.stderr)
+        else:
+            print(f"{job.name}: {report['error']}", file=sys.stderr)
+
+    def run(self, jobs):
+        """Executa os trabalhos e espera todos terminarem.
+
+        Returns:
+            list: Os relatórios, na ordem em que os trabalhos terminaram.
+        """
+        for job in jobs:
+            self.submit(job)
+        reports = []
+        try:
+            while self._pending:
+                reports += self.collect()
+        except KeyboardInterrupt:
+            self._requeue()
+            raise
+        return reports
+
+    def watch(self, queue_dir, poll=2.0, idle_exit=None):
+        """Serve uma fila em pasta, reservando os trabalhos novos a cada `poll` segundos.
+
+        Args:
+            idle_exit (float): Termina depois de tantos segundos sem trabalhos; None para nunca.
+
+        Returns:
+            list: Os relatórios dos trabalhos executados.
+        """
+        reports = []
+        idle_since = time.monotonic()
+        try:
+            while True:
+                # Só reserva o que o pool consegue começar logo; o resto fica na fila para outros serviços
+                if len(self._pending) < self.workers:
+                    for job in claim_jobs(queue_dir, self.workers - len(self._pending)):
+                        self.submit(job)
+                if self._pending:
+                    reports += self.collect(timeout=poll)
+                    idle_since = time.monotonic()
+                elif idle_exit is not None and time.monotonic() - idle_since >= idle_exit:
+                    return reports
+                else:
+                    time.sleep(poll)
+        except KeyboardInterrupt:
+            self._requeue()
+            raise
+
+    # Função para devolver à fila em pasta os trabalhos interrompidos (os de uma fila em arquivo são descartados)
+    def _requeue(self):
+        for job in self._pending.values():
+            if job.path is not None:
+                queue_dir = os.path.dirname(os.path.dirname(job.path))
+                os.replace(job.path, os.path.join(queue_dir, os.path.basename(job.path)))
+        self._pending.clear()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Nesting em lote de uma fila de trabalhos.')
+    parser.add_argument('queue', help='pasta com um JSON por trabalho, ou arquivo JSON lines')
+    parser.add_argument('--output', required=True, help='pasta dos resultados e relatórios')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='processos de trabalho')
+    parser.add_argument('--config', help='arquivo JSON com a configuração base dos trabalhos')
+    parser.add_argument('--cache-dir', help='cache de peças compartilhado pelos trabalhos')
+    parser.add_argument('--watch', action='store_true', help='continua esperando novos trabalhos na pasta')
+    parser.add_argument('--poll', type=float, default=2.0, help='intervalo de leitura da fila, em segundos')
+    args = parser.parse_args(argv)
+
+    try:
+        config = load_config(args.config) if args.config else {}
+        resolve_config(config)
+    except (OSError, ValueError) as error:
+        parser.error(str(error))
+    if args.watch and not os.path.isdir(args.queue):
+        parser.error('--watch requires a queue directory')
+
+    with BatchService(args.output, args.workers, config, args.cache_dir) as service:
+        try:
+            if args.watch:
+                reports = service.watch(args.queue, args.poll)
+            elif os.path.isdir(args.queue):
+                # Reserva aos poucos, como --watch, e termina quando a fila esvazia
+                reports = service.watch(args.queue, args.poll, idle_exit=0)
+            else:
+                reports = service.run(read_job_lines(args.queue))
+        except KeyboardInterrupt:
+            return 130
+    return 1 if any(report['status'] != 'ok' for report in reports) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
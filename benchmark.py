@@ -0,0 +1,312 @@
+"""
+Benchmark dos heurísticos de nesting sobre um corpus reproduzível.
+
+Cada caso (variante heuristic_dtw1/heuristic_dtw2, motor de busca, ordenação,
+estratégia de empacotamento e escala do corpus) roda num processo novo, sem
+plotar nada, e mede:
+
+- o tempo de cada etapa (carga, ordenação, empacotamento, avaliação);
+- a quantidade de chamadas geométricas (find_position, testes de colisão,
+  geometrias testadas em lote, NFPs e somas de Minkowski, distâncias DTW);
+- o pico de memória do processo;
+- o resumo da telemetria (telemetry.py) por etapa, com as rejeições por motivo;
+- a quantidade de folhas, as peças não posicionadas e o aproveitamento de cada folha.
+
+O corpus é o das peças de components_svg/ (escala 1) ou um conjunto sintético
+com `escala` cópias de cada peça, com variação de tamanho e rotação geradas
+por uma semente fixa, então o mesmo comando sempre produz as mesmas peças.
+
+O resultado é gravado em JSON; com --baseline cada caso é comparado com o
+mesmo caso de uma execução anterior e as regressões (tempo, memória, chamadas,
+folhas, aproveitamento) são listadas, com código de saída 1.
+
+Exemplo:
+    python benchmark.py --engines batch --scales 1 10 --output bench.json
+    python benchmark.py --engines batch --scales 1 10 --baseline bench.json
+"""
+import argparse
+import functools
+import importlib
+import json
+import os
+import platform
+import resource
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+import numpy as np
+import shapely
+from shapely.affinity import rotate, scale, translate
+
+import telemetry
+from nest import DEFAULT_CONFIG
+
+VARIANTS = ('heuristic_dtw1', 'heuristic_dtw2')
+ENGINES = ('nfp', 'batch', 'grid', 'raster')
+DEFAULT_SCALES = (1, 10)
+
+# Tolerâncias da comparação com a baseline
+TIME_TOLERANCE = 0.2  # fração do tempo da baseline
+MIN_TIME_DIFFERENCE = 0.05  # segundos; diferenças menores são ruído
+MEMORY_TOLERANCE = 0.2  # fração do pico de memória da baseline
+COUNTER_TOLERANCE = 0.05  # fração das chamadas geométricas da baseline
+UTILISATION_TOLERANCE = 0.01  # queda absoluta do aproveitamento médio
+
+
+def synthetic_corpus(base, scale_factor, seed=0):
+    """Corpus sintético com `scale_factor` cópias de cada peça base.
+
+    Cada cópia é reduzida por um fator aleatório em [0.7, 1] e girada por um
+    ângulo aleatório (as peças continuam cabendo na folha em alguma rotação),
+    e então levada à origem, como as peças lidas dos SVGs.
+
+    Args:
+        base (list): Os polígonos das peças originais.
+        scale_factor (int): Quantidade de cópias de cada peça; 1 devolve as peças originais.
+        seed (int): Semente do gerador, para um corpus reproduzível.
+
+    Returns:
+        list: Os polígonos do corpus.
+    """
+    if scale_factor == 1:
+        return list(base)
+    rng = np.random.default_rng(seed)
+    parts = []
+    for _ in range(scale_factor):
+        factors = rng.uniform(0.7, 1.0, len(base))
+        angles = rng.uniform(0, 360, len(base))
+        for poly, factor, angle in zip(base, factors, angles):
+            part = rotate(scale(poly, factor, factor, origin='centroid'), angle, origin='centroid')
+            minx, miny = part.bounds[:2]
+            parts.append(translate(part, -minx, -miny))
+    return parts
+
+
+# Função para contar as chamadas de uma função (e o tamanho dos lotes) dentro do processo do caso
+def _count_calls(owner, name, counters, batch_argument=None):
+    original = getattr(owner, name)
+    counters.setdefault(name, 0)
+    if batch_argument is not None:
+        counters.setdefault(f'{name}_geometries', 0)
+
+    @functools.wraps(original)
+    def counted(*args, **kwargs):
+        counters[name] += 1
+        if batch_argument is not None:
+            counters[f'{name}_geometries'] += len(args[batch_argument])
+        return original(*args, **kwargs)
+
+    setattr(owner, name, counted)
+
+
+def _instrument(module):
+    """Instala os contadores de chamadas geométricas; retorna o dicionário dos contadores."""
+    import batch_placement
+    import nfp
+    import ordering
+    import spatial_index
+
+    counters = {}
+    _count_calls(module, 'find_position', counters)
+    _count_calls(module, 'first_fit_batch', counters)
+    _count_calls(spatial_index.SheetLayout, 'collides', counters)
+    _count_calls(spatial_index.SheetLayout, 'collides_many', counters, batch_argument=1)
+    _count_calls(batch_placement, 'translated_copies', counters)
+    _count_calls(nfp.NFPCache, 'nfp', counters)
+    _count_calls(nfp.NFPCache, 'feasible', counters)
+    _count_calls(nfp, 'minkowski_sum', counters)
+    _count_calls(ordering, 'dtw_distances', counters)
+    return counters
+
+
+@contextmanager
+def _stage(timings, name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = time.perf_counter() - start
+
+
+def case_id(case):
+    """Identificação estável de um caso, usada para comparar com a baseline."""
+    return '/'.join([case['variant'], case['engine'], case['ordering'], case['packing'], f"x{case['scale']}"])
+
+
+def run_case(case):
+    """Executa um caso do benchmark (no processo atual) e retorna as suas medidas.
+
+    Args:
+        case (dict): variant, engine, ordering, packing, scale, seed, corpus, use_cache, cache_dir.
+
+    Returns:
+        dict: O caso com os tempos por etapa, os contadores, o pico de memória e o resultado do empacotamento.
+    """
+    module = importlib.import_module(case['variant'])
+    counters = _instrument(module)
+    timings = {}
+
+    with telemetry.recording(telemetry.MemorySink()) as sink:
+        with _stage(timings, 'load'):
+            base = module.load_part_polygons(case['corpus'], case['use_cache'], case['cache_dir'])
+            polygons = synthetic_corpus(base, case['scale'], case['seed'])
+        with _stage(timings, 'order'):
+            order = module.order_polygons(polygons, case['ordering'])
+        with _stage(timings, 'pack'):
+            result = module.pack_polygons(polygons, order, case['packing'], engine=case['engine'])
+        with _stage(timings, 'evaluate'):
+            sheet_area = module.a4_width * module.a4_height
+            unfilled = module.calculate_unfilled_area(result.sheets, module.a4_width, module.a4_height)
+            utilisation = [1 - area / sheet_area for area in unfilled]
+
+    return dict(case,
+                id=case_id(case),
+                parts=len(polygons),
+                vertices=int(shapely.get_num_coordinates(polygons).sum()),
+                timings=timings,
+                total_time=sum(timings.values()),
+                counters=counters,
+                telemetry=sink.summary(),
+                # ru_maxrss está em KiB no Linux
+                peak_memory_kb=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                sheets=len(result.sheets),
+                unplaced=len(result.unplaced),
+                utilisation=utilisation,
+                mean_utilisation=float(np.mean(utilisation)) if utilisation else 0.0)
+
+
+def run_cases(cases, repeat=1):
+    """Executa cada caso `repeat` vezes, cada execução num processo novo.
+
+    Com repetições, fica a execução de menor tempo total (as demais medidas
+    são determinísticas para o mesmo corpus).
+    """
+    results = []
+    for case in cases:
+        runs = []
+        for _ in range(repeat):
+            # Um processo por execução: o pico de memória e os caches são só do caso
+            with ProcessPoolExecutor(max_workers=1, max_tasks_per_child=1) as executor:
+                runs.append(executor.submit(run_case, case).result())
+        best = min(runs, key=lambda run: run['total_time'])
+        print(f"{best['id']}: {best['parts']} peças, {best['sheets']} folha(s), "
+              f"aproveitamento médio {best['mean_utilisation']:.1%}, {best['total_time']:.2f} s", file=sys.stderr)
+        results.append(best)
+    return results
+
+
+def compare(results, baseline):
+    """Lista as regressões dos resultados em relação à baseline.
+
+    Returns:
+        list: Um dicionário (id, metric, baseline, current) por regressão.
+    """
+    previous = {result['id']: result for result in baseline['results']}
+    regressions = []
+
+    def flag(result, metric, old, new):
+        regressions.append({'id': result['id'], 'metric': metric, 'baseline': old, 'current': new})
+
+    for result in results:
+        old = previous.get(result['id'])
+        if old is None:
+            continue
+        for stage, seconds in list(result['timings'].items()) + [('total', result['total_time'])]:
+            old_seconds = old['total_time'] if stage == 'total' else old['timings'].get(stage)
+            if old_seconds is not None and seconds > old_seconds * (1 + TIME_TOLERANCE) \
+                    and seconds - old_seconds > MIN_TIME_DIFFERENCE:
+                flag(result, f'time.{stage}', old_seconds, seconds)
+        if result['peak_memory_kb'] > old['peak_memory_kb'] * (1 + MEMORY_TOLERANCE):
+            flag(result, 'peak_memory_kb', old['peak_memory_kb'], result['peak_memory_kb'])
+        for name, count in result['counters'].items():
+            old_count = old['counters'].get(name)
+            if old_count is not None and count > old_count * (1 + COUNTER_TOLERANCE):
+                flag(result, f'counters.{name}', old_count, count)
+        for metric in ('sheets', 'unplaced'):
+            if result[metric] > old[metric]:
+                flag(result, metric, old[metric], result[metric])
+        if result['mean_utilisation'] < old['mean_utilisation'] - UTILISATION_TOLERANCE:
+            flag(result, 'mean_utilisation', old['mean_utilisation'], result['mean_utilisation'])
+    return regressions
+
+
+def environment():
+    """Versões e máquina da execução, gravadas junto com os resultados."""
+    return {'python': platform.python_version(),
+            'numpy': np.__version__,
+            'shapely': shapely.__version__,
+            'geos': shapely.geos_version_string,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S%z')}
+
+
+# Função para gravar o corpus de cada variante e escala (para reproduzir fora do benchmark)
+def write_corpus(folder, variants, scales, corpus, seed, use_cache=True, cache_dir=None):
+    from geometry_cache import save_polygons
+
+    for variant in variants:
+        module = importlib.import_module(variant)
+        base = module.load_part_polygons(corpus, use_cache, cache_dir)
+        for scale_factor in scales:
+            save_polygons(os.path.join(folder, f'{variant}_x{scale_factor}_seed{seed}.npz'),
+                          synthetic_corpus(base, scale_factor, seed))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark dos heurísticos de nesting, com saída em JSON.')
+    parser.add_argument('--corpus', default='components_svg',
+                        help='pasta com os SVGs das peças, ou o SVG do modelo inteiro')
+    parser.add_argument('--variants', nargs='+', default=list(VARIANTS), choices=VARIANTS)
+    # Por padrão mede o mesmo motor do pipeline (nest.DEFAULT_CONFIG), para a baseline ser comparável
+    parser.add_argument('--engines', nargs='+', default=[DEFAULT_CONFIG['engine']], choices=ENGINES)
+    parser.add_argument('--orderings', nargs='+', default=['fourier'])
+    parser.add_argument('--packings', nargs='+', default=['first_fit'])
+    parser.add_argument('--scales', nargs='+', type=int, default=list(DEFAULT_SCALES),
+                        help='cópias de cada peça no corpus sintético (1 = só as peças originais)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=1, help='execuções de cada caso (fica a mais rápida)')
+    parser.add_argument('--no-cache', dest='use_cache', action='store_false',
+                        help='não usa o cache em disco da geometria das peças')
+    parser.add_argument('--cache-dir')
+    parser.add_argument('--output', help='arquivo JSON dos resultados (padrão: saída padrão)')
+    parser.add_argument('--baseline', help='JSON de uma execução anterior para detectar regressões')
+    parser.add_argument('--write-corpus', metavar='FOLDER',
+                        help='grava os polígonos de cada corpus (.npz) nessa pasta e sai')
+    args = parser.parse_args(argv)
+
+    if args.write_corpus:
+        write_corpus(args.write_corpus, args.variants, args.scales, args.corpus, args.seed,
+                     args.use_cache, args.cache_dir)
+        return 0
+
+    cases = [{'variant': variant, 'engine': engine, 'ordering': ordering, 'packing': packing,
+              'scale': scale_factor, 'seed': args.seed, 'corpus': args.corpus,
+              'use_cache': args.use_cache, 'cache_dir': args.cache_dir}
+             for scale_factor in args.scales
+             for variant in args.variants
+             for engine in args.engines
+             for ordering in args.orderings
+             for packing in args.packings]
+    report = {'environment': environment(), 'results': run_cases(cases, args.repeat)}
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            report['regressions'] = compare(report['results'], json.load(baseline_file))
+        for regression in report['regressions']:
+            print(f"REGRESSÃO {regression['id']} {regression['metric']}: "
+                  f"{regression['baseline']} -> {regression['current']}", file=sys.stderr)
+
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(report, output_file, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    return 1 if report.get('regressions') else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
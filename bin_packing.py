@@ -0,0 +1,154 @@
+"""
+Empacotamento em várias folhas (bin packing) sobre a busca de posição.
+
+Em vez de tentar apenas a última folha aberta, cada peça é tentada em todas
+as folhas abertas segundo a estratégia escolhida:
+
+- 'first_fit': a primeira folha (na ordem de abertura) onde a peça encaixa;
+- 'best_fit': a folha com a menor área livre onde a peça encaixa;
+- 'first_fit_decreasing': first-fit com as peças em ordem decrescente de área.
+
+Cada folha guarda sua área livre; folhas cuja área livre é menor que a área
+da peça são descartadas sem nenhum teste geométrico. Uma folha nova só é
+aberta quando nenhuma das abertas serve, e a peça é posicionada nela pela
+mesma busca (nunca é largada sem transformação). Se `new_sheet` oferecer
+folhas de tipos diferentes (`candidates`, ver sheets.SheetInventory), os
+tipos são tentados na ordem dada até um em que a peça caiba.
+
+Se a busca também informar a transformação que aplicou à peça (a rotação
+escolhida e a translação), ela fica registrada junto com o posicionamento,
+para a exportação não precisar reconstruí-la.
+"""
+from itertools import chain
+
+import numpy as np
+
+STRATEGIES = ('first_fit', 'best_fit', 'first_fit_decreasing')
+
+
+def placement_order(ordered_pairs):
+    """Índices das peças na ordem da primeira aparição em uma lista de pares."""
+    return list(dict.fromkeys(chain.from_iterable(ordered_pairs)))
+
+
+class PackingResult:
+    """Resultado do empacotamento.
+
+    Attributes:
+        sheets (list): As folhas (SheetLayout), na ordem de abertura.
+        placements (list): Tuplas (índice da peça, índice da folha, polígono posicionado,
+            transformação); a transformação (ângulo em graus, tx, ty) leva a peça original ao
+            polígono posicionado (placed ≈ rotate(peça, ângulo, origin=(0, 0)) + (tx, ty)),
+            ou é None se a busca não a informou.
+        unplaced (list): Índices das peças que não cabem nem numa folha vazia.
+        free_areas (list): Área livre restante de cada folha.
+    """
+
+    def __init__(self):
+        self.sheets = []
+        self.placements = []
+        self.unplaced = []
+        self.free_areas = []
+
+
+def pack(polygons, order, place, new_sheet, sheet_area, strategy='first_fit', result=None):
+    """Distribui as peças pelas folhas com a estratégia escolhida.
+
+    Args:
+        polygons (list): Os polígonos das peças.
+        order (list): Índices das peças na ordem em que devem ser posicionadas.
+        place (callable): place(poly, sheets) -> (posição em `sheets`, polígono posicionado) ou None;
+            deve tentar as folhas na ordem dada e retornar a primeira que servir. Pode
+            retornar também a transformação aplicada à peça, como terceiro elemento.
+        new_sheet (callable): Cria uma folha vazia (SheetLayout); se tiver
+            `candidates(poly, sheets)`, as folhas dadas por ele são tentadas em ordem.
+        sheet_area (float): Área útil de uma folha, para a contabilidade de área livre
+            (folhas com `usable_area` usam a sua).
+        strategy (str): Uma das STRATEGIES.
+        result (PackingResult): Empacotamento a continuar (as peças entram nas folhas já
+            montadas e o resultado é atualizado no lugar); começa do zero se None.
+
+    Returns:
+        PackingResult: As folhas, as posições de cada peça e as peças que não couberam.
+    """
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Unknown packing strategy {strategy!r}; expected one of {STRATEGIES}")
+    if strategy == 'first_fit_decreasing':
+        # Um PartStore já traz as áreas numa coluna, sem montar os polígonos
+        areas = polygons.areas if hasattr(polygons, 'areas') else [poly.area for poly in polygons]
+        order = sorted(order, key=lambda index: -areas[index])
+
+    result = PackingResult() if result is None else result
+    for index in order:
+        poly = polygons[index]
+
+        # Folhas que ainda têm área livre suficiente, na ordem da estratégia
+        candidates = [i for i, free in enumerate(result.free_areas) if free >= poly.area]
+        if strategy == 'best_fit':
+            candidates.sort(key=lambda i: result.free_areas[i])
+
+        found = place(poly, [result.sheets[i] for i in candidates]) if candidates else None
+        if found is not None:
+            sheet_index = candidates[found[0]]
+            placed = found[1]
+        else:
+            # Nenhuma folha aberta serve: abre uma nova e posiciona a peça nela
+            for sheet in _new_sheets(new_sheet, poly, result.sheets):
+                found = place(poly, [sheet])
+                if found is not None:
+                    break
+            if found is None:
+                result.unplaced.append(index)
+                continue
+            result.sheets.append(sheet)
+            result.free_areas.append(getattr(sheet, 'usable_area', sheet_area))
+            sheet_index = len(result.sheets) - 1
+            placed = found[1]
+
+        result.sheets[sheet_index].append(placed)
+        result.free_areas[sheet_index] -= placed.area
+        result.placements.append((index, sheet_index, placed, found_transform(found)))
+    return result
+
+
+def found_transform(found):
+    """A transformação informada por uma busca de posição (o terceiro elemento do retorno de `place`), ou None."""
+    return found[2] if len(found) > 2 else None
+
+
+def shifted(transform, before, after):
+    """A transformação de uma peça posicionada depois de transladada de `before` para `after`.
+
+    Args:
+        transform (tuple): (ângulo, tx, ty) da peça em `before`, ou None.
+        before, after (shapely.geometry.Polygon): A peça antes e depois da translação.
+    """
+    if transform is None:
+        return None
+    angle, tx, ty = transform
+    dx, dy = np.subtract(after.bounds[:2], before.bounds[:2])
+    return angle, tx + float(dx), ty + float(dy)
+
+
+def turned(transform, angle, center):
+    """Compõe a transformação de uma peça já girada por `angle` graus em torno de `center` com a do giro.
+
+    Returns:
+        tuple: (ângulo, tx, ty) que leva a peça antes do giro à posição, ou None.
+    """
+    if transform is None:
+        return None
+    placed_angle, tx, ty = transform
+    radians = np.radians([angle, placed_angle])
+    (cos_t, cos_p), (sin_t, sin_p) = np.cos(radians), np.sin(radians)
+    cx, cy = center
+    # O giro leva p a R_t (p - c) + c; a translação dele, c - R_t c, passa pela rotação da posição
+    gx, gy = cx - (cx * cos_t - cy * sin_t), cy - (cx * sin_t + cy * cos_t)
+    return ((placed_angle + angle) % 360, float(tx + gx * cos_p - gy * sin_p), float(ty + gx * sin_p + gy * cos_p))
+
+
+# Função para listar as folhas novas a tentar para uma peça
+def _new_sheets(new_sheet, poly, sheets):
+    if hasattr(new_sheet, 'candidates'):
+        return new_sheet.candidates(poly, sheets)
+    return [new_sheet()]
@@ -0,0 +1,288 @@
+"""
+Compactação do layout depois do empacotamento.
+
+A busca de posição deixa folgas do tamanho do passo da grade (ou da
+resolução) entre as peças. Esta etapa:
+
+1. empurra cada peça para baixo (-y) e para a esquerda (-x) até encostar
+   numa peça vizinha (inflada pela folga) ou na borda da região útil. A
+   distância de contato é exata para as formas dadas: o menor deslocamento
+   ao longo da direção em que um vértice de uma forma atinge uma aresta da
+   outra. Como o buffer só aproxima a folga, a posição final é conferida com
+   a distância exata do shapely até as vizinhas (e recuada se preciso);
+2. tenta levar as peças da última folha para as folhas anteriores (com a
+   mesma busca de posição do empacotamento), maiores primeiro; se a última
+   folha esvazia ela é descartada e as duas etapas se repetem.
+
+Tudo roda dentro de um orçamento de tempo, e o resultado traz a área não
+preenchida (calculate_unfilled_area da variante) antes e depois. Folhas do
+estoque (sheets.py) usam a própria região útil: as de uma sobra irregular
+têm a moldura fora da região como mais um obstáculo.
+"""
+import time
+
+import numpy as np
+import shapely
+
+import telemetry
+from bin_packing import PackingResult, found_transform, shifted
+
+# Deslocamento mínimo considerado e recuo deixado no ponto de contato
+SLIDE_TOLERANCE = 1e-3
+CONTACT_GAP = 1e-6
+
+# Segmentos por quarto de círculo nas peças infladas pela folga
+BUFFER_QUAD_SEGS = 8
+
+
+# Função para extrair os vértices e as arestas de todos os anéis das geometrias
+def _edges(geoms):
+    rings = shapely.get_rings(shapely.get_parts(np.asarray(geoms, dtype=object)))
+    coords, ring_index = shapely.get_coordinates(rings, return_index=True)
+    same_ring = ring_index[:-1] == ring_index[1:]
+    return coords, coords[:-1][same_ring], coords[1:][same_ring]
+
+
+def ray_distance(points, starts, ends):
+    """Menor t >= 0 tal que algum ponto deslocado de (-t, 0) caia sobre alguma aresta.
+
+    Args:
+        points (numpy.ndarray): Pontos (n, 2).
+        starts (numpy.ndarray): Início das arestas (m, 2).
+        ends (numpy.ndarray): Fim das arestas (m, 2).
+
+    Returns:
+        float: A distância, ou inf se nenhum raio atingir uma aresta.
+    """
+    if len(points) == 0 or len(starts) == 0:
+        return np.inf
+    px, py = points[:, None, 0], points[:, None, 1]
+    ax, ay, bx, by = starts[:, 0], starts[:, 1], ends[:, 0], ends[:, 1]
+    dy = by - ay
+    crossing = (py >= np.minimum(ay, by)) & (py <= np.maximum(ay, by)) & (dy != 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = np.where(crossing, px - (ax + (py - ay) * (bx - ax) / dy), np.inf)
+    # Arestas horizontais na altura do ponto: o contato é no extremo mais próximo
+    flat = (dy == 0) & (py == ay)
+    t = np.minimum(t, np.where(flat, px - np.maximum(ax, bx), np.inf))
+    t = t[t >= -CONTACT_GAP]
+    return max(float(t.min()), 0.0) if t.size else np.inf
+
+
+def contact_distance(moving, obstacles, sheet_bounds, axis='x'):
+    """Quanto `moving` pode andar na direção -x (ou -y) sem invadir os obstáculos nem sair da folha.
+
+    Args:
+        moving (shapely.geometry.Polygon): A peça.
+        obstacles (list): Geometrias que a peça não pode invadir (as vizinhas já infladas pela folga).
+        sheet_bounds (tuple): (xmin, ymin, xmax, ymax) da região útil da folha.
+        axis (str): 'x' para deslizar para a esquerda, 'y' para baixo.
+
+    Returns:
+        float: O deslocamento até o contato.
+    """
+    minx, miny, maxx, maxy = moving.bounds
+    if axis == 'y':
+        # Troca os eixos: descer em y é deslizar para a esquerda em x
+        swap = lambda coords: coords[:, ::-1]
+        limit, (low, high, reach) = miny - sheet_bounds[1], (minx, maxx, maxy)
+    else:
+        swap = lambda coords: coords
+        limit, (low, high, reach) = minx - sheet_bounds[0], (miny, maxy, maxx)
+
+    # Só os obstáculos na faixa varrida pela peça podem ser atingidos
+    bounds = shapely.bounds(np.asarray(obstacles, dtype=object)).reshape(-1, 4)
+    if axis == 'y':
+        bounds = bounds[:, [1, 0, 3, 2]]
+    hit = (bounds[:, 1] <= high) & (bounds[:, 3] >= low) & (bounds[:, 0] <= reach)
+    if not hit.any():
+        return max(limit, 0.0)
+    points, starts, ends = (swap(c) for c in _edges([moving]))
+    other_points, other_starts, other_ends = (swap(c) for c in _edges([obstacles[i] for i in np.flatnonzero(hit)]))
+    mirror = np.array([-1.0, 1.0])
+    distance = min(ray_distance(points, other_starts, other_ends),
+                   # Os vértices dos obstáculos andando em +x contra as arestas da peça
+                   ray_distance(other_points * mirror, starts * mirror, ends * mirror))
+    return max(min(limit, distance), 0.0)
+
+
+# Função para conferir na geometria exata se a peça, deslocada, respeita a folga das vizinhas
+# (e continua dentro da região de uma folha irregular)
+def _clear(moved, neighbours, clearance, region=None):
+    if region is not None and not region.contains(moved):
+        return False
+    if not neighbours:
+        return True
+    neighbours = np.asarray(neighbours, dtype=object)
+    if clearance > 0:
+        return bool((shapely.distance(neighbours, moved) >= clearance).all())
+    return not shapely.intersects(neighbours, moved).any()
+
+
+# Função para empurrar as peças de uma folha para baixo e para a esquerda até encostarem
+def _compact_sheet(parts, sheet_bounds, clearance, deadline, passes, region=None):
+    # O contato é calculado contra as vizinhas infladas; o buffer aproxima os arcos por dentro,
+    # e o raio circunscrito deixa a aproximação quase sempre do lado seguro
+    radius = clearance / np.cos(np.pi / (4 * BUFFER_QUAD_SEGS))
+    inflated = [poly.buffer(radius, quad_segs=BUFFER_QUAD_SEGS) if clearance > 0 else poly for poly in parts]
+    frame = [] if region is None else [region.frame()]
+    moves = 0
+    for _ in range(passes):
+        changed = False
+        for i in sorted(range(len(parts)), key=lambda i: (parts[i].bounds[1], parts[i].bounds[0])):
+            if deadline is not None and time.monotonic() >= deadline:
+                return moves
+            others = inflated[:i] + inflated[i + 1:] + frame
+            neighbours = parts[:i] + parts[i + 1:]
+            for axis in ('y', 'x'):
+                distance = contact_distance(parts[i], others, sheet_bounds, axis) - CONTACT_GAP
+                if distance <= SLIDE_TOLERANCE:
+                    continue
+                direction = np.array([0.0, -1.0] if axis == 'y' else [-1.0, 0.0])
+                moved = shapely.transform(parts[i], lambda c: c + distance * direction)
+                # Conferência exata da folga; se a aproximação do buffer passou do ponto, recua por bisseção
+                if not _clear(moved, neighbours, clearance, region):
+                    telemetry.count('contact_refined')
+                    low, high = 0.0, distance
+                    for _ in range(30):
+                        middle = (low + high) / 2
+                        if _clear(shapely.transform(parts[i], lambda c: c + middle * direction), neighbours,
+                                  clearance, region):
+                            low = middle
+                        else:
+                            high = middle
+                    distance = low
+                    if distance <= SLIDE_TOLERANCE:
+                        continue
+                    moved = shapely.transform(parts[i], lambda c: c + distance * direction)
+                parts[i] = moved
+                inflated[i] = shapely.transform(inflated[i], lambda c: c + distance * direction)
+                moves += 1
+                changed = True
+        if not changed:
+            break
+    return moves
+
+
+# Função para obter uma folha vazia do mesmo tipo de `sheet` (folhas do estoque têm `empty`)
+def _empty_sheet(sheet, new_sheet):
+    return sheet.empty() if hasattr(sheet, 'empty') else new_sheet()
+
+
+class CompactionResult:
+    """Resultado da compactação.
+
+    Attributes:
+        packing (PackingResult): O layout compactado (mesmos índices de peça do original).
+        unfilled_before (list): Área não preenchida de cada folha antes da compactação.
+        unfilled_after (list): Área não preenchida de cada folha depois.
+        moves (int): Deslizamentos feitos.
+        relocated (int): Peças levadas da última folha para uma anterior.
+        seconds (float): Tempo gasto.
+    """
+
+    def __init__(self, packing, unfilled_before, unfilled_after, moves, relocated, seconds):
+        self.packing = packing
+        self.unfilled_before = unfilled_before
+        self.unfilled_after = unfilled_after
+        self.moves = moves
+        self.relocated = relocated
+        self.seconds = seconds
+
+    @property
+    def sheets_saved(self):
+        return len(self.unfilled_before) - len(self.unfilled_after)
+
+    def summary(self):
+        """Resumo em uma linha, para o terminal."""
+        return (f"compactação: {len(self.unfilled_before)} -> {len(self.unfilled_after)} folha(s), "
+                f"área não preenchida {sum(self.unfilled_before):.1f} -> {sum(self.unfilled_after):.1f}, "
+                f"{self.moves} deslizamento(s), {self.relocated} peça(s) realocada(s) em {self.seconds:.1f}s")
+
+
+def compact_layout(result, polygons, place, new_sheet, sheet_area, sheet_bounds, unfilled_area, clearance=0,
+                   time_budget=None, passes=8):
+    """Compacta um empacotamento e tenta eliminar as últimas folhas.
+
+    Args:
+        result (PackingResult): O empacotamento (não é alterado).
+        polygons (list): Os polígonos originais das peças (os índices de `result`).
+        place, new_sheet, sheet_area: Como em bin_packing.pack (ver packing_setup das variantes).
+        sheet_bounds (tuple): (xmin, ymin, xmax, ymax) da região útil da folha (folhas com
+            `region` usam a sua).
+        unfilled_area (callable): unfilled_area(layout) -> área não preenchida de cada folha.
+        clearance (float): Folga mínima exigida entre as peças.
+        time_budget (float): Segundos disponíveis; None para ir até não haver melhora.
+        passes (int): Máximo de passadas de deslizamento por folha.
+
+    Returns:
+        CompactionResult: O layout compactado e a comparação da área não preenchida.
+    """
+    start = time.monotonic()
+    deadline = None if time_budget is None else start + time_budget
+    expired = lambda: deadline is not None and time.monotonic() >= deadline
+
+    # Peças de cada folha: [índice da peça, polígono posicionado, transformação], na ordem dos posicionamentos
+    sheets = [[] for _ in result.sheets]
+    for index, sheet_index, placed, transform in result.placements:
+        sheets[sheet_index].append([index, placed, transform])
+    # Tipo de cada folha: a região útil (None para as folhas sem tipo) e a área útil
+    regions = [getattr(sheet, 'region', None) for sheet in result.sheets]
+    areas = [getattr(sheet, 'usable_area', sheet_area) for sheet in result.sheets]
+    unfilled_before = unfilled_area([[placed for _, placed, _ in parts] for parts in sheets])
+
+    with telemetry.span('compact', sheets=len(sheets), time_budget=time_budget) as probe:
+        moves = relocated = 0
+        while not expired():
+            # 1) Gravidade: cada folha empurrada para baixo e para a esquerda
+            for parts, region in zip(sheets, regions):
+                polys = [placed for _, placed, _ in parts]
+                bounds = sheet_bounds if region is None else region.bounds
+                irregular = None if region is None or region.rectangular else region
+                moves += _compact_sheet(polys, bounds, clearance, deadline, passes, irregular)
+                # As peças só são transladadas: a transformação acompanha o deslocamento
+                for part, poly in zip(parts, polys):
+                    part[1:] = poly, shifted(part[2], part[1], poly)
+            if expired() or len(sheets) < 2:
+                break
+
+            # 2) As peças da última folha, maiores primeiro, nas folgas das anteriores
+            layouts = []
+            for parts, sheet in zip(sheets[:-1], result.sheets):
+                layout = _empty_sheet(sheet, new_sheet)
+                for _, placed, _ in parts:
+                    layout.append(placed)
+                layouts.append(layout)
+            free = [area - sum(placed.area for _, placed, _ in parts) for parts, area in zip(sheets[:-1], areas)]
+            for part in sorted(sheets[-1], key=lambda part: -part[1].area):
+                if expired():
+                    break
+                poly = polygons[part[0]]
+                candidates = [i for i, area in enumerate(free) if area >= poly.area]
+                found = place(poly, [layouts[i] for i in candidates]) if candidates else None
+                if found is None:
+                    continue
+                target = candidates[found[0]]
+                layouts[target].append(found[1])
+                free[target] -= found[1].area
+                sheets[target].append([part[0], found[1], found_transform(found)])
+                sheets[-1].remove(part)
+                relocated += 1
+            if sheets[-1]:
+                break
+            # A última folha esvaziou: descarta e repete com a nova última folha
+            sheets.pop()
+
+        packing = PackingResult()
+        for sheet_index, (parts, sheet) in enumerate(zip(sheets, result.sheets)):
+            layout = _empty_sheet(sheet, new_sheet)
+            for index, placed, transform in parts:
+                layout.append(placed)
+                packing.placements.append((index, sheet_index, placed, transform))
+            packing.sheets.append(layout)
+            packing.free_areas.append(areas[sheet_index] - sum(placed.area for _, placed, _ in parts))
+        packing.unplaced = list(result.unplaced)
+        unfilled_after = unfilled_area([[placed for _, placed, _ in parts] for parts in sheets])
+        probe.set(sheets_after=len(sheets), moves=moves, relocated=relocated,
+                  unfilled_before=sum(unfilled_before), unfilled_after=sum(unfilled_after))
+    return CompactionResult(packing, unfilled_before, unfilled_after, moves, relocated, time.monotonic() - start)
@@ -0,0 +1,357 @@
+"""
+Exportação do layout para impressão, a partir dos caminhos originais das peças.
+
+O empacotamento trabalha com polígonos aproximados (curvas achatadas, buffer
+de segurança), mas a folha impressa deve ter as curvas e os estilos (largura
+do traço, preenchimento) de separate_comps.py. A busca registra, com cada
+posicionamento, a transformação rígida (rotação em torno da origem e
+translação) que leva o polígono original ao polígono posicionado (ver
+bin_packing.PackingResult), e essa transformação é aplicada aos caminhos SVG
+originais da peça.
+
+As folhas são gravadas uma página por vez, num SVG com as páginas empilhadas
+ou num PDF de várias páginas (matplotlib, carregado só aqui): o conteúdo de
+uma página é montado, escrito no arquivo e descartado antes da próxima, então
+a memória usada não cresce com o número de folhas.
+"""
+import os
+import re
+from xml.sax.saxutils import escape, quoteattr
+
+import numpy as np
+import shapely
+import svgpathtools
+
+from separate_comps import SegmentArray, iter_components
+
+# Espaço entre as páginas empilhadas no SVG, em milímetros
+PAGE_GAP = 10
+
+# Atributos de apresentação dos caminhos originais que vão para a exportação
+PRESENTATION_ATTRIBUTES = ('style', 'class', 'fill', 'fill-opacity', 'fill-rule', 'stroke', 'stroke-width',
+                           'stroke-opacity', 'stroke-linecap', 'stroke-linejoin', 'stroke-dasharray', 'opacity')
+
+
+class PartArtwork:
+    """Os caminhos originais de uma peça, com os atributos de apresentação.
+
+    Attributes:
+        paths (list): SegmentArray de cada caminho, nas unidades do SVG da peça.
+        attributes (list): Atributos de apresentação de cada caminho.
+        scale (float): Unidades do SVG por unidade do layout (o scaling_factor da variante).
+    """
+
+    def __init__(self, paths, attributes, scale):
+        self.paths = paths
+        self.attributes = attributes
+        self.scale = scale
+
+
+def split_artwork(paths, attributes, polygons, scale):
+    """Distribui os caminhos de um SVG entre os polígonos que vieram dele.
+
+    Cada subcaminho vai para o polígono mais próximo do seu ponto inicial (o
+    que o contém, ou em cuja borda ele está); assim as ilhas dentro de um furo
+    e os cortes internos ficam com a peça certa.
+
+    Args:
+        paths (list): SegmentArray dos caminhos do SVG.
+        attributes (list): Atributos de cada caminho.
+        polygons (list): Os polígonos do SVG, já escalonados (coordenadas do SVG / scale).
+        scale (float): Unidades do SVG por unidade dos polígonos.
+
+    Returns:
+        list: Um PartArtwork por polígono, na mesma ordem.
+    """
+    parts = [PartArtwork([], [], scale) for _ in polygons]
+    if not polygons:
+        return parts
+    targets = np.asarray(polygons, dtype=object)
+    for path, attribute in zip(paths, attributes):
+        attribute = {key: value for key, value in attribute.items() if key in PRESENTATION_ATTRIBUTES}
+        subpaths = path.subpaths()
+        starts = np.array([subpath.start for subpath in subpaths]) / scale
+        points = shapely.points(starts.real, starts.imag)
+        owners = shapely.distance(points[:, None], targets[None, :]).argmin(axis=1)
+        for owner in np.unique(owners).tolist():
+            selected = [subpath for subpath, k in zip(subpaths, owners) if k == owner]
+            parts[owner].paths.append(SegmentArray(np.concatenate([s.points for s in selected]),
+                                                   np.concatenate([s.degree for s in selected])))
+            parts[owner].attributes.append(attribute)
+    return parts
+
+
+def load_artwork(source, module, scaling_factor):
+    """Caminhos originais de cada peça de uma fonte, na ordem de module.load_part_polygons.
+
+    Args:
+        source (str): Pasta com os SVGs das peças, ou o SVG do modelo inteiro.
+        module (module): A variante (heuristic_dtw1 ou heuristic_dtw2) usada na carga das peças.
+        scaling_factor (float): A escala usada na carga das peças.
+
+    Returns:
+        list: Um PartArtwork por peça.
+    """
+    tolerance = module.flatten_tolerance * scaling_factor
+    artwork = []
+    if os.path.isfile(source):
+        for component in iter_components(source):
+            polygons = [module.scale_polygon_to_inches(poly, scaling_factor)
+                        for poly in module.get_polygons_from_component(component, tolerance)]
+            artwork += split_artwork(component.paths, component.attributes, polygons, scaling_factor)
+        return artwork
+    for name in sorted(os.listdir(source)):
+        if not name.lower().endswith('.svg'):
+            continue
+        svg_filepath = os.path.join(source, name)
+        paths, attributes = svgpathtools.svg2paths(svg_filepath)
+        polygons = [module.scale_polygon_to_inches(poly, scaling_factor)
+                    for poly in module.get_polygons_from_svg(svg_filepath, tolerance)]
+        artwork += split_artwork([SegmentArray.from_path(path) for path in paths], attributes,
+                                 polygons, scaling_factor)
+    return artwork
+
+
+def placement_transform(original, placed, angles=None, prepare=None, step=1.0, iterations=30):
+    """Transformação rígida que leva `original` (aproximadamente) a `placed`.
+
+    A busca posicionou uma versão corrigida (buffer/simplify) e rotacionada da
+    peça, então a transformação é estimada: os centróides dão a translação e o
+    ângulo é o de menor distância de Hausdorff entre os contornos. Se o
+    conjunto de rotações da busca for conhecido (`angles`), o ângulo é escolhido
+    entre eles; senão, numa varredura em passos de `step` graus refinada por
+    seção áurea.
+
+    Args:
+        original (shapely.geometry.Polygon): A peça como foi carregada.
+        placed (shapely.geometry.Polygon): A peça posicionada.
+        angles (array): Rotações possíveis da busca, em graus (ver rotation_set).
+        prepare (callable): A preparação que a busca aplica à peça antes de girá-la
+            (buffer de segurança, simplificação), para comparar formas equivalentes.
+
+    Returns:
+        tuple: (ângulo em graus, tx, ty), com placed ≈ rotate(original, ângulo, origin=(0, 0)) + (tx, ty).
+    """
+    if prepare is not None:
+        original = prepare(original)
+    # A busca posiciona as peças inválidas já corrigidas; o registro compara com a mesma correção
+    if not original.is_valid:
+        original = max(shapely.get_parts(original.buffer(0)), key=lambda part: part.area)
+    if not placed.is_valid:
+        placed = max(shapely.get_parts(placed.buffer(0)), key=lambda part: part.area)
+    center = np.asarray(original.centroid.coords[0])
+    target = np.asarray(placed.centroid.coords[0])
+    local = np.asarray(original.exterior.coords) - center
+
+    def errors(angles):
+        radians = np.radians(np.atleast_1d(angles))[:, None]
+        cos, sin = np.cos(radians), np.sin(radians)
+        x = local[:, 0] * cos - local[:, 1] * sin + target[0]
+        y = local[:, 0] * sin + local[:, 1] * cos + target[1]
+        return shapely.hausdorff_distance(shapely.linearrings(np.stack([x, y], axis=-1)), placed.exterior)
+
+    if angles is not None:
+        angles = np.asarray(angles, dtype=float)
+        angle = angles[np.argmin(errors(angles))] % 360
+    else:
+        angles = np.arange(0, 360, step)
+        best = angles[np.argmin(errors(angles))]
+        low, high = best - step, best + step
+        ratio = (np.sqrt(5) - 1) / 2
+        for _ in range(iterations):
+            a, b = high - ratio * (high - low), low + ratio * (high - low)
+            error_a, error_b = errors([a, b])
+            if error_a < error_b:
+                high = b
+            else:
+                low = a
+        angle = ((low + high) / 2) % 360
+    radians = np.radians(angle)
+    cos, sin = np.cos(radians), np.sin(radians)
+    tx = target[0] - (center[0] * cos - center[1] * sin)
+    ty = target[1] - (center[0] * sin + center[1] * cos)
+    return float(angle), float(tx), float(ty)
+
+
+def rotation_set(angle_increment, n_turns=None):
+    """Ângulos que a busca pode aplicar a uma peça: as rotações de find_position,
+    compostas com os giros do otimizador (n_turns), se ele foi usado."""
+    angles = np.arange(0, 360, angle_increment)
+    if n_turns:
+        angles = (angles[None, :] + np.arange(n_turns)[:, None] * 360 / n_turns).ravel() % 360
+    return np.unique(angles)
+
+
+def placement_transforms(polygons, result, angles=None, prepare=None):
+    """Transformação de cada peça posicionada, na ordem de result.placements.
+
+    Vale a transformação registrada pela busca junto com o posicionamento; só as
+    peças sem registro têm a transformação estimada (ver placement_transform).
+    """
+    return [placement_transform(polygons[index], placed, angles, prepare) if transform is None else transform
+            for index, _, placed, transform in result.placements]
+
+
+def _matrix(transform, scale):
+    # Matriz SVG (a, b, c, d, e, f) que leva as coordenadas do SVG da peça ao layout
+    angle, tx, ty = transform
+    cos, sin = np.cos(np.radians(angle)) / scale, np.sin(np.radians(angle)) / scale
+    return cos, sin, -sin, cos, tx, ty
+
+
+def _pages(result, artwork, transforms):
+    # Gera, folha a folha, as peças (PartArtwork, matriz SVG) de cada página
+    by_sheet = [[] for _ in result.sheets]
+    for k, (_, sheet_index, _, _) in enumerate(result.placements):
+        by_sheet[sheet_index].append(k)
+    for placements in by_sheet:
+        yield [(artwork[result.placements[k][0]], _matrix(transforms[k], artwork[result.placements[k][0]].scale))
+               for k in placements]
+
+
+# Função para obter o tamanho de cada página: o mesmo para todas, ou um por página (folhas de tipos diferentes)
+def _page_sizes(sheet_size, n_pages):
+    if np.ndim(sheet_size) == 1:
+        return [tuple(sheet_size)] * n_pages
+    return [tuple(size) for size in sheet_size]
+
+
+def write_svg_pages(path, pages, sheet_size, n_pages, gap=PAGE_GAP):
+    """Grava as páginas num SVG, empilhadas verticalmente, escrevendo uma página por vez.
+
+    Args:
+        path (str): Arquivo de saída.
+        pages (iterable): Para cada página, a lista de (PartArtwork, matriz SVG).
+        sheet_size (tuple | list): (largura, altura) da folha em milímetros, ou a lista com o
+            tamanho de cada página.
+        n_pages (int): Quantidade de páginas (o tamanho do documento vai no cabeçalho).
+        gap (float): Espaço entre as páginas, em milímetros.
+    """
+    sizes = _page_sizes(sheet_size, n_pages)[:n_pages]
+    # Posição de cada página na pilha
+    offsets = [0.0]
+    for _, height in sizes:
+        offsets.append(offsets[-1] + height + gap)
+    width = max((width for width, _ in sizes), default=0)
+    total_height = offsets[-1] - gap if sizes else 0
+    with open(path, 'w', encoding='utf-8') as svg_file:
+        svg_file.write('<?xml version="1.0" encoding="utf-8" ?>\n'
+                       f'<svg xmlns="http://www.w3.org/2000/svg" version="1.1" width="{width}mm" '
+                       f'height="{total_height}mm" viewBox="0 0 {width} {total_height}">\n')
+        for page_index, page in enumerate(pages):
+            offset = offsets[page_index]
+            width, height = sizes[page_index]
+            svg_file.write(f'  <g id="sheet{page_index + 1:02d}" transform="translate(0,{offset})">\n'
+                           f'    <rect x="0" y="0" width="{width}" height="{height}" '
+                           'fill="white" stroke="#cccccc" stroke-width="0.2"/>\n')
+            for artwork, matrix in page:
+                svg_file.write(f'    <g transform="matrix({",".join(f"{v:.10g}" for v in matrix)})">\n')
+                for segments, attribute in zip(artwork.paths, artwork.attributes):
+                    attributes = ''.join(f' {key}={quoteattr(value)}' for key, value in attribute.items())
+                    svg_file.write(f'      <path d="{escape(segments.d())}"{attributes}/>\n')
+                svg_file.write('    </g>\n')
+            svg_file.write('  </g>\n')
+        svg_file.write('</svg>\n')
+
+
+def _style(attribute):
+    # Estilo efetivo de um caminho: atributos de apresentação com o `style` por cima
+    style = {key: value for key, value in attribute.items() if key != 'style'}
+    for declaration in attribute.get('style', '').split(';'):
+        if ':' in declaration:
+            key, value = declaration.split(':', 1)
+            style[key.strip()] = value.strip()
+    return style
+
+
+def _color(value, opacity):
+    if value is None or value == 'none' or value.startswith('url('):
+        return 'none'
+    from matplotlib.colors import to_rgba
+
+    try:
+        return to_rgba(value, opacity)
+    except ValueError:
+        return to_rgba('black', opacity)
+
+
+def _number(value, default):
+    match = re.match(r'\s*([-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)', value or '')
+    return float(match.group(1)) if match else default
+
+
+def _mpl_path(segments):
+    # Caminho do matplotlib com as mesmas curvas (segmentos de Bézier) do SegmentArray
+    from matplotlib.path import Path
+
+    vertices, codes, current = [], [], None
+    for row, degree in zip(segments.points.tolist(), segments.degree.tolist()):
+        if row[0] != current:
+            vertices.append(row[0])
+            codes.append(Path.MOVETO)
+        vertices.extend(row[1:degree + 1])
+        codes.extend([(Path.LINETO, Path.CURVE3, Path.CURVE4)[degree - 1]] * degree)
+        current = row[degree]
+    vertices = np.array(vertices, dtype=complex)
+    return Path(np.column_stack([vertices.real, vertices.imag]), codes)
+
+
+def write_pdf_pages(path, pages, sheet_size):
+    """Grava as páginas num PDF de várias páginas; cada página é descartada depois de escrita.
+
+    Args:
+        path (str): Arquivo de saída.
+        pages (iterable): Para cada página, a lista de (PartArtwork, matriz SVG).
+        sheet_size (tuple | list): (largura, altura) da folha em milímetros, ou a lista com o
+            tamanho de cada página.
+    """
+    from matplotlib.backends.backend_pdf import PdfPages
+    from matplotlib.figure import Figure
+    from matplotlib.patches import PathPatch
+    from matplotlib.transforms import Affine2D
+
+    points_per_mm = 72 / 25.4
+    with PdfPages(path) as pdf:
+        for page_index, page in enumerate(pages):
+            width, height = sheet_size if np.ndim(sheet_size) == 1 else sheet_size[page_index]
+            # Figure sem pyplot: nenhuma janela é criada e a figura é liberada com a página
+            figure = Figure(figsize=(width / 25.4, height / 25.4))
+            axes = figure.add_axes((0, 0, 1, 1))
+            axes.set_xlim(0, width)
+            axes.set_ylim(height, 0)
+            axes.set_axis_off()
+            for artwork, (a, b, c, d, e, f) in page:
+                transform = Affine2D(np.array([[a, c, e], [b, d, f], [0, 0, 1]]))
+                for segments, attribute in zip(artwork.paths, artwork.attributes):
+                    style = _style(attribute)
+                    opacity = _number(style.get('opacity'), 1)
+                    patch = PathPatch(
+                        transform.transform_path(_mpl_path(segments)),
+                        facecolor=_color(style.get('fill', 'black'), opacity * _number(style.get('fill-opacity'), 1)),
+                        edgecolor=_color(style.get('stroke'), opacity * _number(style.get('stroke-opacity'), 1)),
+                        linewidth=_number(style.get('stroke-width'), 1) / artwork.scale * points_per_mm,
+                        capstyle={'round': 'round', 'square': 'projecting'}.get(style.get('stroke-linecap'), 'butt'),
+                        joinstyle={'round': 'round', 'bevel': 'bevel'}.get(style.get('stroke-linejoin'), 'miter'))
+                    axes.add_patch(patch)
+            pdf.savefig(figure)
+
+
+def export_layout(path, result, artwork, transforms, sheet_size):
+    """Grava o layout (uma página por folha) em SVG ou PDF, conforme a extensão de `path`.
+
+    Args:
+        path (str): Arquivo de saída (.svg ou .pdf).
+        result (PackingResult): O empacotamento.
+        artwork (list): PartArtwork de cada peça (ver load_artwork).
+        transforms (list): Transformação de cada posicionamento (ver placement_transforms).
+        sheet_size (tuple | list): (largura, altura) da folha em milímetros, ou a lista com o
+            tamanho de cada folha (folhas de tipos diferentes, ver sheets.py).
+    """
+    pages = _pages(result, artwork, transforms)
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.svg':
+        write_svg_pages(path, pages, sheet_size, len(result.sheets))
+    elif extension == '.pdf':
+        write_pdf_pages(path, pages, sheet_size)
+    else:
+        raise ValueError(f"Unsupported export format {extension!r}; expected '.svg' or '.pdf'")
@@ -0,0 +1,135 @@
+"""
+Aproximação poligonal dos contornos das peças com erro controlado.
+
+Antes só o ponto inicial de cada segmento era usado, e as curvas (Bézier e
+arcos) viravam cordas. Aqui cada curva é subdividida uniformemente com o
+número de pedaços necessário para que a distância entre a curva e a corda
+fique abaixo da tolerância (limite pela segunda derivada da Bézier), para
+todos os segmentos de um caminho de uma vez. Em seguida o contorno passa
+por Douglas-Peucker (shapely.simplify) para remover os vértices que não são
+necessários para a mesma precisão, o que reduz o custo da busca de posição
+e dos testes de colisão.
+
+A tolerância total é dividida entre as duas etapas, então o contorno final
+nunca se afasta da curva original mais que `tolerance`.
+
+assemble_polygons monta as peças a partir dos contornos de um SVG: contornos
+fechados dentro de outros viram furos (pela paridade da profundidade de
+aninhamento, com os testes de contenção numa STRtree) e linhas abertas
+dentro de uma peça (cortes e dobras internos) deixam de ser peças separadas.
+"""
+import numpy as np
+import shapely
+from shapely.geometry import Polygon
+from shapely.strtree import STRtree
+
+from separate_comps import as_cubic
+
+# Fração da tolerância usada na subdivisão das curvas; o resto fica para a simplificação
+FLATTEN_SHARE = 0.25
+
+
+def segment_divisions(cubic, tolerance):
+    """Quantidade de pedaços de cada Bézier cúbica para um erro de corda <= tolerance.
+
+    Para uma subdivisão uniforme em n pedaços o erro é no máximo M / (8 n²),
+    onde M = 6 max(|p0 - 2 p1 + p2|, |p1 - 2 p2 + p3|) limita a segunda derivada.
+    Segmentos retos (M = 0) ficam com um pedaço só.
+    """
+    second = 6 * np.maximum(np.abs(cubic[:, 0] - 2 * cubic[:, 1] + cubic[:, 2]),
+                            np.abs(cubic[:, 1] - 2 * cubic[:, 2] + cubic[:, 3]))
+    return np.maximum(1, np.ceil(np.sqrt(second / (8 * tolerance)))).astype(int)
+
+
+def flatten_segments(points, degree, tolerance):
+    """Pontos do contorno aproximado de um caminho, com erro de corda <= tolerance.
+
+    Args:
+        points (numpy.ndarray): Pontos de controle (n, 4) dos segmentos (como em SegmentArray).
+        degree (numpy.ndarray): Grau de cada segmento.
+        tolerance (float): Erro máximo entre a curva e as cordas, nas unidades do caminho.
+
+    Returns:
+        numpy.ndarray: Array (m, 2) com o início de cada corda, na ordem do caminho.
+    """
+    if len(points) == 0:
+        return np.empty((0, 2))
+    cubic = as_cubic(points, degree)
+    divisions = segment_divisions(cubic, tolerance)
+
+    # Parâmetros t = k / n de todos os segmentos num único array
+    segment = np.repeat(np.arange(len(cubic)), divisions)
+    first = np.repeat(np.cumsum(divisions) - divisions, divisions)
+    t = (np.arange(len(segment)) - first) / divisions[segment]
+    s = 1 - t
+    p = cubic[segment]
+    z = s ** 3 * p[:, 0] + 3 * s ** 2 * t * p[:, 1] + 3 * s * t ** 2 * p[:, 2] + t ** 3 * p[:, 3]
+    return np.column_stack([z.real, z.imag])
+
+
+def flattened_polygon(path, tolerance, share=FLATTEN_SHARE):
+    """Polígono de um caminho (SegmentArray), a no máximo `tolerance` da curva original.
+
+    Returns:
+        shapely.geometry.Polygon: O polígono, ou None se o caminho tiver menos de 3 pontos distintos.
+    """
+    vertices = flatten_segments(path.points, path.degree, tolerance * share)
+    if len(np.unique(vertices, axis=0)) < 3:
+        return None
+    polygon = Polygon(vertices)
+    simplified = polygon.simplify(tolerance * (1 - share), preserve_topology=True)
+    # Mantém o contorno original se a simplificação degenerar o polígono
+    return simplified if not simplified.is_empty and simplified.area > 0 else polygon
+
+
+def assemble_polygons(paths, tolerance, share=FLATTEN_SHARE):
+    """Monta os polígonos (com furos) de uma peça a partir dos seus caminhos.
+
+    Cada subcaminho contínuo vira um contorno. Um contorno fechado contido em
+    outros é um furo do menor deles se estiver a uma profundidade ímpar, ou
+    uma nova peça (uma ilha dentro do furo) se estiver a uma profundidade par.
+    Contornos abertos contidos em uma peça são descartados; os demais são
+    fechados por uma corda, como antes.
+
+    Args:
+        paths (list): Caminhos (SegmentArray) do SVG da peça.
+        tolerance (float): Erro máximo dos contornos, nas unidades do SVG; também é a
+            distância máxima entre o início e o fim de um contorno considerado fechado.
+
+    Returns:
+        list: Os polígonos, na ordem dos seus contornos externos no SVG.
+    """
+    closed, open_ = [], []  # (posição do contorno no SVG, polígono)
+    subpaths = (subpath for path in paths for subpath in path.subpaths())
+    for position, subpath in enumerate(subpaths):
+        polygon = flattened_polygon(subpath, tolerance, share)
+        if polygon is not None:
+            (closed if abs(subpath.end - subpath.start) <= tolerance else open_).append((position, polygon))
+    if not closed:
+        return [polygon for _, polygon in open_]
+
+    # Contenção pelo primeiro vértice de cada contorno (contornos aninhados não se cruzam)
+    rings = [polygon for _, polygon in closed]
+    areas = shapely.area(rings)
+    tree = STRtree(rings)
+    first = shapely.points([polygon.exterior.coords[0] for polygon in rings])
+    inner, outer = tree.query(first, predicate='within')
+    nested = (inner != outer) & (areas[outer] > areas[inner])
+    inner, outer = inner[nested], outer[nested]
+    depth = np.bincount(inner, minlength=len(rings))
+
+    # O contêiner imediato é o de menor área entre os que contêm o contorno
+    parent = np.full(len(rings), -1)
+    for i, j in sorted(zip(inner.tolist(), outer.tolist()), key=lambda pair: -areas[pair[1]]):
+        parent[i] = j
+    holes = {i: [] for i in np.flatnonzero(depth % 2 == 0).tolist()}
+    for i in np.flatnonzero(depth % 2 == 1).tolist():
+        holes[parent[i]].append(rings[i].exterior)
+    polygons = [(closed[i][0], Polygon(rings[i].exterior, holes[i]) if holes[i] else rings[i]) for i in holes]
+
+    # Linhas abertas dentro de uma peça são cortes internos, não peças
+    if open_:
+        first = shapely.points([polygon.exterior.coords[0] for _, polygon in open_])
+        inside = set(tree.query(first, predicate='within')[0].tolist())
+        polygons += [item for k, item in enumerate(open_) if k not in inside]
+    return [polygon for _, polygon in sorted(polygons, key=lambda item: item[0])]
@@ -0,0 +1,115 @@
+"""
+Cache em disco da geometria já extraída dos SVGs das peças.
+
+A chave é o hash SHA-256 do conteúdo do SVG junto com a identificação do
+carregador (escala, versão do formato), então qualquer alteração no arquivo
+gera uma entrada nova automaticamente. Os vértices ficam num .npz compacto
+(coordenadas contíguas + offsets, no formato ragged do shapely), e uma nova
+execução reconstrói os polígonos sem analisar o XML nem os caminhos SVG.
+"""
+import hashlib
+import os
+import tempfile
+
+import numpy as np
+import shapely
+
+import telemetry
+
+# Versão do formato do cache; incrementar quando o conteúdo armazenado mudar
+CACHE_VERSION = 1
+
+DEFAULT_CACHE_DIR = os.environ.get(
+    'PAPERMODEL_NEST_CACHE',
+    os.path.join(os.path.expanduser('~'), '.cache', 'papermodel_nest2d'))
+
+
+def cache_key(svg_filepath, loader_key=''):
+    """Hash do conteúdo do SVG combinado com a identificação do carregador."""
+    digest = hashlib.sha256()
+    digest.update(f"v{CACHE_VERSION}:{loader_key}:".encode())
+    with open(svg_filepath, 'rb') as svg_file:
+        for block in iter(lambda: svg_file.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def ragged_columns(polygons):
+    """Colunas (geom_type, coords, offsets) dos polígonos; geom_type -1 se não houver nenhum."""
+    if len(polygons) == 0:
+        return -1, np.empty((0, 2)), ()
+    geom_type, coords, offsets = shapely.to_ragged_array(polygons)
+    return int(geom_type), coords, offsets
+
+
+def save_polygons(path, polygons):
+    """Grava os polígonos em `path` (.npz) de forma atômica."""
+    geom_type, coords, offsets = ragged_columns(polygons)
+    arrays = {'geom_type': np.array(geom_type), 'coords': coords}
+    arrays.update({f'offsets_{i}': offset for i, offset in enumerate(offsets)})
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.npz')
+    try:
+        with os.fdopen(fd, 'wb') as tmp_file:
+            np.savez(tmp_file, **arrays)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def load_columns(path):
+    """Lê as colunas (geom_type, coords, offsets) gravadas por save_polygons, sem montar os polígonos."""
+    with np.load(path) as data:
+        offsets = tuple(data[f'offsets_{i}'] for i in range(len(data.files) - 2))
+        return int(data['geom_type']), data['coords'], offsets
+
+
+def load_polygons(path):
+    """Lê os polígonos gravados por save_polygons."""
+    geom_type, coords, offsets = load_columns(path)
+    if geom_type < 0:
+        return []
+    return list(shapely.from_ragged_array(shapely.GeometryType(geom_type), coords, offsets))
+
+
+def _cached(svg_filepath, loader, loader_key, cache_dir, read, convert):
+    cache_dir = DEFAULT_CACHE_DIR if cache_dir is None else cache_dir
+    path = os.path.join(cache_dir, cache_key(svg_filepath, loader_key) + '.npz')
+    if os.path.exists(path):
+        try:
+            entry = read(path)
+            telemetry.count('cache_hits')
+            return entry
+        except (OSError, ValueError, KeyError):
+            pass  # entrada corrompida: recalcula e sobrescreve
+    telemetry.count('cache_misses')
+    polygons = loader(svg_filepath)
+    save_polygons(path, polygons)
+    return convert(polygons)
+
+
+def cached_polygons(svg_filepath, loader, loader_key='', cache_dir=None):
+    """Carrega os polígonos de um SVG usando o cache em disco quando possível.
+
+    Args:
+        svg_filepath (str): Caminho do SVG da peça.
+        loader (callable): Função svg_filepath -> lista de polígonos, chamada só em cache miss.
+        loader_key (str): Identifica o carregador e seus parâmetros (por exemplo a escala);
+            carregadores diferentes nunca compartilham entradas.
+        cache_dir (str): Pasta do cache; usa DEFAULT_CACHE_DIR se None.
+
+    Returns:
+        list: Os polígonos do SVG.
+    """
+    return _cached(svg_filepath, loader, loader_key, cache_dir, load_polygons, list)
+
+
+def cached_columns(svg_filepath, loader, loader_key='', cache_dir=None):
+    """Como cached_polygons, mas devolve as colunas do .npz (geom_type, coords, offsets).
+
+    Num cache hit os polígonos não são montados; as colunas vão direto para um
+    PartStore (ver part_store.PartStore.from_columns).
+    """
+    return _cached(svg_filepath, loader, loader_key, cache_dir, load_columns, ragged_columns)
@@ -5,13 +5,42 @@ from shapely.affinity import translate, scale, rotate
 from fastdtw import fastdtw
 from scipy.spatial.distance import euclidean
 import numpy as np
-import matplotlib.pyplot as plt
 import os
+from functools import partial
 from itertools import chain
+from nfp import find_position_nfp
+from raster_placement import RASTER_RESOLUTION, find_position_raster
+from batch_placement import first_fit_batch
+from ordering import order_pieces
+from similarity import CondensedMatrix, cover_pairs
+from geometry_cache import cached_polygons, cached_columns
+from part_store import PartStore
+from parallel_search import ParallelPlacer
+from bin_packing import pack, placement_order
+from optimizer import optimize_packing
+from compaction import compact_layout
+from separate_comps import iter_components, SegmentArray
+from flatten import assemble_polygons
+from spatial_index import SheetLayout, as_sheet_layout
+from sheets import SheetInventory, unfilled_area
+from rotation_cache import default_cache as rotation_cache
+import telemetry
 
 # Função para ler o SVG e extrair os contornos dos polígonos
-def get_polygons_from_svg(svg_filepath):
+def get_polygons_from_svg(svg_filepath, tolerance=None):
+    """Lê os caminhos de um SVG como polígonos.
+
+    Args:
+        svg_filepath (str): Caminho do arquivo SVG.
+        tolerance (float): Erro máximo do contorno em relação às curvas, em unidades do SVG.
+            Se None, usa só o ponto inicial de cada segmento (curvas viram cordas) e
+            cada caminho vira um polígono sem furos.
+    """
     paths, attributes = svgpathtools.svg2paths(svg_filepath)
+    if tolerance is not None:
+        # Contornos internos viram furos das peças (ver flatten.assemble_polygons)
+        return assemble_polygons([SegmentArray.from_path(path) for path in paths], tolerance)
+
     polygons = []
     for path in paths:
         # Extrai os pontos do caminho
@@ -22,6 +51,20 @@ def get_polygons_from_svg(svg_filepath):
             polygons.append(Polygon(points))
     return polygons
 
+# Função para extrair os polígonos de um componente já separado (sem passar por arquivos SVG)
+def get_polygons_from_component(component, tolerance=None):
+    if tolerance is not None:
+        return assemble_polygons(component.paths, tolerance)
+
+    polygons = []
+    for vertices in component.vertices:
+        points = [tuple(point) for point in vertices.tolist()]
+
+        # Verifica se há pelo menos 3 pontos distintos
+        if len(set(points)) >= 3:
+            polygons.append(Polygon(points + points[:1]))
+    return polygons
+
 # Função para converter um contorno de polígono em série temporal
 def polygon_to_temporal_series(polygon):
     if not isinstance(polygon, Polygon):
@@ -37,12 +80,16 @@ def compare_contours_with_dtw(contour1, contour2):
 
 # Desenhar os polígonos usando Matplotlib
 def plot_polygons(polygons):
+    import matplotlib.pyplot as plt
+
     for polygon in polygons:
         x, y = polygon.exterior.coords.xy
         plt.plot(x, y)
 
 # Desenhar correspondências de DTW entre os contornos de dois polígonos
 def plot_dtw_matching(contour1, contour2, path):
+    import matplotlib.pyplot as plt
+
     # Desenhar a primeira forma
     x1, y1 = zip(*contour1)
     plt.plot(x1, y1, 'r')
@@ -58,67 +105,167 @@ def plot_dtw_matching(contour1, contour2, path):
 
 # Variáveis globais com as dimensões de uma folha A4 em milímetros e a distância mínima
 a4_width, a4_height, min_distance = 210, 297, 5
+flatten_tolerance = 0.1  # Erro máximo (em mm) do contorno das peças em relação às curvas do SVG
 
 # Funções get_polygons_from_svg e polygon_to_temporal_series já fornecidas em app2.py
 
 # Função para ordenar as peças baseando-se na distância DTW
 def order_pieces_by_dtw(polygons, temporal_series):
-    dtw_results = {}
+    # Distâncias na matriz condensada (float32, só o triângulo superior)
+    dtw_results = CondensedMatrix(len(temporal_series))
     for i, ts1 in enumerate(temporal_series):
         for j, ts2 in enumerate(temporal_series[i+1:], i+1):
             distance, _ = fastdtw(ts1, ts2, dist=euclidean)
-            dtw_results[(i, j)] = distance
-    # Ordena os pares de polígonos pela distância DTW crescente (menor distância primeiro)
-    ordered_pairs = sorted(dtw_results, key=dtw_results.get)
+            dtw_results[i, j] = distance
+    # Pares em ordem crescente de distância (heap), até todas as peças aparecerem
+    ordered_pairs = cover_pairs(dtw_results.ordered_pairs(), len(temporal_series))
     return ordered_pairs
 
+# Função para gerar o polígono simplificado em cada rotação testada
+def candidate_rotations(poly, angle_increment=75):
+    with telemetry.span('rotate', angle_increment=angle_increment) as probe:
+        # Simplifica o polígono para evitar problemas de validade
+        poly = poly.simplify(tolerance=0.1)
+
+        rotations = []
+        for angle in np.arange(0, 360, angle_increment):
+            rotated_poly = rotate(poly, angle, origin='centroid')
+
+            # Corrige o polígono se não for válido após rotação
+            if not rotated_poly.is_valid:
+                probe.count('repairs')
+                rotated_poly = rotated_poly.buffer(0).simplify(tolerance=0.1)
+            rotations.append(rotated_poly)
+        probe.count('rotations', len(rotations))
+    return rotations
+
 # Função para encontrar a posição de encaixe no layout atual
-def find_position(poly, current_layout, a4_width, a4_height, min_distance, angle_increment=75, translation_increment=2, line_thickness=0.85):
+def find_position(poly, current_layout, a4_width, a4_height, min_distance, angle_increment=75, translation_increment=2, line_thickness=0.85, engine='nfp', placer=None, raster_resolution=RASTER_RESOLUTION, region=None):
     """Encontra uma posição na folha A4 onde o polígono pode ser colocado,
     mantendo uma distância mínima entre as outras peças.
 
     Args:
         poly (shapely.geometry.Polygon): O polígono a ser colocado.
-        current_layout (list): Lista atual das peças já empacotadas.
+        current_layout (list | SheetLayout): Lista atual das peças já empacotadas.
         a4_width (float): A largura da folha A4.
         a4_height (float): A altura da folha A4.
-        min_distance (float): A distância mínima entre as peças.
+        min_distance (float): A margem mínima entre as peças e a borda da folha.
+        engine (str): 'nfp' usa os no-fit polygons (posição exata);
+            'grid' usa a varredura em grade com passo translation_increment;
+            'batch' faz a mesma varredura testando cada rotação em lote;
+            'raster' procura em imagens da folha e da peça (ver raster_placement.py).
+        placer (ParallelPlacer): Se dado, as rotações são avaliadas em paralelo no pool de processos.
+        raster_resolution (float): Tamanho das células do motor 'raster', em mm.
+        region (sheets.SheetRegion): Região útil de uma folha do estoque (já sem a margem);
+            substitui a folha a4_width x a4_height.
 
     Returns:
         shapely.geometry.Polygon: O polígono transladado, ou None se não for encontrado encaixe.
     """
-    # Cria um bounding box para a folha A4
-    sheet_box = box(0, 0, a4_width, a4_height)
-    
-    # Simplifica o polígono para evitar problemas de validade
-    poly = poly.simplify(tolerance=0.1)
-
-    for angle in np.arange(0, 360, angle_increment):
-        rotated_poly = rotate(poly, angle, origin='centroid')
-
-        # Corrige o polígono se não for válido após rotação
-        if not rotated_poly.is_valid:
-            rotated_poly = rotated_poly.buffer(0).simplify(tolerance=0.1)
-
-        for y in np.arange(min_distance, a4_height - rotated_poly.bounds[3] - min_distance, translation_increment):
-            for x in np.arange(min_distance, a4_width - rotated_poly.bounds[2] - min_distance, translation_increment):
-                translated_poly = translate(rotated_poly, xoff=x, yoff=y)
-
-                if not translated_poly.is_valid or not translated_poly.within(sheet_box):
-                    continue
-
-                # Incrementar os polígonos com a distância mínima para conferir colisão
-                inflated_poly = translated_poly.buffer(line_thickness)
-
-                # Verifica colisões
-                collision = any(inflated_poly.intersects(other) for other in current_layout)
-                if not collision:
-                    return translated_poly
+    with telemetry.span('find_position', engine=engine, sheet_parts=len(current_layout)):
+        # Cria um bounding box para a folha A4 (ou usa a região da folha do estoque)
+        if region is None:
+            sheet_box = box(0, 0, a4_width, a4_height)
+            usable_bounds = (min_distance, min_distance, a4_width - min_distance, a4_height - min_distance)
+        else:
+            sheet_box, usable_bounds = region.polygon, region.bounds
+        # Os motores 'nfp' e 'raster' só precisam da região quando ela não é um retângulo
+        irregular = None if region is None or region.rectangular else region
+
+        # Rotações já corrigidas e com a bounding box em (0, 0), calculadas uma vez por peça
+        rotations = rotation_cache.rotations(candidate_rotations, poly, angle_increment)
+
+        # Índice espacial das peças da folha, já infladas pela espessura da linha
+        sheet_layout = as_sheet_layout(current_layout, line_thickness)
+
+        if placer is not None and region is None:
+            found = placer.find_position(rotations.polygons, [sheet_layout], (a4_width, a4_height), engine=engine,
+                                        margin=min_distance, clearance=line_thickness,
+                                        step=raster_resolution if engine == 'raster' else translation_increment, on_invalid='skip')
+            return None if found is None else found[1]
+
+        if engine == 'nfp':
+            # A região útil da folha descarta a margem min_distance e as peças ficam a line_thickness umas das outras
+            return find_position_nfp(rotations, sheet_layout, usable_bounds, clearance=line_thickness,
+                                     region=irregular)
+
+        if engine == 'raster':
+            return find_position_raster(rotations, sheet_layout, usable_bounds, line_thickness, raster_resolution,
+                                        region=irregular)
+
+        if engine == 'batch':
+            for rotated_poly, (_, _, width, height) in zip(rotations, rotations.bounds):
+                xs = np.arange(usable_bounds[0], usable_bounds[2] - width, translation_increment)
+                ys = np.arange(usable_bounds[1], usable_bounds[3] - height, translation_increment)
+                position = first_fit_batch(rotated_poly, sheet_layout, sheet_box, xs, ys,
+                                           clearance=line_thickness, on_invalid='skip', region=irregular)
+                if position is not None:
+                    return position
+            return None
+
+        for rotated_poly, (_, _, width, height) in zip(rotations, rotations.bounds):
+            for y in np.arange(usable_bounds[1], usable_bounds[3] - height, translation_increment):
+                for x in np.arange(usable_bounds[0], usable_bounds[2] - width, translation_increment):
+                    translated_poly = translate(rotated_poly, xoff=x, yoff=y)
+                    telemetry.count('candidates')
+
+                    if not translated_poly.is_valid:
+                        telemetry.count('rejected_invalid')
+                        continue
+                    if not translated_poly.within(sheet_box):
+                        telemetry.count('rejected_outside_sheet')
+                        continue
+
+                    # Verifica colisões apenas com as peças vizinhas (já infladas pela espessura da linha)
+                    if not sheet_layout.collides(translated_poly):
+                        return translated_poly
+                    telemetry.count('rejected_collision')
+
+        return None
+
+# Função para encontrar a primeira folha (na ordem dada) onde o polígono encaixa
+def find_position_in_sheets(poly, sheets, a4_width, a4_height, min_distance, angle_increment=75, translation_increment=2, line_thickness=0.85, engine='nfp', placer=None, raster_resolution=RASTER_RESOLUTION):
+    """Tenta posicionar o polígono em cada folha, na ordem dada, como find_position.
+
+    Com um ParallelPlacer todas as folhas e rotações são avaliadas de uma vez,
+    com o mesmo resultado da busca folha a folha. Folhas do estoque (com `region`,
+    ver sheets.py) são sempre buscadas neste processo, cada uma na sua região.
 
+    Returns:
+        tuple: (posição da folha em `sheets`, polígono transladado, transformação (ângulo, tx, ty)
+        que leva `poly` ao polígono transladado), ou None se nenhuma servir.
+    """
+    found = _find_in_sheets(poly, sheets, a4_width, a4_height, min_distance, angle_increment, translation_increment,
+                            line_thickness, engine, placer, raster_resolution)
+    if found is None:
+        return None
+    # A rotação escolhida e a posição dela, a partir das rotações guardadas da peça
+    rotations = rotation_cache.rotations(candidate_rotations, poly, angle_increment)
+    return found[0], found[1], rotations.transform(found[1], np.arange(0, 360, angle_increment))
+
+
+# Função para buscar a posição folha a folha (ou no pool de processos)
+def _find_in_sheets(poly, sheets, a4_width, a4_height, min_distance, angle_increment, translation_increment,
+                    line_thickness, engine, placer, raster_resolution):
+    regions = [getattr(sheet, 'region', None) for sheet in sheets]
+    if placer is not None and not any(regions):
+        return placer.find_position(rotation_cache.rotations(candidate_rotations, poly, angle_increment).polygons,
+                                    sheets, (a4_width, a4_height), engine=engine,
+                                    margin=min_distance, clearance=line_thickness,
+                                    step=raster_resolution if engine == 'raster' else translation_increment, on_invalid='skip')
+    for sheet_index, (sheet, region) in enumerate(zip(sheets, regions)):
+        position = find_position(poly, sheet, a4_width, a4_height, min_distance,
+                                 angle_increment, translation_increment, line_thickness, engine,
+                                 raster_resolution=raster_resolution, region=region)
+        if position is not None:
+            return sheet_index, position
     return None
 
 # Função para plotar as peças
-def plot_layout(layout):
+def plot_layout(layout, a4_width=a4_width, a4_height=a4_height):
+    # O matplotlib só é carregado quando há algo para plotar (execuções sem interface não o importam)
+    import matplotlib.pyplot as plt
+
     # Determina o número máximo de folhas que podem ser plotadas em uma única figura.
     max_sheets_per_fig = 1
     num_figures = (len(layout) + max_sheets_per_fig - 1) // max_sheets_per_fig
@@ -132,7 +279,10 @@ def plot_layout(layout):
                 break
             for poly in layout[sheet_idx]:
                 x, y = poly.exterior.xy
-                ax.plot(x, y)
+                line, = ax.plot(x, y)
+                # Os furos são desenhados com a mesma cor do contorno externo
+                for interior in poly.interiors:
+                    ax.plot(*interior.xy, color=line.get_color())
             ax.set_xlim(0, a4_width)
             ax.set_ylim(0, a4_height)
             ax.set_aspect('equal')
@@ -146,6 +296,16 @@ def scale_polygon_to_inches(poly, scaling_factor=5):
         raise ValueError(f"Expected a Polygon, got {type(poly)}")
     return scale(poly, xfact=1/scaling_factor, yfact=1/scaling_factor, origin=(0, 0))
 
+# Função para ler um SVG e já escalonar seus polígonos (usada pelo cache de geometria)
+def load_scaled_polygons(svg_filepath, scaling_factor=5):
+    with telemetry.span('parse_svg', path=svg_filepath):
+        # A tolerância em mm vira unidades do SVG antes da escala
+        polygons = get_polygons_from_svg(svg_filepath, tolerance=flatten_tolerance * scaling_factor)
+        return [scale_polygon_to_inches(poly, scaling_factor) for poly in polygons]
+
+# Identificação do carregador acima no cache; mudar ao alterar a leitura (a escala é acrescentada à chave)
+POLYGON_LOADER_KEY = f'heuristic_dtw2.load_scaled_polygons:flatten={flatten_tolerance}|holes'
+
 def calculate_unfilled_area(layout, a4_width, a4_height):
     # A área total da folha A4
     a4_area = a4_width * a4_height
@@ -164,63 +324,186 @@ def calculate_unfilled_area(layout, a4_width, a4_height):
     return unfilled_areas
 
 
+# Função para carregar os polígonos (já escalonados) de uma pasta de SVGs ou do SVG do modelo inteiro
+def load_part_polygons(svg_folder_path, use_cache=True, cache_dir=None, scaling_factor=5):
+    with telemetry.span('load', source=svg_folder_path) as probe:
+        # Carrega todos os SVGs e converte em polígonos
+        #polygons = [get_polygons_from_svg(os.path.join(svg_folder_path, f))
+        #            for f in os.listdir(svg_folder_path) if f.lower().endswith('.svg')]
+        #polygons = get_polygons_from_svg(svg_folder_path)
+        #list_of_polygons_list= [poly.buffer(0) for poly in polygons if poly.is_valid]
+        # Converte os polígonos em séries temporais
+        #temporal_series = [polygon_to_temporal_series(poly) for poly in polygons]
+        # Um arquivo SVG do modelo inteiro é separado em componentes em memória, numa única leitura
+        if os.path.isfile(svg_folder_path):
+            list_of_polygons_list = [[scale_polygon_to_inches(poly, scaling_factor)
+                                      for poly in get_polygons_from_component(component,
+                                                                              flatten_tolerance * scaling_factor)]
+                                     for component in iter_components(svg_folder_path)]
+        else:
+            # Carrega todos os SVGs e converte em polígonos. Cada arquivo SVG pode ter vários polígonos.
+            # Os polígonos já escalonados ficam no cache em disco, indexados pelo hash de cada SVG
+            svg_files = [os.path.join(svg_folder_path, f) for f in sorted(os.listdir(svg_folder_path))
+                         if f.lower().endswith('.svg')]
+            loader = partial(load_scaled_polygons, scaling_factor=scaling_factor)
+            if use_cache:
+                loader_key = f'{POLYGON_LOADER_KEY}|scale={scaling_factor}'
+                list_of_polygons_list = [cached_polygons(path, loader, loader_key, cache_dir) for path in svg_files]
+            else:
+                list_of_polygons_list = [loader(path) for path in svg_files]
+
+        # Aplainar a lista de listas em uma única lista de polígonos
+        polygons = list(chain.from_iterable(list_of_polygons_list))
+        probe.set(parts=len(polygons))
+    return polygons
+
+# Função para carregar as peças num PartStore; de uma pasta com cache, as colunas vêm direto dos .npz
+def load_part_store(svg_folder_path, use_cache=True, cache_dir=None, scaling_factor=5):
+    if not use_cache or os.path.isfile(svg_folder_path):
+        return PartStore.from_polygons(load_part_polygons(svg_folder_path, use_cache, cache_dir, scaling_factor))
+    with telemetry.span('load', source=svg_folder_path) as probe:
+        svg_files = [os.path.join(svg_folder_path, f) for f in sorted(os.listdir(svg_folder_path))
+                     if f.lower().endswith('.svg')]
+        loader = partial(load_scaled_polygons, scaling_factor=scaling_factor)
+        loader_key = f'{POLYGON_LOADER_KEY}|scale={scaling_factor}'
+        store = PartStore.from_columns(cached_columns(path, loader, loader_key, cache_dir) for path in svg_files)
+        probe.set(parts=len(store))
+    return store
+
+# Função para ordenar as peças por similaridade de forma
+def order_polygons(polygons, ordering='fourier', **options):
+    with telemetry.span('order', method=ordering, parts=len(polygons)):
+        # Converte os polígonos em séries temporais
+        #temporal_series = [polygon_to_temporal_series(polygon) for polygon in polygons]
+        # Ordena as peças por similaridade de forma; 'fastdtw' compara todos os pares
+        # como antes, os demais métodos de ordering.py evitam o custo quadrático
+        if ordering == 'fastdtw':
+            temporal_series = [polygon_to_temporal_series(poly) for poly in polygons]
+            dtw_order = order_pieces_by_dtw(polygons, temporal_series)
+        else:
+            dtw_order = order_pieces(polygons, method=ordering, **options)
+    return dtw_order
+
+# Função para montar a busca de posição e as folhas usadas por bin_packing.pack
+def packing_setup(engine='nfp', sheet_size=(a4_width, a4_height), min_distance=min_distance, line_thickness=0.85,
+                  inventory=None, **search):
+    """Parâmetros de bin_packing.pack para as opções de busca dadas.
+
+    Args:
+        inventory (list): Tipos de folha do estoque (sheets.SheetType), nas unidades das peças;
+            se dado, `new_sheet` é um SheetInventory e `sheet_size` só vale para as folhas sem tipo.
+
+    Returns:
+        tuple: (place, new_sheet, sheet_area), como esperados por bin_packing.pack.
+    """
+    a4_width, a4_height = sheet_size
+    place = partial(find_position_in_sheets, a4_width=a4_width, a4_height=a4_height, min_distance=min_distance,
+                    engine=engine, line_thickness=line_thickness, **search)
+    sheet_area = (a4_width - 2 * min_distance) * (a4_height - 2 * min_distance)
+    if inventory:
+        return place, SheetInventory(inventory, min_distance, line_thickness), sheet_area
+    return place, partial(SheetLayout, line_thickness), sheet_area
+
+
+# Função para empacotar as peças (na ordem dada) em várias folhas A4
+def pack_polygons(polygons, dtw_order, packing='first_fit', workers=1, optimize=None, optimizer='genetic',
+                  engine='nfp', sheet_size=(a4_width, a4_height), min_distance=min_distance, line_thickness=0.85,
+                  inventory=None, **search):
+    """Empacota as peças nas folhas, na ordem dada.
+
+    Args:
+        sheet_size (tuple): (largura, altura) da folha, nas unidades das peças.
+        min_distance (float): Margem entre as peças e a borda da folha.
+        line_thickness (float): Folga entre as peças.
+        inventory (list): Tipos de folha do estoque (ver packing_setup); as folhas abertas são
+            trocadas no fim pelas mais baratas em que as suas peças caibam.
+        search: Demais opções de find_position (angle_increment, translation_increment).
+
+    Returns:
+        PackingResult: As folhas, as posições de cada peça e as peças que não couberam.
+    """
+    a4_width, a4_height = sheet_size
+    if optimize and inventory:
+        raise ValueError('optimize is not supported with a sheet inventory')
+    with telemetry.span('pack', engine=engine, strategy=packing, parts=len(polygons),
+                        optimize=optimize, workers=workers) as probe:
+        # Empacota as peças em várias folhas A4, na ordem da similaridade de forma
+        place, new_sheet, sheet_area = packing_setup(engine, sheet_size, min_distance, line_thickness, inventory,
+                                                     **search)
+
+        if optimize:
+            # Troca tempo de CPU (optimize segundos) por menos folhas: busca sobre a ordem e a rotação
+            # das peças, partindo da ordem por similaridade; os processos avaliam a população
+            unfilled = partial(calculate_unfilled_area, a4_width=a4_width, a4_height=a4_height)
+            result = optimize_packing(polygons, placement_order(dtw_order), place, new_sheet, sheet_area, unfilled,
+                                      method=optimizer, time_budget=optimize, workers=workers,
+                                      strategy=packing).packing
+        else:
+            # Pool de processos para avaliar as rotações (e folhas) em paralelo, se pedido
+            placer = ParallelPlacer(workers) if workers > 1 else None
+            if workers > 1:
+                # As rotações de todas as peças são calculadas de antemão, em paralelo
+                rotation_cache.precompute(candidate_rotations, polygons, search.get('angle_increment', 75),
+                                          workers=workers)
+            try:
+                result = pack(polygons, placement_order(dtw_order), partial(place, placer=placer), new_sheet,
+                              sheet_area, strategy=packing)
+            finally:
+                if placer is not None:
+                    placer.close()
+            if inventory:
+                new_sheet.reduce_cost(result, polygons, place)
+        probe.set(sheets=len(result.sheets), unplaced=len(result.unplaced))
+    return result
+
+
+# Função para compactar o layout depois do empacotamento (ver compaction.py)
+def compact_polygons(polygons, result, time_budget=None, engine='nfp', sheet_size=(a4_width, a4_height),
+                     min_distance=min_distance, line_thickness=0.85, inventory=None, **search):
+    """Empurra as peças até encostarem e tenta esvaziar as últimas folhas.
+
+    Args:
+        polygons (list): Os polígonos originais, com os índices de `result`.
+        result (PackingResult): O empacotamento de pack_polygons.
+        time_budget (float): Segundos disponíveis; None para ir até não haver melhora.
+        Os demais argumentos são os de pack_polygons.
+
+    Returns:
+        CompactionResult: O layout compactado e a área não preenchida antes e depois.
+    """
+    a4_width, a4_height = sheet_size
+    place, new_sheet, sheet_area = packing_setup(engine, sheet_size, min_distance, line_thickness, inventory,
+                                                 **search)
+    usable_bounds = (min_distance, min_distance, a4_width - min_distance, a4_height - min_distance)
+    if inventory:
+        # Cada folha do estoque tem a sua área (as folhas esvaziadas saem da lista)
+        unfilled = partial(unfilled_area, result.sheets)
+    else:
+        unfilled = partial(calculate_unfilled_area, a4_width=a4_width, a4_height=a4_height)
+    return compact_layout(result, polygons, place, new_sheet, sheet_area, usable_bounds, unfilled,
+                          clearance=line_thickness, time_budget=time_budget)
+
+
 # Principal fluxo de execução
-def main(svg_folder_path):
-    # Carrega todos os SVGs e converte em polígonos
-    #polygons = [get_polygons_from_svg(os.path.join(svg_folder_path, f))
-    #            for f in os.listdir(svg_folder_path) if f.lower().endswith('.svg')]
-    #polygons = get_polygons_from_svg(svg_folder_path)
-    #list_of_polygons_list= [poly.buffer(0) for poly in polygons if poly.is_valid]
-    # Converte os polígonos em séries temporais
-    #temporal_series = [polygon_to_temporal_series(poly) for poly in polygons]
-    # Carrega todos os SVGs e converte em polígonos. Cada arquivo SVG pode ter vários polígonos.
-    list_of_polygons_list = [get_polygons_from_svg(os.path.join(svg_folder_path, f))
-                             for f in os.listdir(svg_folder_path)
-                             if f.lower().endswith('.svg')]
-
-    # Aplainar a lista de listas em uma única lista de polígonos
-    polygons = list(chain.from_iterable(list_of_polygons_list))
-
-    # Escalonar polígonos para polegadas
-    for i in range(len(polygons)):
-        polygons[i] = scale_polygon_to_inches(polygons[i])
-
-    # Converte os polígonos em séries temporais
-    #temporal_series = [polygon_to_temporal_series(polygon) for polygon in polygons]
-    temporal_series = [polygon_to_temporal_series(poly) for poly in polygons]
-
-    # Ordena as peças para a lógica de empacotamento baseado em DTW
-    dtw_order = order_pieces_by_dtw(polygons, temporal_series)
-
-    # Lista para manter o controle do layout das peças e folhas usadas
-    placed_polygons = set()  # polígonos já colocados
-    layout = [[]]  # Começa com uma folha A4 vazia
-
-    # Cria uma nova folha A4 vazia
-     # Cria uma nova folha A4 vazia
-    #layout = [[]]
-
-    # Empacota as peças na folha A4 de acordo com a distância DTW
-    # Empacota as peças
-    for pair in dtw_order:
-        for index in pair:
-            if index not in placed_polygons:  # Verifica se a peça ainda não foi colocada
-                poly = polygons[index]
-                position = find_position(poly, layout[-1], a4_width, a4_height, min_distance)
-
-                # Se uma posição foi encontrada, adiciona ela à folha
-                if position:
-                    layout[-1].append(position)
-                    placed_polygons.add(index)
-                else:
-                    # Se não achou um lugar na folha, cria uma nova folha e adiciona a peça lá
-                    layout.append([poly])
-                    placed_polygons.add(index)
+def main(svg_folder_path, ordering='fourier', use_cache=True, cache_dir=None, workers=1, packing='first_fit',
+         optimize=None, optimizer='genetic', engine='nfp', compact=None):
+    polygons = load_part_polygons(svg_folder_path, use_cache, cache_dir)
+    dtw_order = order_polygons(polygons, ordering)
+    result = pack_polygons(polygons, dtw_order, packing, workers, optimize, optimizer, engine)
+    if compact:
+        # Compactação com orçamento de `compact` segundos
+        compaction = compact_polygons(polygons, result, compact, engine)
+        print(compaction.summary())
+        result = compaction.packing
+    layout = result.sheets
+
+    if result.unplaced:
+        print(f"{len(result.unplaced)} peça(s) não cabem em uma folha vazia: {result.unplaced}")
 
     # Plotar o layout
     plot_layout(layout)
     print()
     # Calcule a área não preenchida para cada folha após o empacotamento
     unfilled_areas = calculate_unfilled_area(layout, a4_width, a4_height)
-    for i, unfilled_area in enumerate(unfilled_areas, start=1):
-        print(f"A área não preenchida na folha {i} é {unfilled_area} unidades quadradas.")
\ No newline at end of file
+    for i, area in enumerate(unfilled_areas, start=1):
+        print(f"A área não preenchida na folha {i} é {area} unidades quadradas.")
\ No newline at end of file
@@ -0,0 +1,329 @@
+"""
+Re-nesting incremental: inclui e remove peças sem refazer o layout inteiro.
+
+NestingState guarda o layout entre execuções: as folhas (SheetLayout, com os
+índices espaciais), a peça original e a posicionada de cada chave, as séries
+reamostradas dos contornos e as distâncias já calculadas entre as peças, pelo
+método de ordering.py escolhido (DTW, descritores de Fourier ou fastdtw).
+
+- add_parts calcula a distância só dos pares novos (cada peça nova contra todas as
+  outras), ordena as peças novas por similaridade e as posiciona nas folhas
+  existentes com bin_packing.pack (continuando o resultado), tentando antes
+  as folhas das peças já posicionadas mais parecidas com cada uma; só abre
+  folhas novas se nenhuma servir.
+- remove_parts tira as peças e remonta apenas as folhas onde elas estavam
+  (as demais peças ficam onde estão); folhas vazias são descartadas.
+- sync_folder compara o conteúdo dos SVGs de uma pasta (pelo hash de
+  geometry_cache) com o da última sincronização e aplica só as diferenças:
+  um SVG alterado tem as suas peças removidas e incluídas de novo.
+
+O estado é gravado com pickle (save/load); as folhas são remontadas a partir
+das peças posicionadas na carga.
+
+Exemplo:
+    state = NestingState.for_variant('heuristic_dtw2', ordering='fourier', engine='batch')
+    state.sync_folder('components_svg', loader)
+    state.save('components.state')
+    ...  # um designer altera dois componentes
+    state = NestingState.load('components.state')
+    state.sync_folder('components_svg', loader)
+"""
+import importlib
+import os
+import pickle
+
+import numpy as np
+from fastdtw import fastdtw
+from scipy.spatial.distance import euclidean
+
+import telemetry
+from bin_packing import PackingResult, STRATEGIES, pack, placement_order
+from geometry_cache import cache_key
+from ordering import ORDERING_METHODS, _ordered_pairs, descriptors_from_contours, dtw_distances, resample_contour
+
+
+class NestingState:
+    """Layout persistente que aceita inclusões e remoções de peças.
+
+    Args:
+        place (callable): Busca de posição, como em bin_packing.pack (ver packing_setup das variantes).
+        new_sheet (callable): Cria uma folha vazia.
+        sheet_area (float): Área útil de uma folha.
+        strategy (str): Estratégia de bin_packing.pack para as peças novas.
+        ordering (str): Método de ordering.ORDERING_METHODS que dá a distância entre as peças.
+        n_points (int): Pontos por contorno na reamostragem (DTW e descritores de Fourier).
+        window (int): Largura da banda de Sakoe-Chiba (padrão: 10% de n_points).
+        neighbours (int): Quantas peças parecidas indicam as folhas preferidas de uma peça nova.
+        chunk_size (int): Pares por bloco no cálculo vetorizado da DTW.
+        settings: Identificação livre das opções usadas (por exemplo a configuração do nest.py),
+            para quem carrega o estado saber se ele ainda vale.
+    """
+
+    def __init__(self, place, new_sheet, sheet_area, strategy='first_fit', ordering='dtw', n_points=64,
+                 window=None, neighbours=4, chunk_size=256, settings=None):
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown packing strategy {strategy!r}; expected one of {STRATEGIES}")
+        if ordering not in ORDERING_METHODS:
+            raise ValueError(f"Unknown ordering method {ordering!r}; expected one of {sorted(ORDERING_METHODS)}")
+        self.place = place
+        self.new_sheet = new_sheet
+        self.sheet_area = sheet_area
+        self.strategy = strategy
+        self.ordering = ordering
+        self.n_points = n_points
+        self.window = max(1, n_points // 10) if window is None else window
+        self.neighbours = neighbours
+        self.chunk_size = chunk_size
+        self.settings = settings
+
+        self.polygons = {}      # chave -> polígono original
+        self.placed = {}        # chave -> polígono posicionado
+        self.transforms = {}    # chave -> transformação (ângulo, tx, ty) da peça original até a posição
+        self.unplaced = []      # chaves das peças que não cabem nem numa folha vazia
+        self.sheets = []        # SheetLayout de cada folha
+        self.free_areas = []    # área livre de cada folha
+        self.sheet_keys = []    # chaves das peças de cada folha, na ordem de posicionamento
+        self.sources = {}       # arquivo -> hash do conteúdo (sync_folder)
+        self._sheet_of = {}     # chave -> índice da folha
+        self._series = {}       # chave -> contorno reamostrado
+        self._distances = {}    # chave -> {outra chave: distância}
+
+    @classmethod
+    def for_variant(cls, variant='heuristic_dtw2', strategy='first_fit', settings=None, ordering='dtw', **options):
+        """Estado com a busca de posição de uma variante (opções de packing_setup: engine, sheet_size...)."""
+        module = importlib.import_module(variant)
+        place, new_sheet, sheet_area = module.packing_setup(**options)
+        return cls(place, new_sheet, sheet_area, strategy, ordering, settings=settings)
+
+    def __len__(self):
+        return len(self.polygons)
+
+    def __contains__(self, key):
+        return key in self.polygons
+
+    def distance(self, a, b):
+        """Distância (já calculada) entre duas peças."""
+        return self._distances[a][b]
+
+    # Função para calcular a distância de um bloco de pares, com o mesmo critério de ordering.order_pieces
+    def _pair_distances(self, chunk):
+        if self.ordering == 'fastdtw':
+            series = {key: list(zip(*self.polygons[key].exterior.coords.xy)) for pair in chunk for key in pair}
+            return [fastdtw(series[a], series[b], dist=euclidean)[0] for a, b in chunk]
+        a = np.stack([self._series[p[0]] for p in chunk])
+        b = np.stack([self._series[p[1]] for p in chunk])
+        if self.ordering == 'fourier':
+            return np.linalg.norm(descriptors_from_contours(a) - descriptors_from_contours(b), axis=1)
+        return dtw_distances(a, b, self.window)
+
+    # Função para calcular a distância de todos os pares ainda sem distância, em blocos
+    def _compute_distances(self, new_keys):
+        fresh = set(new_keys)
+        pairs = [(a, b) for i, a in enumerate(new_keys) for b in new_keys[:i]]
+        pairs += [(a, b) for a in new_keys for b in self._series if b not in fresh]
+        for start in range(0, len(pairs), self.chunk_size):
+            chunk = pairs[start:start + self.chunk_size]
+            for (key_a, key_b), d in zip(chunk, self._pair_distances(chunk)):
+                self._distances[key_a][key_b] = self._distances[key_b][key_a] = float(d)
+        telemetry.count(f'{self.ordering}_pairs', len(pairs))
+        return len(pairs)
+
+    # Função para listar as folhas das peças posicionadas mais parecidas com uma peça
+    def _preferred_sheets(self, key):
+        nearest = sorted((d, other) for other, d in self._distances[key].items() if other in self._sheet_of)
+        return list(dict.fromkeys(self._sheet_of[other] for _, other in nearest[:self.neighbours]))
+
+    def add_parts(self, parts):
+        """Inclui peças no layout, sem mexer nas que já estão posicionadas.
+
+        Args:
+            parts (dict): {chave: polígono} das peças novas (chaves ainda ausentes do estado).
+
+        Returns:
+            list: Índices das folhas que receberam peças (incluindo as abertas agora).
+        """
+        parts = dict(parts)
+        repeated = [key for key in parts if key in self.polygons]
+        if repeated:
+            raise ValueError(f"Parts already in the layout: {repeated}")
+        if not parts:
+            return []
+        keys = list(parts)
+        with telemetry.span('add_parts', parts=len(keys), sheets=len(self.sheets)) as probe:
+            for key in keys:
+                self.polygons[key] = parts[key]
+                self._series[key] = resample_contour(parts[key], self.n_points)
+                self._distances[key] = {}
+            self._compute_distances(keys)
+
+            # Peças novas na ordem de similaridade entre elas, como em ordering.order_pieces
+            local = [(i, j) for i in range(len(keys)) for j in range(i)]
+            ordered = _ordered_pairs(local, [self._distances[keys[i]][keys[j]] for i, j in local], len(keys))
+            polygons = [parts[key] for key in keys]
+            key_of = {id(poly): key for poly, key in zip(polygons, keys)}
+
+            batch = PackingResult()
+            batch.sheets, batch.free_areas = self.sheets, self.free_areas
+            opened = len(self.sheets)
+            recorded = 0
+
+            # Registra as peças já posicionadas neste lote, para que elas também orientem as seguintes
+            def record():
+                nonlocal recorded
+                for index, sheet_index, placed, transform in batch.placements[recorded:]:
+                    key = keys[index]
+                    self.placed[key] = placed
+                    self.transforms[key] = transform
+                    self._sheet_of[key] = sheet_index
+                    if sheet_index >= len(self.sheet_keys):
+                        self.sheet_keys.append([])
+                    self.sheet_keys[sheet_index].append(key)
+                recorded = len(batch.placements)
+
+            # Tenta antes as folhas das peças mais parecidas, depois as demais na ordem da estratégia
+            def place(poly, sheets):
+                record()
+                position = {id(sheet): i for i, sheet in enumerate(sheets)}
+                preferred = [position[id(self.sheets[s])] for s in self._preferred_sheets(key_of[id(poly)])
+                             if id(self.sheets[s]) in position]
+                order = preferred + [i for i in range(len(sheets)) if i not in preferred]
+                found = self.place(poly, [sheets[i] for i in order])
+                return None if found is None else (order[found[0]],) + tuple(found[1:])
+
+            pack(polygons, placement_order(ordered), place, self.new_sheet, self.sheet_area, self.strategy, batch)
+            record()
+
+            touched = {sheet_index for _, sheet_index, _, _ in batch.placements}
+            self.unplaced.extend(keys[index] for index in batch.unplaced)
+            probe.set(touched=len(touched), opened=len(self.sheets) - opened, unplaced=len(batch.unplaced))
+        return sorted(touched)
+
+    def remove_parts(self, keys):
+        """Remove peças do layout, remontando só as folhas onde elas estavam.
+
+        As folhas que ficam vazias são descartadas, e as seguintes mudam de índice.
+
+        Args:
+            keys (iterable): Chaves das peças a remover (chaves ausentes são ignoradas).
+
+        Returns:
+            list: Índices (antes da remoção) das folhas alteradas.
+        """
+        removed = {key for key in keys if key in self.polygons}
+        affected = sorted({self._sheet_of[key] for key in removed if key in self._sheet_of})
+        with telemetry.span('remove_parts', parts=len(removed), sheets=len(affected)):
+            for key in removed:
+                del self.polygons[key], self._series[key]
+                for other in self._distances.pop(key):
+                    self._distances[other].pop(key, None)
+                self.placed.pop(key, None)
+                self.transforms.pop(key, None)
+                self._sheet_of.pop(key, None)
+            self.unplaced = [key for key in self.unplaced if key not in removed]
+
+            for sheet_index in affected:
+                kept = [key for key in self.sheet_keys[sheet_index] if key not in removed]
+                sheet = self.new_sheet()
+                for key in kept:
+                    sheet.append(self.placed[key])
+                self.sheets[sheet_index] = sheet
+                self.sheet_keys[sheet_index] = kept
+                self.free_areas[sheet_index] = self.sheet_area - sum(self.placed[key].area for key in kept)
+                telemetry.count('sheets_rebuilt')
+
+            if any(not self.sheet_keys[i] for i in affected):
+                self._drop_empty_sheets()
+        return affected
+
+    # Função para descartar as folhas vazias e renumerar as demais
+    def _drop_empty_sheets(self):
+        kept = [i for i, keys in enumerate(self.sheet_keys) if keys]
+        self.sheets = [self.sheets[i] for i in kept]
+        self.free_areas = [self.free_areas[i] for i in kept]
+        self.sheet_keys = [self.sheet_keys[i] for i in kept]
+        self._sheet_of = {key: i for i, keys in enumerate(self.sheet_keys) for key in keys}
+
+    def replace_parts(self, parts):
+        """Troca a geometria de peças (remove as chaves dadas e as inclui de novo)."""
+        parts = dict(parts)
+        self.remove_parts(parts)
+        return self.add_parts(parts)
+
+    def sync_folder(self, svg_folder_path, loader):
+        """Atualiza o layout com as mudanças de uma pasta de SVGs desde a última sincronização.
+
+        As peças são as chaves (nome do arquivo, posição do polígono no arquivo).
+
+        Args:
+            svg_folder_path (str): Pasta com um SVG por componente.
+            loader (callable): loader(caminho do SVG) -> lista de polígonos do componente.
+
+        Returns:
+            tuple: (chaves incluídas, chaves removidas).
+        """
+        current = {f: cache_key(os.path.join(svg_folder_path, f)) for f in sorted(os.listdir(svg_folder_path))
+                   if f.lower().endswith('.svg')}
+        stale = {f for f in self.sources if current.get(f) != self.sources[f]}
+        fresh = [f for f in current if self.sources.get(f) != current[f]]
+
+        removed = [key for key in self.polygons if key[0] in stale]
+        self.remove_parts(removed)
+        parts = {}
+        for f in fresh:
+            parts.update(((f, k), poly) for k, poly in enumerate(loader(os.path.join(svg_folder_path, f))))
+        self.add_parts(parts)
+        for f in stale:
+            del self.sources[f]
+        self.sources.update((f, current[f]) for f in fresh)
+        return list(parts), removed
+
+    def layout(self):
+        """Polígonos posicionados de cada folha (o formato de plot_layout)."""
+        return [[self.placed[key] for key in keys] for keys in self.sheet_keys]
+
+    def packing_result(self, keys=None):
+        """O layout como um PackingResult, com as peças indexadas pela posição em `keys`.
+
+        Args:
+            keys (list): Ordem das peças (padrão: as chaves em ordem crescente).
+
+        Returns:
+            tuple: (chaves, PackingResult).
+        """
+        keys = sorted(self.polygons) if keys is None else list(keys)
+        index = {key: i for i, key in enumerate(keys)}
+        result = PackingResult()
+        result.sheets = list(self.sheets)
+        result.free_areas = list(self.free_areas)
+        result.placements = [(index[key], sheet_index, self.placed[key], self.transforms.get(key))
+                             for sheet_index, sheet_keys in enumerate(self.sheet_keys) for key in sheet_keys]
+        result.unplaced = [index[key] for key in self.unplaced]
+        return keys, result
+
+    # As folhas (com os índices espaciais) não são gravadas: são remontadas das peças posicionadas
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        del state['sheets']
+        return state
+
+    def __setstate__(self, state):
+        state.setdefault('ordering', 'dtw')  # estados gravados antes da escolha da ordenação
+        state.setdefault('transforms', {})   # ... e antes do registro das transformações
+        self.__dict__.update(state)
+        self.sheets = []
+        for keys in self.sheet_keys:
+            sheet = self.new_sheet()
+            for key in keys:
+                sheet.append(self.placed[key])
+            self.sheets.append(sheet)
+
+    def save(self, path):
+        """Grava o estado com pickle."""
+        with open(path, 'wb') as state_file:
+            pickle.dump(self, state_file, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def load(path):
+        """Lê um estado gravado com save."""
+        with open(path, 'rb') as state_file:
+            return pickle.load(state_file)
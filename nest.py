@@ -0,0 +1,382 @@
+"""
+Linha de comando do nesting, sem interface gráfica.
+
+Cada fonte (uma pasta com os SVGs das peças, ou o SVG do modelo inteiro) é
+um trabalho: as peças são carregadas, ordenadas e empacotadas com a variante
+escolhida (heuristic_dtw1 ou heuristic_dtw2), e o layout é gravado em JSON
+(com a transformação de cada peça) e/ou exportado para impressão em SVG ou
+PDF com os caminhos originais (ver export.py). O matplotlib só é carregado
+para o PDF ou com --plot, então o comando inicia rápido e roda em processos
+de trabalho sem tela.
+
+A configuração (folha, unidades, espaçamento, rotações, motor de busca...)
+vem dos padrões da variante, depois de um arquivo JSON (--config) e por fim
+das opções da linha de comando. As medidas estão nas unidades escolhidas
+(--units); `scale` é quantas unidades do SVG valem um milímetro.
+
+Exemplo:
+    python nest.py components_svg --sheet-width 297 --sheet-height 420 --format json svg --output layouts
+    python nest.py pasta1 pasta2 pasta3 --config job.json --output layouts
+    python nest.py components_svg --state estados --output layouts
+
+Com --state o layout de cada pasta fica gravado entre as execuções (ver
+incremental.py): a próxima execução só reposiciona as peças dos SVGs
+incluídos, alterados ou removidos, e a distância entre as peças (pelo
+método de --ordering) só é calculada para os pares novos. O estado é refeito
+do zero se a configuração mudar.
+
+Com --sheets (ou a chave `sheets` da configuração, um caminho ou a lista de
+tipos) as folhas vêm de um estoque de tipos com tamanhos, quantidades e
+custos diferentes, inclusive sobras irregulares (ver sheets.py); as medidas
+do estoque estão nas unidades da configuração, e cada folha do layout traz o
+seu tipo e o custo total.
+"""
+import argparse
+import importlib
+import json
+import os
+import sys
+from collections import Counter
+from functools import partial
+
+from export import export_layout, load_artwork, placement_transforms, rotation_set
+from geometry_cache import cached_polygons
+from incremental import NestingState
+from sheets import read_sheet_types, sheet_areas, sheet_dimensions
+from similarity import DistanceCache
+
+# Milímetros por unidade (as variantes trabalham em milímetros)
+UNITS = {'mm': 1.0, 'cm': 10.0, 'in': 25.4, 'pt': 25.4 / 72}
+
+# Parâmetros próprios de cada variante, em milímetros
+VARIANTS = {
+    'heuristic_dtw1': {'scale': 4, 'spacing': 5, 'clearance': 0.5, 'angle_increment': 90,
+                       'translation_increment': None},
+    'heuristic_dtw2': {'scale': 5, 'spacing': 5, 'clearance': 0.85, 'angle_increment': 75,
+                       'translation_increment': 2},
+}
+
+FORMATS = ('json', 'svg', 'pdf')
+
+# Configuração padrão; None nos parâmetros geométricos usa o valor da variante
+DEFAULT_CONFIG = {
+    'variant': 'heuristic_dtw2',
+    'units': 'mm',
+    'sheet_width': 210,
+    'sheet_height': 297,
+    'sheets': None,
+    'spacing': None,
+    'clearance': None,
+    'angle_increment': None,
+    'translation_increment': None,
+    'scale': None,
+    'engine': 'nfp',
+    'raster_resolution': None,
+    'ordering': 'fourier',
+    'packing': 'first_fit',
+    'workers': 1,
+    'optimize': None,
+    'optimizer': 'genetic',
+    'compact': None,
+    'use_cache': True,
+    'cache_dir': None,
+}
+
+
+def load_config(path):
+    """Lê a configuração de um arquivo JSON, conferindo as chaves."""
+    with open(path) as config_file:
+        config = json.load(config_file)
+    unknown = set(config) - set(DEFAULT_CONFIG)
+    if unknown:
+        raise ValueError(f"Unknown configuration keys in {path}: {sorted(unknown)}")
+    return config
+
+
+def resolve_config(*overrides):
+    """Junta os padrões com as configurações dadas (as últimas têm prioridade).
+
+    Os parâmetros geométricos ausentes recebem o valor da variante, convertido
+    para as unidades da configuração.
+
+    Returns:
+        dict: A configuração completa.
+    """
+    config = dict(DEFAULT_CONFIG)
+    for override in overrides:
+        config.update({key: value for key, value in override.items() if value is not None})
+    if config['variant'] not in VARIANTS:
+        raise ValueError(f"Unknown variant {config['variant']!r}; expected one of {tuple(VARIANTS)}")
+    if config['units'] not in UNITS:
+        raise ValueError(f"Unknown units {config['units']!r}; expected one of {tuple(UNITS)}")
+    for key, value in VARIANTS[config['variant']].items():
+        if config[key] is None and value is not None:
+            config[key] = value if key in ('scale', 'angle_increment') else value / UNITS[config['units']]
+    if config['variant'] == 'heuristic_dtw1' and config['translation_increment'] is not None:
+        raise ValueError("heuristic_dtw1 uses the spacing as the grid step; translation_increment is not supported")
+    return config
+
+
+def ordering_options(config):
+    """Parâmetros de order_polygons: a ordenação 'dtw' usa o cache em disco das distâncias (ver similarity.py)."""
+    if config['ordering'] == 'dtw' and config['use_cache']:
+        return {'cache': DistanceCache(config['cache_dir'])}
+    return {}
+
+
+# Tipos de folha já lidos, por (estoque, unidade): as regiões e os IFPs ficam nos tipos
+_inventories = {}
+
+
+def sheet_inventory(config):
+    """Tipos de folha do estoque da configuração (sheets.SheetType, em milímetros), ou None sem estoque."""
+    if not config['sheets']:
+        return None
+    # Um arquivo alterado (novas quantidades, por exemplo) é lido de novo
+    modified = os.path.getmtime(config['sheets']) if isinstance(config['sheets'], str) else None
+    key = (json.dumps(config['sheets']), config['units'], modified)
+    if key not in _inventories:
+        _inventories[key] = read_sheet_types(config['sheets'], UNITS[config['units']])
+    return _inventories[key]
+
+
+# Função para montar os parâmetros de pack_polygons (em milímetros) a partir da configuração
+def search_options(config):
+    mm = UNITS[config['units']]
+    options = {'sheet_size': (config['sheet_width'] * mm, config['sheet_height'] * mm),
+               'min_distance': config['spacing'] * mm,
+               'line_thickness': config['clearance'] * mm,
+               'angle_increment': config['angle_increment']}
+    if config['translation_increment'] is not None:
+        options['translation_increment'] = config['translation_increment'] * mm
+    if config['raster_resolution'] is not None:
+        options['raster_resolution'] = config['raster_resolution'] * mm
+    if config['sheets']:
+        options['inventory'] = sheet_inventory(config)
+    return options
+
+
+# Opções que não mudam o layout, então não invalidam um estado gravado
+_RUNTIME_OPTIONS = ('workers', 'use_cache', 'cache_dir', 'compact')
+
+
+# Função para ler os polígonos de um SVG de componente como load_part_polygons (com o mesmo cache)
+def _component_loader(module, config):
+    loader = partial(module.load_scaled_polygons, scaling_factor=config['scale'])
+    if not config['use_cache']:
+        return loader
+    return partial(cached_polygons, loader=loader, loader_key=f"{module.POLYGON_LOADER_KEY}|scale={config['scale']}",
+                   cache_dir=config['cache_dir'])
+
+
+# Função para empacotar uma pasta continuando o layout gravado em state_path
+def _nest_incremental(module, source, config, state_path):
+    if not os.path.isdir(source):
+        raise ValueError(f"--state needs a folder of component SVGs, not {source!r}")
+    if config['optimize']:
+        raise ValueError("--state places only the changed parts; it cannot be combined with --optimize")
+    if config['sheets']:
+        raise ValueError("--state keeps sheets of a single size; it cannot be combined with --sheets")
+    settings = {key: value for key, value in config.items() if key not in _RUNTIME_OPTIONS}
+    state = NestingState.load(state_path) if os.path.exists(state_path) else None
+    if state is None or state.settings != settings:
+        state = NestingState.for_variant(config['variant'], config['packing'], settings, config['ordering'],
+                                         engine=config['engine'], **search_options(config))
+    added, removed = state.sync_folder(source, _component_loader(module, config))
+    print(f"{source}: {len(added)} peça(s) incluída(s), {len(removed)} removida(s)", file=sys.stderr)
+    state.save(state_path)
+    keys, result = state.packing_result()
+    return [state.polygons[key] for key in keys], result
+
+
+def nest(source, config, state_path=None):
+    """Executa o nesting de uma fonte com a configuração dada.
+
+    Args:
+        source (str): Pasta com os SVGs das peças, ou o SVG do modelo inteiro.
+        config (dict): Configuração completa (ver resolve_config).
+        state_path (str): Arquivo do estado incremental (ver incremental.py); None para
+            empacotar do zero.
+
+    Returns:
+        tuple: (PackingResult, transformação de cada posicionamento (ver export.placement_transforms)).
+    """
+    module = importlib.import_module(config['variant'])
+    options = search_options(config)
+    if state_path is not None:
+        polygons, result = _nest_incremental(module, source, config, state_path)
+    else:
+        # As peças ficam em arrays contíguos, preenchidos direto das colunas do cache de geometria
+        polygons = module.load_part_store(source, config['use_cache'], config['cache_dir'], config['scale'])
+        order = module.order_polygons(polygons, config['ordering'], **ordering_options(config))
+        result = module.pack_polygons(polygons, order, config['packing'], config['workers'], config['optimize'],
+                                      config['optimizer'], config['engine'], **options)
+    if config['compact']:
+        # Compactação do layout, com orçamento de `compact` segundos (ver compaction.py)
+        compaction = module.compact_polygons(polygons, result, config['compact'], config['engine'], **options)
+        print(f"{source}: {compaction.summary()}", file=sys.stderr)
+        result = compaction.packing
+    return result, layout_transforms(config, polygons, result)
+
+
+def layout_transforms(config, polygons, result):
+    """Transformação (ângulo, tx, ty) de cada posicionamento de `result` (ver export.placement_transforms).
+
+    A busca registra a transformação de cada peça; a estimativa pelas rotações
+    possíveis só é usada nos posicionamentos sem registro (estados incrementais antigos).
+    """
+    module = importlib.import_module(config['variant'])
+    options = search_options(config)
+    # Com o otimizador as peças também recebem os giros dele (8 por padrão)
+    angles = rotation_set(config['angle_increment'], 8 if config['optimize'] else None)
+    # A peça como a busca a gira: a rotação 0 de candidate_rotations
+    if config['variant'] == 'heuristic_dtw1':
+        prepare = lambda poly: module.candidate_rotations(poly, 360, options['line_thickness'],
+                                                          options['min_distance'])[0]
+    else:
+        prepare = lambda poly: module.candidate_rotations(poly, 360)[0]
+    return placement_transforms(polygons, result, angles, prepare)
+
+
+def _rings(poly, factor):
+    return [[[x * factor, y * factor] for x, y in ring.coords] for ring in [poly.exterior, *poly.interiors]]
+
+
+def layout_document(source, config, result, transforms):
+    """Layout em formato JSON: as folhas, as peças de cada folha e as não posicionadas.
+
+    Cada peça traz o índice na ordem de carga, a transformação aplicada à peça
+    original (rotação em graus em torno da origem, depois a translação) e os
+    anéis do polígono posicionado (o contorno externo primeiro, depois os
+    furos), nas unidades da configuração. Com um estoque de folhas cada folha
+    traz também o tipo, o tamanho e o custo, e o documento o custo total.
+    """
+    factor = 1 / UNITS[config['units']]
+    sheet_size = search_options(config)['sheet_size']
+    sheets = [{'index': index, 'parts': [], 'utilisation': sum(poly.area for poly in sheet) / area}
+              for index, (sheet, area) in enumerate(zip(result.sheets, sheet_areas(result.sheets, sheet_size)))]
+    for entry, sheet in zip(sheets, result.sheets):
+        sheet_type = getattr(sheet, 'sheet_type', None)
+        if sheet_type is not None:
+            entry.update(type=sheet_type.name, width=sheet_type.width * factor, height=sheet_type.height * factor,
+                         cost=sheet_type.cost)
+    for (part, sheet_index, placed, _), (angle, tx, ty) in zip(result.placements, transforms):
+        sheets[sheet_index]['parts'].append({'part': part,
+                                             'rotation': angle,
+                                             'translation': [tx * factor, ty * factor],
+                                             'rings': _rings(placed, factor)})
+    document = {'source': source,
+                'config': config,
+                'units': config['units'],
+                'sheet': {'width': config['sheet_width'], 'height': config['sheet_height']},
+                'sheets': sheets,
+                'unplaced': result.unplaced}
+    if config['sheets']:
+        document['cost'] = sum(entry.get('cost', 0) for entry in sheets)
+    return document
+
+
+def write_layout(prefix, source, config, result, transforms, formats=('json',)):
+    """Grava o layout em `prefix`.<formato> para cada formato pedido (ver FORMATS).
+
+    Returns:
+        list: Os caminhos gravados.
+    """
+    os.makedirs(os.path.dirname(prefix) or '.', exist_ok=True)
+    written = []
+    if 'json' in formats:
+        with open(prefix + '.json', 'w') as layout_file:
+            json.dump(layout_document(source, config, result, transforms), layout_file)
+        written.append(prefix + '.json')
+    printable = [extension for extension in ('svg', 'pdf') if extension in formats]
+    if printable:
+        module = importlib.import_module(config['variant'])
+        artwork = load_artwork(source, module, config['scale'])
+        sizes = sheet_dimensions(result.sheets, search_options(config)['sheet_size'])
+        for extension in printable:
+            export_layout(f'{prefix}.{extension}', result, artwork, transforms, sizes)
+            written.append(f'{prefix}.{extension}')
+    return written
+
+
+def _job_name(source):
+    name = os.path.basename(os.path.normpath(source))
+    return os.path.splitext(name)[0] if os.path.isfile(source) else name
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Nesting das peças de um modelo de papel em folhas.')
+    parser.add_argument('sources', nargs='+', help='pastas com os SVGs das peças, ou SVGs do modelo inteiro')
+    parser.add_argument('--config', help='arquivo JSON com a configuração')
+    parser.add_argument('--variant', choices=tuple(VARIANTS))
+    parser.add_argument('--units', choices=tuple(UNITS))
+    parser.add_argument('--sheet-width', type=float)
+    parser.add_argument('--sheet-height', type=float)
+    parser.add_argument('--sheets', metavar='FILE',
+                        help='estoque de folhas em JSON: tipos com tamanho ou contorno, quantidade e custo')
+    parser.add_argument('--spacing', type=float, help='distância mínima entre as peças e a borda')
+    parser.add_argument('--clearance', type=float, help='folga entre as peças (espessura da linha)')
+    parser.add_argument('--angle-increment', type=float, help='passo das rotações testadas, em graus')
+    parser.add_argument('--translation-increment', type=float, help='passo da grade (heuristic_dtw2)')
+    parser.add_argument('--scale', type=float, help='unidades do SVG por milímetro')
+    parser.add_argument('--engine', choices=('nfp', 'batch', 'grid', 'raster'))
+    parser.add_argument('--raster-resolution', type=float, help="tamanho das células do motor 'raster'")
+    parser.add_argument('--ordering')
+    parser.add_argument('--packing')
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--optimize', type=float, metavar='SECONDS')
+    parser.add_argument('--optimizer')
+    parser.add_argument('--compact', type=float, metavar='SECONDS',
+                        help='compacta o layout depois do empacotamento, com este orçamento de tempo')
+    parser.add_argument('--no-cache', dest='use_cache', action='store_false', default=None)
+    parser.add_argument('--cache-dir')
+    parser.add_argument('--format', nargs='+', choices=FORMATS, default=['json'])
+    parser.add_argument('--output', help='pasta dos resultados (padrão: o JSON vai para a saída padrão)')
+    parser.add_argument('--plot', action='store_true', help='mostra o layout com o matplotlib')
+    parser.add_argument('--state', metavar='DIR',
+                        help='pasta dos estados incrementais (um <nome>.state por fonte; ver incremental.py)')
+    args = parser.parse_args(argv)
+
+    options = {key: value for key, value in vars(args).items() if key in DEFAULT_CONFIG}
+    try:
+        config = resolve_config(load_config(args.config) if args.config else {}, options)
+    except (OSError, ValueError) as error:
+        parser.error(str(error))
+    if set(args.format) - {'json'} and not args.output:
+        parser.error('--format svg/pdf requires --output')
+
+    failed = []
+    for source in args.sources:
+        try:
+            state_path = None
+            if args.state:
+                os.makedirs(args.state, exist_ok=True)
+                state_path = os.path.join(args.state, _job_name(source) + '.state')
+            result, transforms = nest(source, config, state_path)
+        except Exception as error:  # um trabalho com erro não interrompe os demais
+            print(f"{source}: {type(error).__name__}: {error}", file=sys.stderr)
+            failed.append(source)
+            continue
+        print(f"{source}: {len(result.placements)} peças em {len(result.sheets)} folha(s), "
+              f"{len(result.unplaced)} não couberam", file=sys.stderr)
+        if config['sheets']:
+            used = ', '.join(f"{name} x{count}" for name, count in
+                             Counter(sheet.sheet_type.name for sheet in result.sheets).items())
+            print(f"{source}: folhas {used}, custo {sum(sheet.sheet_type.cost for sheet in result.sheets):g}",
+                  file=sys.stderr)
+
+        if args.output:
+            write_layout(os.path.join(args.output, _job_name(source)), source, config, result, transforms,
+                         args.format)
+        else:
+            json.dump(layout_document(source, config, result, transforms), sys.stdout)
+            print()
+
+        if args.plot:
+            module = importlib.import_module(config['variant'])
+            module.plot_layout(result.sheets, *search_options(config)['sheet_size'])
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
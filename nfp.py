@@ -0,0 +1,603 @@
+"""
+Motor de posicionamento baseado em no-fit polygons (NFP).
+
+Em vez de testar cada ponto de uma grade (x, y), calcula para cada peça já
+posicionada o NFP (soma de Minkowski da peça fixa com a peça móvel espelhada)
+e o inner-fit polygon (IFP) da folha. As posições viáveis são exatamente
+IFP - união(NFPs), e a posição escolhida é o vértice mais "inferior-esquerdo"
+(menor y, depois menor x) dessa região, na mesma ordem da varredura em grade.
+Numa folha irregular (uma sobra do estoque, ver sheets.py) o IFP vem da
+região da folha, que o calcula uma vez por rotação de cada peça.
+
+A região viável fica guardada por folha e forma (NFPCache.feasible): como as
+folhas só crescem por append, uma nova consulta da mesma forma na mesma folha
+(peças repetidas, compactação) só desconta os NFPs das peças novas, em vez de
+refazer a união de todos.
+
+A região não é montada NFP por NFP: discos contidos na peça móvel varrem
+primeiro quase toda a área coberta (com a união dilatada das peças da folha,
+guardada por raio), e só as peças convexas dos NFPs que alcançam os bolsões
+restantes são somadas e descontadas. Entre as rotações de uma peça, depois
+que uma encaixa, as seguintes só calculam a faixa abaixo dela.
+"""
+import weakref
+from collections import OrderedDict
+
+import numpy as np
+import shapely
+from shapely.geometry import box
+
+import telemetry
+from spatial_index import as_sheet_layout
+
+# Tolerância usada para afastar os candidatos do contorno dos NFPs
+# (um vértice exatamente no contorno toca a peça fixa e conta como colisão)
+NFP_EPSILON = 1e-6
+
+# Peças descontadas de uma vez da região viável (ver _subtract)
+SUBTRACT_BLOCK = 128
+
+# Discos inscritos em cada forma usados para varrer a região viável (ver NFPCache.sweep)
+SWEEP_DISKS = 8
+
+
+# Função para obter os anéis (sentido anti-horário) dos triângulos de um polígono
+def _triangle_rings(geom):
+    triangles = shapely.get_parts(shapely.constrained_delaunay_triangles(geom))
+    triangles = triangles[shapely.get_num_coordinates(triangles) == 4]
+    coords = shapely.get_coordinates(triangles).reshape(-1, 4, 2)[:, :3]
+    (x0, y0), (x1, y1), (x2, y2) = coords[:, 0].T, coords[:, 1].T, coords[:, 2].T
+    area2 = (x1 - x0) * (y2 - y0) - (x2 - x0) * (y1 - y0)
+    coords = np.where((area2 > 0)[:, None, None], coords, coords[:, ::-1])[area2 != 0]
+    return [list(map(tuple, ring)) for ring in coords.tolist()]
+
+
+# Função para verificar se a curva a -> b -> c é para a esquerda (ou reta)
+def _convex_turn(a, b, c):
+    dx1, dy1, dx2, dy2 = b[0] - a[0], b[1] - a[1], c[0] - b[0], c[1] - b[1]
+    scale = max(abs(dx1), abs(dy1), abs(dx2), abs(dy2), 1.0) ** 2
+    return dx1 * dy2 - dy1 * dx2 >= -1e-9 * scale
+
+
+# Função para juntar dois anéis que compartilham a aresta p -> q (em A) / q -> p (em B)
+def _merge_rings(ring_a, ring_b, p, q):
+    i = ring_a.index(q)
+    ring_a = ring_a[i:] + ring_a[:i]  # começa em q e termina em p
+    j = ring_b.index(p)
+    ring_b = ring_b[j:] + ring_b[:j]  # começa em p e termina em q
+    return ring_a + ring_b[1:-1]
+
+
+def convex_decomposition(geom):
+    """Decompõe um polígono (ou multipolígono, com ou sem furos) em peças convexas.
+
+    Triangula o polígono (Delaunay restrito) e junta triângulos vizinhos
+    enquanto o resultado continuar convexo (Hertel-Mehlhorn).
+
+    Args:
+        geom (shapely.geometry.Polygon | MultiPolygon): A geometria a decompor.
+
+    Returns:
+        list: Lista de anéis convexos, cada um uma lista de tuplas (x, y) em sentido anti-horário.
+    """
+    if not geom.is_valid:
+        geom = geom.buffer(0)
+    pieces = dict(enumerate(_triangle_rings(geom)))
+
+    # Mapa de arestas orientadas -> peça dona da aresta
+    edges = {}
+    for pid, ring in pieces.items():
+        for k in range(len(ring)):
+            edges[(ring[k], ring[(k + 1) % len(ring)])] = pid
+
+    for (p, q) in list(edges):
+        a = edges.get((p, q))
+        b = edges.get((q, p))
+        if a is None or b is None or a == b:
+            continue
+        merged = _merge_rings(pieces[a], pieces[b], p, q)
+        # Os outros vértices já eram convexos nas duas peças: basta olhar as junções q e p
+        n = len(pieces[a])
+        if not (_convex_turn(merged[-1], merged[0], merged[1])
+                and _convex_turn(merged[n - 2], merged[n - 1], merged[n])):
+            continue
+        for ring in (pieces[a], pieces[b]):
+            for k in range(len(ring)):
+                edges.pop((ring[k], ring[(k + 1) % len(ring)]), None)
+        del pieces[b]
+        pieces[a] = merged
+        for k in range(len(merged)):
+            edges[(merged[k], merged[(k + 1) % len(merged)])] = a
+    return list(pieces.values())
+
+
+# Função para preparar peças convexas para a soma de Minkowski: cada anel começa no
+# vértice mais baixo e suas arestas são guardadas com o ângulo polar (crescente no sentido anti-horário)
+def _prepare_pieces(rings):
+    lengths = np.array([len(ring) for ring in rings])
+    points = np.array([point for ring in rings for point in ring], dtype=float)
+    first = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+    # Vértice mais baixo (menor y, depois menor x) de cada anel, contado a partir do início dele
+    order = np.lexsort((points[:, 0], points[:, 1], np.repeat(np.arange(len(rings)), lengths)))
+    lowest = order[first] - first
+    k = np.arange(lengths.max())
+    current = first[:, None] + (lowest[:, None] + k) % lengths[:, None]
+    following = first[:, None] + (lowest[:, None] + k + 1) % lengths[:, None]
+    valid = k < lengths[:, None]
+    edges = np.where(valid[:, :, None], points[following] - points[current], 0.0)
+    angles = np.where(valid, np.arctan2(edges[:, :, 1], edges[:, :, 0]) % (2 * np.pi), 4 * np.pi)  # arestas de preenchimento vão para o fim
+    return points[first + lowest], edges, angles
+
+
+# Função para empilhar as peças preparadas de várias geometrias (com arestas de preenchimento até o mesmo tamanho)
+def _stack_pieces(prepared):
+    if len(prepared) == 1:
+        return prepared[0]
+    size = max(edges.shape[1] for _, edges, _ in prepared)
+    count = sum(len(starts) for starts, _, _ in prepared)
+    starts = np.concatenate([starts for starts, _, _ in prepared])
+    edges = np.zeros((count, size, 2))
+    angles = np.full((count, size), 4 * np.pi)
+    first = 0
+    for _, piece_edges, piece_angles in prepared:
+        last = first + len(piece_edges)
+        edges[first:last, :piece_edges.shape[1]] = piece_edges
+        angles[first:last, :piece_angles.shape[1]] = piece_angles
+        first = last
+    return starts, edges, angles
+
+
+# Função para calcular a bounding box (xmin, ymin, xmax, ymax) de cada peça preparada
+def _piece_bounds(prepared):
+    starts, edges, _ = prepared
+    vertices = starts[:, None] + np.cumsum(edges, axis=1)
+    return np.hstack([vertices.min(axis=1), vertices.max(axis=1)])
+
+
+def minkowski_sum(pieces_a, pieces_b, pairs=None):
+    """Soma de Minkowski de duas geometrias já decompostas em peças convexas.
+
+    A soma de duas peças convexas é obtida intercalando as arestas das duas pelo
+    ângulo polar; todas as combinações de peças são calculadas de uma vez com NumPy.
+
+    Args:
+        pieces_a (tuple): Peças convexas da primeira geometria (saída de _prepare_pieces).
+        pieces_b (tuple): Peças convexas da segunda geometria (saída de _prepare_pieces).
+        pairs (tuple): (índices em pieces_a, índices em pieces_b); se dado, só essas
+            combinações são somadas.
+
+    Returns:
+        numpy.ndarray: Array de polígonos convexos cuja união é a soma de Minkowski.
+    """
+    if pairs is None:
+        na, nb = len(pieces_a[0]), len(pieces_b[0])
+        pairs = (np.repeat(np.arange(na), nb), np.tile(np.arange(nb), na))
+    (starts_a, edges_a, angles_a), (starts_b, edges_b, angles_b) = (
+        [part[index] for part in pieces] for pieces, index in zip((pieces_a, pieces_b), pairs))
+    starts = starts_a + starts_b
+    edges = np.concatenate([edges_a, edges_b], axis=1)
+    order = np.argsort(np.concatenate([angles_a, angles_b], axis=1), axis=1, kind='stable')
+    edges = np.take_along_axis(edges, order[:, :, None], axis=1)
+
+    coords = np.concatenate([starts[:, None], starts[:, None] + np.cumsum(edges, axis=1)], axis=1)
+    coords[:, -1] = coords[:, 0]  # fecha o anel sem erro de arredondamento
+    return shapely.polygons(coords)
+
+
+# Função para obter uma chave estável (independente de translação) para uma geometria
+def _shape_key(geom):
+    coords = shapely.get_coordinates(geom)
+    origin = coords.min(axis=0)
+    return np.round(coords - origin, 6).tobytes(), origin
+
+
+class NFPCache:
+    """Cache de decomposições convexas, NFPs por par de formas e regiões viáveis por folha.
+
+    As chaves são independentes da translação: uma peça já posicionada e a mesma
+    peça (na mesma rotação) em outra posição ou folha reaproveitam o mesmo NFP.
+
+    Antes da decomposição as formas são simplificadas com `tolerance` (arcos
+    gerados por buffer viram poucas arestas); o NFP resultante fica no máximo
+    2 * tolerance aquém do exato, o que best_nfp_position compensa na folga.
+    """
+
+    def __init__(self, maxsize=4096, tolerance=0.05):
+        self.maxsize = maxsize
+        self.tolerance = tolerance
+        self._pieces = OrderedDict()
+        self._disks = OrderedDict()
+        self._nfps = OrderedDict()
+        self._feasible = weakref.WeakKeyDictionary()  # folha -> {(forma, folha útil, folga): região}
+        self._sweeps = weakref.WeakKeyDictionary()  # folha -> {raio: (nº de peças, união dilatada)}
+        self._placed = weakref.WeakKeyDictionary()  # folha -> peças convexas empilhadas (ver placed_pieces)
+
+    # Os caches são lidos por vários trabalhos ao mesmo tempo (async_nest.NestingJob roda em threads):
+    # cada operação do OrderedDict é atômica, mas a chave pode sair entre o get e o move_to_end
+    def _remember(self, store, key, value):
+        store[key] = value
+        if len(store) > self.maxsize:
+            try:
+                store.popitem(last=False)
+            except KeyError:
+                pass  # outra thread já esvaziou o cache
+
+    @staticmethod
+    def _touch(store, key):
+        try:
+            store.move_to_end(key)
+        except KeyError:
+            pass  # descartada por outra thread; o valor já lido continua válido
+
+    def pieces(self, geom):
+        """Retorna a forma simplificada e as peças convexas de `geom` normalizada (e a origem usada)."""
+        key, origin = _shape_key(geom)
+        pieces = self._pieces.get(key)
+        if pieces is None:
+            normalized = shapely.transform(geom, lambda c: c - origin)
+            if self.tolerance > 0:
+                normalized = normalized.simplify(self.tolerance)
+            rings = convex_decomposition(normalized)
+            pieces = (normalized, _prepare_pieces(rings),
+                      _prepare_pieces([[(-x, -y) for x, y in ring] for ring in rings]))
+            self._remember(self._pieces, key, pieces)
+        else:
+            self._touch(self._pieces, key)
+        return key, origin, pieces
+
+    def nfp(self, fixed, moving):
+        """No-fit polygon de `moving` em torno de `fixed`, em coordenadas de translação.
+
+        Uma translação t faz `moving + t` sobrepor o interior de `fixed`
+        se e somente se t estiver no interior da união dos polígonos retornados.
+
+        Returns:
+            numpy.ndarray: Array de polígonos convexos que compõem o NFP.
+        """
+        key_f, origin_f, (_, pieces_f, _) = self.pieces(fixed)
+        key_m, origin_m, (_, _, mirrored_m) = self.pieces(moving)
+        key = (key_f, key_m)
+        nfp = self._nfps.get(key)
+        if nfp is None:
+            telemetry.count('nfp_computed')
+            nfp = minkowski_sum(pieces_f, mirrored_m)
+            self._remember(self._nfps, key, nfp)
+        else:
+            telemetry.count('nfp_cache_hits')
+            self._touch(self._nfps, key)
+        offset = origin_f - origin_m
+        return shapely.transform(nfp, lambda c: c + offset)
+
+    def disks(self, moving):
+        """Os maiores discos contidos na forma simplificada de `moving`: o inscrito nela e os das peças convexas.
+
+        Returns:
+            tuple: (centros, em coordenadas de `moving`, raios), do maior disco ao menor.
+        """
+        key, origin, (outline, pieces, _) = self.pieces(moving)
+        disks = self._disks.get(key)
+        if disks is None:
+            # Nas peças convexas basta um disco centrado na média dos vértices,
+            # com raio até a reta da aresta mais próxima
+            starts, edges, _ = pieces
+            ends = starts[:, None] + np.cumsum(edges, axis=1)
+            lengths = np.hypot(edges[..., 0], edges[..., 1])
+            valid = lengths > 0
+            centers = (ends * valid[..., None]).sum(axis=1) / np.maximum(valid.sum(axis=1), 1)[:, None]
+            offsets = centers[:, None] - (ends - edges)
+            distances = edges[..., 0] * offsets[..., 1] - edges[..., 1] * offsets[..., 0]
+            radii = np.where(valid, distances / np.where(valid, lengths, 1), np.inf).min(axis=1)
+            line = shapely.maximum_inscribed_circle(outline)
+            centers = np.concatenate([shapely.get_coordinates(line)[:1], centers])
+            radii = np.append(line.length, radii)
+            order = np.argsort(-radii, kind='stable')[:SWEEP_DISKS]
+            order = order[radii[order] > 0]  # peças degeneradas (área nula) não têm disco
+            disks = (centers[order], radii[order])
+            self._remember(self._disks, key, disks)
+        else:
+            self._touch(self._disks, key)
+        return disks[0] + origin, disks[1]
+
+    def swept(self, sheet_layout, radius):
+        """União das formas simplificadas das peças da folha, dilatadas por `radius`.
+
+        Guardada por folha e raio; peças acrescentadas à folha entram na união guardada.
+        """
+        sweeps = self._sweeps.setdefault(sheet_layout, {})
+        count, swept = sweeps.get(radius, (0, None))
+        if count < len(sheet_layout):
+            added = []
+            for poly in sheet_layout.polygons[count:len(sheet_layout)]:
+                _, origin, (outline, _, _) = self.pieces(poly)
+                added.append(shapely.transform(outline, lambda c: c + origin))
+            added = shapely.buffer(np.asarray(added, dtype=object), radius, quad_segs=4)
+            swept = shapely.union_all(added if swept is None else np.append(added, swept))
+            sweeps[radius] = (len(sheet_layout), swept)
+        return swept
+
+    def sweep(self, region, sheet_layout, moving):
+        """Região menos as translações em que um disco contido em `moving` invade alguma peça da folha.
+
+        Com um disco de raio r e centro c dentro de `moving`, as translações em que
+        ele sobrepõe a peça fixa formam a peça dilatada por r e deslocada por -c,
+        e estão contidas no NFP. Com a união dilatada guardada por folha, cada disco
+        custa só uma diferença e tira quase toda a área coberta da região; sobram
+        bolsões perto do contorno final, que o NFP peça a peça termina (ver `reaching`).
+        Os raios são arredondados para baixo numa escala de razão raiz de 2, para
+        que as formas compartilhem as uniões dilatadas da folha.
+        """
+        for center, radius in zip(*self.disks(moving)):
+            # O buffer do GEOS simplifica a entrada em até 1% do raio: a folga de 5% o mantém dentro do disco
+            radius = 2 ** (np.floor(2 * np.log2(0.95 * radius)) / 2)
+            swept = self.swept(sheet_layout, radius)
+            region = region.difference(shapely.transform(swept, lambda c: c - center))
+            if region.is_empty:
+                break
+        return region
+
+    def placed_pieces(self, sheet_layout):
+        """As peças convexas das peças da folha, já na posição delas, empilhadas numa estrutura só.
+
+        Guardadas por folha; peças acrescentadas à folha são empilhadas às guardadas.
+
+        Returns:
+            tuple: (nº de peças da folha, peças preparadas, bounding boxes, índice da peça dona de cada uma).
+        """
+        saved = self._placed.get(sheet_layout)
+        count = 0 if saved is None else saved[0]
+        if count < len(sheet_layout):
+            prepared, bounds, owners = ([], [], []) if saved is None else ([saved[1]], [saved[2]], [saved[3]])
+            for index, poly in enumerate(sheet_layout.polygons[count:len(sheet_layout)], count):
+                _, origin, (_, (starts, edges, angles), _) = self.pieces(poly)
+                prepared.append((starts + origin, edges, angles))
+                bounds.append(_piece_bounds(prepared[-1]))
+                owners.append(np.full(len(starts), index))
+            saved = (len(sheet_layout), _stack_pieces(prepared), np.concatenate(bounds), np.concatenate(owners))
+            self._placed[sheet_layout] = saved
+        return saved
+
+    def reaching(self, sheet_layout, fixed, moving, region):
+        """As peças convexas dos NFPs de `moving` em torno das peças `fixed` da folha que alcançam a região.
+
+        A bounding box da soma de duas peças convexas é a soma das bounding boxes:
+        as combinações de peças são escolhidas pela bounding box, antes da soma de
+        Minkowski, e só as que alcançam algum componente de `region` são somadas.
+
+        Args:
+            sheet_layout (SheetLayout): A folha.
+            fixed (list): Índices das peças da folha a considerar.
+            moving (shapely.geometry.Polygon): A peça a posicionar (já dilatada).
+            region (shapely.geometry.base.BaseGeometry): A região viável até aqui.
+
+        Returns:
+            numpy.ndarray: Array de polígonos convexos, em coordenadas de translação.
+        """
+        telemetry.count('nfp_computed', len(fixed))
+        _, placed, bounds_f, owners = self.placed_pieces(sheet_layout)
+        _, origin_m, (_, _, (starts_m, edges_m, angles_m)) = self.pieces(moving)
+        mirrored = (starts_m - origin_m, edges_m, angles_m)
+        bounds_m = _piece_bounds(mirrored)
+        selected = np.zeros(len(sheet_layout), dtype=bool)
+        selected[fixed] = True
+        # Primeiro pela bounding box da região toda, depois pela de cada componente dela
+        xmin, ymin, xmax, ymax = region.bounds
+        candidates = np.flatnonzero(selected[owners] & (bounds_f[:, 0] + bounds_m[:, 0].min() <= xmax)
+                                    & (bounds_f[:, 2] + bounds_m[:, 2].max() >= xmin)
+                                    & (bounds_f[:, 1] + bounds_m[:, 1].min() <= ymax)
+                                    & (bounds_f[:, 3] + bounds_m[:, 3].max() >= ymin))
+        rows, cols = np.divmod(np.arange(len(candidates) * len(bounds_m)), len(bounds_m))
+        rows = candidates[rows]
+        bounds = bounds_f[rows] + bounds_m[cols]
+        windows = shapely.bounds(shapely.get_parts(region))
+        reach = np.zeros(len(bounds), dtype=bool)
+        for wxmin, wymin, wxmax, wymax in windows:
+            reach |= ((bounds[:, 0] <= wxmax) & (bounds[:, 2] >= wxmin)
+                      & (bounds[:, 1] <= wymax) & (bounds[:, 3] >= wymin))
+        return minkowski_sum(placed, mirrored, (rows[reach], cols[reach]))
+
+    def feasible(self, moving, sheet_layout, ifp, margin, sheet_key=None, top=np.inf):
+        """Região viável de `moving` numa folha: o IFP menos os NFPs, dilatados por `margin`, das peças dela.
+
+        A dilatação vai para `moving` antes da decomposição (o NFP de `moving`
+        dilatado é o NFP dilatado, porque o disco é simétrico); o buffer com cantos
+        em esquadria contém o arredondado, então a folga nunca fica menor que
+        `margin`. A região é varrida primeiro pelos discos de `moving` (ver `sweep`)
+        e depois pelas peças dos NFPs que ainda a alcançam (ver `reaching`).
+
+        Só a faixa de translações com y até `top` é calculada: as peças da folha
+        acima dela nem entram na conta. A região fica guardada por folha e forma;
+        a próxima consulta da mesma forma (em qualquer posição) numa faixa que
+        caiba na guardada só desconta os NFPs das peças acrescentadas desde então.
+
+        Args:
+            moving (shapely.geometry.Polygon): O polígono (já rotacionado) a ser posicionado.
+            sheet_layout (SheetLayout): A folha.
+            ifp (shapely.geometry.Polygon): O inner-fit polygon de `moving` na folha.
+            margin (float): Dilatação dos NFPs (folga mais tolerâncias).
+            sheet_key: Identificação da região útil da folha (o IFP depende dela).
+            top (float): Maior y de translação da faixa (inf = o IFP inteiro).
+
+        Returns:
+            tuple: (região viável na faixa, em coordenadas de translação, y do topo da faixa);
+            a faixa devolvida pode ser maior que a pedida, se já estava guardada.
+        """
+        key, origin = _shape_key(moving)
+        regions = self._feasible.setdefault(sheet_layout, OrderedDict())
+        region_key = (key, sheet_key, margin)
+        saved = regions.get(region_key)
+        offset = None if saved is None else saved[2] - origin
+        if saved is None or saved[0] > len(sheet_layout) or saved[3] + offset[1] < top:
+            count = 0
+            region = ifp if top >= ifp.bounds[3] else ifp.intersection(box(*ifp.bounds[:3], top))
+        else:
+            telemetry.count('feasible_cache_hits')
+            count, region, _, top = saved
+            if offset.any():
+                # A mesma forma em outra posição: as translações mudam pela diferença das origens
+                region = shapely.transform(region, lambda c: c + offset)
+                top += offset[1]
+        # Peças cujo NFP começa acima da faixa (menor y da peça - maior y de `moving`) não a alcançam
+        reach = top + moving.bounds[3] + margin
+        fresh = [index for index in range(count, len(sheet_layout))
+                 if sheet_layout.polygons[index].bounds[1] <= reach]
+        if fresh and not region.is_empty:
+            dilated = moving.buffer(margin, join_style='mitre') if margin > 0 else moving
+            region = self.sweep(region, sheet_layout, dilated)
+            if not region.is_empty:
+                region = _subtract(region, self.reaching(sheet_layout, fresh, dilated, region))
+        self._remember(regions, region_key, (len(sheet_layout), region, origin, top))
+        self._touch(regions, region_key)
+        return region, top
+
+
+def _subtract(region, pieces):
+    """Região menos a união das peças, descartando as peças que já não a alcançam.
+
+    As peças são descontadas em blocos, das maiores para as menores, e depois
+    de cada bloco só seguem as que ainda tocam o que sobrou.
+    """
+    shapely.prepare(region)
+    pieces = pieces[shapely.intersects(region, pieces)]
+    pieces = pieces[np.argsort(-shapely.area(pieces), kind='stable')]
+    size = SUBTRACT_BLOCK
+    while len(pieces):
+        block, pieces = pieces[:size], pieces[size:]
+        region = region.difference(shapely.union_all(block))
+        if region.is_empty or not len(pieces):
+            break
+        shapely.prepare(region)
+        pieces = pieces[shapely.intersects(region, pieces)]
+        size *= 2
+    return region
+
+
+# Cache compartilhado entre chamadas de find_position_nfp
+default_cache = NFPCache()
+
+
+def inner_fit_polygon(moving, sheet_bounds):
+    """Inner-fit polygon de uma folha retangular: translações que mantêm `moving` dentro dela.
+
+    Args:
+        moving (shapely.geometry.Polygon): O polígono a ser posicionado.
+        sheet_bounds (tuple): (xmin, ymin, xmax, ymax) da região útil da folha.
+
+    Returns:
+        shapely.geometry.Polygon: O IFP, ou None se a peça não couber na folha.
+    """
+    minx, miny, maxx, maxy = moving.bounds
+    x0, y0 = sheet_bounds[0] - minx, sheet_bounds[1] - miny
+    x1, y1 = sheet_bounds[2] - maxx, sheet_bounds[3] - maxy
+    if x1 < x0 or y1 < y0:
+        return None
+    # IFP degenerado (a peça tem exatamente o tamanho da folha) vira um retângulo mínimo
+    return box(x0, y0, max(x1, x0 + NFP_EPSILON), max(y1, y0 + NFP_EPSILON))
+
+
+# Função para listar os vértices da região viável na ordem de varredura (menor y, depois menor x)
+def _candidate_vertices(region):
+    if region.is_empty:
+        return np.empty((0, 2))
+    # A região pode ter várias partes (por exemplo o espaço livre dentro do furo de uma peça)
+    rings = shapely.get_rings(shapely.get_parts(region))
+    coords = shapely.get_coordinates(rings)
+    order = np.lexsort((coords[:, 0], coords[:, 1]))
+    return coords[order]
+
+
+# Função para verificar uma translação candidata com os testes exatos do shapely
+def _fits(candidate, sheet_layout, sheet_bounds, region=None, tol=1e-9):
+    minx, miny, maxx, maxy = candidate.bounds
+    if (minx < sheet_bounds[0] - tol or miny < sheet_bounds[1] - tol
+            or maxx > sheet_bounds[2] + tol or maxy > sheet_bounds[3] + tol):
+        telemetry.count('rejected_outside_sheet')
+        return False
+    if region is not None and not region.contains(candidate):
+        telemetry.count('rejected_outside_sheet')
+        return False
+    if sheet_layout.collides(candidate):
+        telemetry.count('rejected_collision')
+        return False
+    return True
+
+
+# Função para escolher a translação inferior-esquerda viável de `moving`, só entre as de y até `limit`
+def _lowest_position(moving, sheet_layout, sheet_bounds, clearance, cache, region, ifp, limit=np.inf):
+    feasible = ifp
+    if sheet_layout:
+        margin = clearance + NFP_EPSILON + 2 * cache.tolerance
+        # A faixa vai um pouco além do limite: os vértices do recorte ficam acima dele
+        top = limit + 2 * NFP_EPSILON
+        feasible = cache.feasible(moving, sheet_layout, ifp, margin, (tuple(sheet_bounds), region), top)[0]
+    for x, y in _candidate_vertices(feasible):
+        if y > limit:
+            break
+        telemetry.count('candidates')
+        candidate = shapely.transform(moving, lambda c: c + (x, y))
+        if _fits(candidate, sheet_layout, sheet_bounds, region):
+            return x, y
+    if feasible.is_empty and limit == np.inf:
+        telemetry.count('rejected_no_feasible_region')
+    return None
+
+
+def best_nfp_position(moving, current_layout, sheet_bounds, clearance=0, cache=None, region=None):
+    """Encontra a translação inferior-esquerda viável de um polígono já rotacionado.
+
+    Args:
+        moving (shapely.geometry.Polygon): O polígono (já rotacionado) a ser posicionado.
+        current_layout (list | SheetLayout): Peças já posicionadas na folha.
+        sheet_bounds (tuple): (xmin, ymin, xmax, ymax) da região útil da folha.
+        clearance (float): Folga mínima exigida entre as peças.
+        cache (NFPCache): Cache de NFPs; usa o cache global se None.
+        region (sheets.SheetRegion): Região de uma folha irregular, dentro de `sheet_bounds`;
+            a folha é o retângulo `sheet_bounds` se None.
+
+    Returns:
+        tuple: (x, y) da translação, ou None se não houver posição viável.
+    """
+    cache = default_cache if cache is None else cache
+    sheet_layout = as_sheet_layout(current_layout, clearance)
+    ifp = inner_fit_polygon(moving, sheet_bounds) if region is None else region.inner_fit(moving)
+    if ifp is None:
+        telemetry.count('rejected_too_large')
+        return None
+    return _lowest_position(moving, sheet_layout, sheet_bounds, clearance, cache, region, ifp)
+
+
+def find_position_nfp(rotations, current_layout, sheet_bounds, clearance=0, cache=None, region=None):
+    """Escolhe, entre as rotações dadas, a posição inferior-esquerda viável na folha.
+
+    Em caso de empate na posição, vence a rotação que aparece primeiro. Depois
+    que uma rotação encaixa, as seguintes só podem vencer com y até o dela: a
+    região viável delas é calculada só nessa faixa (ver NFPCache.feasible).
+
+    Args:
+        rotations (list): Polígonos candidatos, um por rotação, já corrigidos.
+        current_layout (list | SheetLayout): Peças já posicionadas na folha.
+        sheet_bounds (tuple): (xmin, ymin, xmax, ymax) da região útil da folha.
+        clearance (float): Folga mínima exigida entre as peças.
+        cache (NFPCache): Cache de NFPs; usa o cache global se None.
+        region (sheets.SheetRegion): Região de uma folha irregular (ver best_nfp_position).
+
+    Returns:
+        shapely.geometry.Polygon: O polígono transladado, ou None se não for encontrado encaixe.
+    """
+    cache = default_cache if cache is None else cache
+    sheet_layout = as_sheet_layout(current_layout, clearance)
+    best = None
+    for rotated_poly in rotations:
+        if rotated_poly.is_empty or not rotated_poly.is_valid:
+            continue
+        ifp = inner_fit_polygon(rotated_poly, sheet_bounds) if region is None else region.inner_fit(rotated_poly)
+        if ifp is None:
+            telemetry.count('rejected_too_large')
+            continue
+        limit = np.inf if best is None else best[0][1]
+        position = _lowest_position(rotated_poly, sheet_layout, sheet_bounds, clearance, cache, region, ifp, limit)
+        if position is not None and (best is None or (position[1], position[0]) < (best[0][1], best[0][0])):
+            best = (position, rotated_poly)
+    if best is None:
+        return None
+    (x, y), rotated_poly = best
+    return shapely.transform(rotated_poly, lambda c: c + (x, y))
@@ -0,0 +1,369 @@
+"""
+Otimização metaheurística da sequência e da rotação das peças.
+
+A passada gulosa posiciona as peças uma única vez, na ordem da similaridade
+de forma. Aqui essa ordem é só o ponto de partida: um algoritmo genético
+('genetic') ou um recozimento simulado ('annealing') procura outras
+sequências e rotações iniciais enquanto houver tempo no orçamento.
+
+Cada solução é uma sequência de genes (índice da peça, giro), onde o giro é
+uma rotação prévia de giro * 360 / n_turns graus aplicada antes da busca de
+posição. A decodificação é o próprio empacotamento first-fit em várias
+folhas (bin_packing.pack), e a aptidão vem do número de folhas e da área não
+preenchida da última folha (quanto mais vazia a última, mais cheias as
+outras e mais perto de eliminar uma folha).
+
+A decodificação guarda o estado das folhas a cada `checkpoint` peças,
+indexado pelo prefixo da sequência: soluções que compartilham um prefixo
+(filhos do cruzamento de um ponto, mutações no fim da sequência) só
+reposicionam as peças depois dele. A população é avaliada em paralelo num
+pool de processos, cada um com seu próprio cache de prefixos.
+"""
+import math
+import random
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+
+from shapely.affinity import rotate
+
+from bin_packing import STRATEGIES, PackingResult, pack, turned
+
+METHODS = ('genetic', 'annealing')
+
+# Decodificador usado pelos processos de trabalho (definido pelo inicializador do pool)
+_worker_decoder = None
+
+
+class _RotatedParts:
+    """Peças giradas sob demanda, indexadas pelo gene (índice da peça, giro)."""
+
+    def __init__(self, polygons, n_turns):
+        self.polygons = polygons
+        self.n_turns = n_turns
+        self._rotated = {}
+
+    def __getitem__(self, gene):
+        poly = self._rotated.get(gene)
+        if poly is None:
+            index, turn = gene
+            poly = self.polygons[index]
+            if turn:
+                poly = rotate(poly, turn * 360 / self.n_turns, origin='centroid')
+            self._rotated[gene] = poly
+        return poly
+
+
+class SequenceDecoder:
+    """Transforma uma sequência de genes em folhas, reaproveitando prefixos já decodificados.
+
+    Args:
+        polygons (list): Os polígonos das peças.
+        place (callable): place(poly, sheets) -> (posição em `sheets`, polígono) ou None, como em pack.
+            Precisa ser serializável (pickle) para a avaliação em paralelo.
+        new_sheet (callable): Cria uma folha vazia (SheetLayout).
+        sheet_area (float): Área útil de uma folha.
+        unfilled_area (callable): unfilled_area(sheets) -> lista com a área não preenchida de cada folha
+            (por exemplo calculate_unfilled_area com as dimensões da folha).
+        n_turns (int): Quantidade de giros prévios possíveis por peça.
+        checkpoint (int): A cada quantas peças o estado das folhas é guardado.
+        cache_size (int): Quantidade máxima de prefixos guardados.
+        strategy (str): 'first_fit' ou 'best_fit', a escolha da folha em pack; a ordem
+            é a dos genes, então 'first_fit_decreasing' só vale para a ordem inicial
+            (ver optimize_packing).
+    """
+
+    def __init__(self, polygons, place, new_sheet, sheet_area, unfilled_area, n_turns=8,
+                 checkpoint=4, cache_size=1024, strategy='first_fit'):
+        if strategy not in ('first_fit', 'best_fit'):
+            raise ValueError(f"Unsupported packing strategy {strategy!r} for the decoder; "
+                             f"expected 'first_fit' or 'best_fit'")
+        self.parts = _RotatedParts(polygons, n_turns)
+        self.strategy = strategy
+        self.place = place
+        self.new_sheet = new_sheet
+        self.sheet_area = sheet_area
+        self.unfilled_area = unfilled_area
+        self.checkpoint = checkpoint
+        self.cache_size = cache_size
+        self._prefixes = OrderedDict()
+        self.reused = 0  # peças cujo posicionamento veio do cache de prefixos
+
+    def _restore(self, genes):
+        """Reconstrói o empacotamento do maior prefixo guardado de `genes`."""
+        for length in range(len(genes) // self.checkpoint * self.checkpoint, 0, -self.checkpoint):
+            saved = self._prefixes.get(genes[:length])
+            if saved is None:
+                continue
+            self._prefixes.move_to_end(genes[:length])
+            placements, unplaced = saved
+            result = PackingResult()
+            for gene, sheet_index, placed, _ in placements:
+                if sheet_index == len(result.sheets):
+                    result.sheets.append(self.new_sheet())
+                    result.free_areas.append(self.sheet_area)
+                result.sheets[sheet_index].append(placed)
+                result.free_areas[sheet_index] -= placed.area
+            result.placements = list(placements)
+            result.unplaced = list(unplaced)
+            self.reused += length
+            return length, result
+        return 0, PackingResult()
+
+    def decode(self, genes):
+        """Empacota as peças na ordem e com os giros dados.
+
+        Returns:
+            PackingResult: Com os genes (índice, giro) no lugar dos índices das peças.
+        """
+        genes = tuple(genes)
+        start, result = self._restore(genes)
+        for position in range(start, len(genes)):
+            pack(self.parts, [genes[position]], self.place, self.new_sheet, self.sheet_area,
+                 strategy=self.strategy, result=result)
+            length = position + 1
+            if length % self.checkpoint == 0 and genes[:length] not in self._prefixes:
+                self._prefixes[genes[:length]] = (tuple(result.placements), tuple(result.unplaced))
+                if len(self._prefixes) > self.cache_size:
+                    self._prefixes.popitem(last=False)
+        return result
+
+    def fitness(self, result):
+        """Aptidão (menor é melhor) de um empacotamento.
+
+        A parte inteira é o número de folhas menos um (peças que não couberam
+        pesam mais que qualquer folha); a fração é o quanto a última folha está
+        preenchida, pela área não preenchida de unfilled_area.
+        """
+        penalty = len(result.unplaced) * (len(self.parts.polygons) + 1)
+        if not result.sheets:
+            return float(penalty)
+        empty = self.unfilled_area([[]])[0]
+        last_fill = 1 - self.unfilled_area(result.sheets[-1:])[0] / empty
+        return penalty + len(result.sheets) - 1 + last_fill
+
+    def evaluate(self, genes):
+        return self.fitness(self.decode(genes))
+
+
+def _init_worker(decoder):
+    global _worker_decoder
+    _worker_decoder = decoder
+
+
+def _evaluate_task(genes):
+    return _worker_decoder.evaluate(genes)
+
+
+class OptimizationResult:
+    """Melhor solução encontrada pelo otimizador.
+
+    Attributes:
+        genes (tuple): Sequência de (índice da peça, giro).
+        fitness (float): Aptidão da solução (ver SequenceDecoder.fitness).
+        packing (PackingResult): O empacotamento da solução, com os índices das peças.
+        evaluations (int): Quantidade de soluções avaliadas.
+        iterations (int): Gerações (genético) ou passos (recozimento) executados.
+        history (list): Aptidão da melhor solução ao fim de cada iteração.
+    """
+
+    def __init__(self, genes, fitness, packing, evaluations, iterations, history):
+        self.genes = genes
+        self.fitness = fitness
+        self.packing = packing
+        self.evaluations = evaluations
+        self.iterations = iterations
+        self.history = history
+
+
+class _Evaluator:
+    """Avalia lotes de soluções (em série ou no pool), sem repetir soluções já vistas.
+
+    Soluções que não chegam a ser avaliadas antes do prazo recebem aptidão infinita.
+    """
+
+    def __init__(self, decoder, workers, deadline=None):
+        self.decoder = decoder
+        self.deadline = deadline
+        self.executor = None
+        if workers > 1:
+            self.executor = ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(decoder,))
+        self.known = {}
+
+    def expired(self):
+        return self.deadline is not None and time.monotonic() >= self.deadline
+
+    def __call__(self, batch):
+        pending = list(dict.fromkeys(genes for genes in batch if genes not in self.known))
+        if self.executor is not None and len(pending) > 1:
+            futures = [self.executor.submit(_evaluate_task, genes) for genes in pending]
+            for genes, future in zip(pending, futures):
+                timeout = None if self.deadline is None else max(0, self.deadline - time.monotonic())
+                try:
+                    self.known[genes] = future.result(timeout)
+                except TimeoutError:
+                    # Prazo esgotado: descarta o que ainda não começou e espera o que já está rodando
+                    if future.cancel():
+                        continue
+                    self.known[genes] = future.result()
+        else:
+            for genes in pending:
+                if self.expired() and self.known:
+                    break
+                self.known[genes] = self.decoder.evaluate(genes)
+        return [self.known.get(genes, math.inf) for genes in batch]
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+
+
+# Funções de variação sobre uma solução (ordem das peças, giro de cada peça)
+def _genes(order, turns):
+    return tuple((index, turns[index]) for index in order)
+
+
+def _mutate(order, turns, n_turns, rng):
+    if not order:
+        return order, turns
+    order, turns = list(order), list(turns)
+    move = rng.random()
+    i, j = sorted(rng.sample(range(len(order)), 2)) if len(order) > 1 else (0, 0)
+    if move < 0.4:
+        order[i], order[j] = order[j], order[i]
+    elif move < 0.7:
+        order.insert(j, order.pop(i))
+    else:
+        index = rng.choice(order)
+        turns[index] = rng.randrange(n_turns)
+    return tuple(order), tuple(turns)
+
+
+def _crossover(parent_a, parent_b, rng):
+    # Cruzamento de um ponto para permutações: o prefixo de A (que reaproveita o cache
+    # de prefixos) seguido das peças restantes na ordem em que aparecem em B
+    (order_a, turns_a), (order_b, turns_b) = parent_a, parent_b
+    cut = rng.randrange(1, len(order_a)) if len(order_a) > 1 else len(order_a)
+    head = order_a[:cut]
+    taken = set(head)
+    order = head + tuple(index for index in order_b if index not in taken)
+    turns = tuple(ta if rng.random() < 0.5 else tb for ta, tb in zip(turns_a, turns_b))
+    return order, turns
+
+
+def optimize_packing(polygons, order, place, new_sheet, sheet_area, unfilled_area, method='genetic',
+                     time_budget=30, max_iterations=None, population_size=16, elite=2, mutation_rate=0.3,
+                     initial_temperature=0.5, n_turns=8, workers=1, seed=0, checkpoint=4, strategy='first_fit'):
+    """Procura a sequência e os giros das peças que usam menos folhas.
+
+    A ordem dada (por exemplo a da similaridade de forma) sem giros é sempre
+    avaliada primeiro, então o resultado nunca é pior que o da passada gulosa.
+
+    Args:
+        polygons (list): Os polígonos das peças.
+        order (list): Índices das peças na ordem inicial.
+        place, new_sheet, sheet_area, unfilled_area: Como em SequenceDecoder.
+        method (str): 'genetic' ou 'annealing'.
+        time_budget (float): Tempo máximo em segundos (None para limitar só por max_iterations).
+        max_iterations (int): Gerações (genético) ou passos (recozimento); None para limitar só pelo tempo.
+        population_size (int): Tamanho da população (genético) ou vizinhos avaliados por passo (recozimento).
+        elite (int): Melhores soluções copiadas sem alteração para a próxima geração.
+        mutation_rate (float): Probabilidade de mutação de cada filho.
+        initial_temperature (float): Temperatura inicial do recozimento, em frações de folha.
+        n_turns (int): Quantidade de giros prévios possíveis por peça.
+        workers (int): Processos para avaliar a população em paralelo.
+        seed (int): Semente do gerador aleatório.
+        checkpoint (int): A cada quantas peças o estado das folhas é guardado para reaproveitar prefixos.
+        strategy (str): Uma das bin_packing.STRATEGIES; com 'first_fit_decreasing' a ordem
+            inicial é ordenada por área decrescente e as peças entram como em 'first_fit'.
+
+    Returns:
+        OptimizationResult: A melhor solução encontrada.
+    """
+    if method not in METHODS:
+        raise ValueError(f"Unknown optimization method {method!r}; expected one of {METHODS}")
+    if time_budget is None and max_iterations is None:
+        raise ValueError("Either time_budget or max_iterations must be given")
+
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Unknown packing strategy {strategy!r}; expected one of {STRATEGIES}")
+    if strategy == 'first_fit_decreasing':
+        areas = polygons.areas if hasattr(polygons, 'areas') else [poly.area for poly in polygons]
+        order = sorted(order, key=lambda index: -areas[index])
+        strategy = 'first_fit'
+
+    rng = random.Random(seed)
+    decoder = SequenceDecoder(polygons, place, new_sheet, sheet_area, unfilled_area, n_turns, checkpoint,
+                              strategy=strategy)
+    start = time.monotonic()
+    evaluate = _Evaluator(decoder, workers, None if time_budget is None else start + time_budget)
+
+    def running(iteration):
+        if max_iterations is not None and iteration >= max_iterations:
+            return False
+        return time_budget is None or time.monotonic() - start < time_budget
+
+    def progress(iteration):
+        fractions = []
+        if time_budget:
+            fractions.append((time.monotonic() - start) / time_budget)
+        if max_iterations:
+            fractions.append(iteration / max_iterations)
+        return min(1.0, max(fractions))
+
+    seed_solution = (tuple(order), (0,) * len(polygons))
+    best = seed_solution
+    best_fitness, = evaluate([_genes(*seed_solution)])
+    history = []
+    iteration = 0
+    try:
+        if method == 'genetic':
+            population = [seed_solution] + [_mutate(*seed_solution, n_turns, rng)
+                                            for _ in range(population_size - 1)]
+            scores = evaluate([_genes(*solution) for solution in population])
+            while running(iteration):
+                ranked = [population[i] for i in sorted(range(len(population)), key=scores.__getitem__)]
+
+                # Seleção por torneio entre dois indivíduos
+                def select():
+                    a, b = rng.sample(range(len(ranked)), 2)
+                    return ranked[min(a, b)]
+
+                children = ranked[:elite]
+                while len(children) < population_size:
+                    child = _crossover(select(), select(), rng)
+                    if rng.random() < mutation_rate:
+                        child = _mutate(*child, n_turns, rng)
+                    children.append(child)
+                population = children
+                scores = evaluate([_genes(*solution) for solution in population])
+                iteration += 1
+                generation_best = min(range(len(population)), key=scores.__getitem__)
+                if scores[generation_best] < best_fitness:
+                    best, best_fitness = population[generation_best], scores[generation_best]
+                history.append(best_fitness)
+        else:
+            current, current_fitness = best, best_fitness
+            while running(iteration):
+                temperature = initial_temperature * (1 - progress(iteration)) + 1e-9
+                # Avalia um lote de vizinhos de uma vez (em paralelo) e segue com o melhor deles
+                neighbours = [_mutate(*current, n_turns, rng) for _ in range(max(1, min(workers, population_size)))]
+                scores = evaluate([_genes(*solution) for solution in neighbours])
+                chosen = min(range(len(neighbours)), key=scores.__getitem__)
+                delta = scores[chosen] - current_fitness
+                if delta <= 0 or rng.random() < math.exp(-delta / temperature):
+                    current, current_fitness = neighbours[chosen], scores[chosen]
+                    if current_fitness < best_fitness:
+                        best, best_fitness = current, current_fitness
+                iteration += 1
+                history.append(best_fitness)
+    finally:
+        evaluate.close()
+
+    # Decodifica a melhor solução e volta para os índices das peças (com o giro prévio nas transformações)
+    packing = decoder.decode(_genes(*best))
+    packing.placements = [(gene[0], sheet_index, placed,
+                           turned(transform, gene[1] * 360 / n_turns, polygons[gene[0]].centroid.coords[0]))
+                          for gene, sheet_index, placed, transform in packing.placements]
+    packing.unplaced = [gene[0] for gene in packing.unplaced]
+    return OptimizationResult(_genes(*best), best_fitness, packing, len(evaluate.known), iteration, history)
@@ -0,0 +1,275 @@
+"""
+Estágio de ordenação das peças por similaridade de forma.
+
+Substitui a comparação fastdtw de todos os pares por métodos plugáveis:
+
+- 'fastdtw': o método original (fastdtw em todos os pares), mantido como referência;
+- 'dtw': DTW vetorizado com NumPy sobre contornos reamostrados com tamanho fixo,
+  com banda de Sakoe-Chiba, poda por limite inferior LB_Keogh e abandono antecipado
+  (k vizinhos mais próximos), com as distâncias numa matriz condensada e, se pedido,
+  num cache em disco (ver similarity.py);
+- 'fourier': descritores de Fourier invariantes à rotação e ao ponto inicial,
+  indexados numa k-d tree (tempo quase linear no número de peças).
+
+Todos retornam a mesma estrutura de order_pieces_by_dtw: uma lista de pares de
+índices em ordem crescente de distância. Toda peça aparece ao menos uma vez
+(peças sem par entram no fim como tuplas de um elemento); a lista para no par
+em que a última peça aparece, porque só a primeira aparição de cada peça
+define a ordem de posicionamento.
+"""
+import numpy as np
+from fastdtw import fastdtw
+from scipy.spatial import cKDTree
+from scipy.spatial.distance import euclidean
+from shapely.geometry.polygon import orient
+
+import telemetry
+from similarity import CondensedMatrix, cover_pairs, iter_ordered_pairs
+
+
+# Função para reamostrar o contorno de um polígono em n_points pontos igualmente espaçados
+def resample_contour(polygon, n_points=64):
+    return resample_ring(np.asarray(orient(polygon).exterior.coords), n_points)
+
+
+# Função para reamostrar um anel fechado (array de coordenadas, já no sentido anti-horário)
+def resample_ring(coords, n_points=64):
+    lengths = np.hypot(*np.diff(coords, axis=0).T)
+    s = np.concatenate([[0], np.cumsum(lengths)])
+    t = np.linspace(0, s[-1], n_points, endpoint=False)
+    return np.column_stack([np.interp(t, s, coords[:, 0]), np.interp(t, s, coords[:, 1])])
+
+
+# Função para montar a lista final de pares, garantindo que todas as peças apareçam
+def _ordered_pairs(pairs, distances, n):
+    return cover_pairs(iter_ordered_pairs(pairs, distances), n)
+
+
+def order_by_fastdtw(polygons):
+    """Ordenação original: fastdtw (distância euclidiana) entre todos os pares de contornos."""
+    temporal_series = [list(zip(*poly.exterior.coords.xy)) for poly in polygons]
+    pairs, distances = [], []
+    for i, ts1 in enumerate(temporal_series):
+        for j, ts2 in enumerate(temporal_series[i+1:], i+1):
+            distance, _ = fastdtw(ts1, ts2, dist=euclidean)
+            pairs.append((i, j))
+            distances.append(distance)
+    return _ordered_pairs(pairs, distances, len(polygons))
+
+
+def dtw_distances(a, b, window=None, thresholds=None):
+    """DTW entre pares de séries de mesmo tamanho, calculado para todos os pares de uma vez.
+
+    A matriz acumulada é percorrida linha a linha, só dentro da banda. Com
+    `thresholds`, um par é abandonado assim que o menor valor acumulado da linha
+    passa do seu limite: todo caminho cruza a linha e os custos não são
+    negativos, então a distância final também passaria.
+
+    Args:
+        a (numpy.ndarray): Séries (P, L, 2).
+        b (numpy.ndarray): Séries (P, L, 2) a comparar com as de `a`, par a par.
+        window (int): Largura da banda de Sakoe-Chiba; None para DTW sem restrição.
+        thresholds (numpy.ndarray): Limite de cada par; None para calcular todos até o fim.
+
+    Returns:
+        numpy.ndarray: As P distâncias DTW (inf nos pares abandonados).
+    """
+    n_pairs, length, _ = a.shape
+    window = length if window is None else window
+    distances = np.full(n_pairs, np.inf)
+    active = np.arange(n_pairs)
+    previous = np.full((n_pairs, length + 1), np.inf)
+    previous[:, 0] = 0
+    for i in range(1, length + 1):
+        low, high = max(1, i - window), min(length, i + window)
+        cost = np.linalg.norm(a[active, i - 1, None] - b[active, low - 1:high], axis=-1)
+        from_previous = np.minimum(previous[:, low - 1:high], previous[:, low:high + 1])
+        current = np.full((len(active), length + 1), np.inf)
+        for j in range(low, high + 1):
+            current[:, j] = cost[:, j - low] + np.minimum(from_previous[:, j - low], current[:, j - 1])
+        if thresholds is not None:
+            alive = current[:, low:high + 1].min(axis=1) <= thresholds[active]
+            if not alive.all():
+                telemetry.count('dtw_abandoned', int(np.count_nonzero(~alive)))
+                current, active = current[alive], active[alive]
+        previous = current
+        if not len(active):
+            break
+    distances[active] = previous[:, length]
+    return distances
+
+
+# Função para calcular os envelopes (mínimo e máximo por coordenada) dentro da banda
+def _envelopes(series, window):
+    padded_lo = np.pad(series, ((0, 0), (window, window), (0, 0)), constant_values=np.inf)
+    padded_hi = np.pad(series, ((0, 0), (window, window), (0, 0)), constant_values=-np.inf)
+    views_lo = np.lib.stride_tricks.sliding_window_view(padded_lo, 2 * window + 1, axis=1)
+    views_hi = np.lib.stride_tricks.sliding_window_view(padded_hi, 2 * window + 1, axis=1)
+    return views_lo.min(axis=-1), views_hi.max(axis=-1)
+
+
+def lb_keogh(queries, lower, upper):
+    """Limite inferior LB_Keogh da DTW (com banda) entre cada consulta e cada envelope.
+
+    Returns:
+        numpy.ndarray: Matriz (len(queries), len(lower)) de limites inferiores.
+    """
+    excess = (np.maximum(lower[None] - queries[:, None], 0)
+              + np.maximum(queries[:, None] - upper[None], 0))
+    return np.linalg.norm(excess, axis=-1).sum(axis=-1)
+
+
+def order_by_dtw(polygons, n_points=64, window=None, neighbours=4, chunk_size=256, cache=None):
+    """Ordenação por DTW vetorizado entre os k vizinhos mais próximos de cada peça.
+
+    LB_Keogh é calculado para todos os pares; a DTW exata só é calculada para os
+    pares cujo limite inferior ainda pode colocá-los entre os `neighbours` mais
+    próximos de uma das duas peças, e é abandonada assim que passa do k-ésimo
+    vizinho já conhecido das duas. Limites e distâncias ficam em matrizes
+    condensadas float32.
+
+    Args:
+        polygons (list): Os polígonos a ordenar.
+        n_points (int): Pontos por contorno após a reamostragem.
+        window (int): Largura da banda de Sakoe-Chiba (padrão: 10% de n_points).
+        neighbours (int): Quantidade de vizinhos mantidos por peça.
+        chunk_size (int): Peças por bloco no cálculo de LB_Keogh, e pares por bloco na DTW com abandono.
+        cache (similarity.DistanceCache): Cache em disco das distâncias exatas; None para não usar.
+    """
+    n = len(polygons)
+    if n < 2:
+        return _ordered_pairs([], [], n)
+    window = max(1, n_points // 10) if window is None else window
+    k = min(neighbours, n - 1)
+    series = contour_series(polygons, n_points)
+    lower, upper = _envelopes(series, window)
+
+    # Limites inferiores de todos os pares, bloco a bloco; a DTW é simétrica, então vale o maior dos dois
+    lb = CondensedMatrix(n, fill=0)
+    for start in range(0, n, chunk_size):
+        stop = min(n, start + chunk_size)
+        block = lb_keogh(series[start:stop], lower, upper)
+        for i in range(start, stop):
+            after, before = lb.row_slice(i), lb.index(np.arange(i), i)
+            lb.values[after] = np.maximum(lb.values[after], block[i - start, i + 1:])
+            lb.values[before] = np.maximum(lb.values[before], block[i - start, :i])
+
+    distances = CondensedMatrix(n)
+    keys = cache.part_keys(series) if cache is not None else None
+    params = (n_points, window)
+
+    def compute(rows, cols, thresholds=None):
+        found = np.full(len(rows), np.nan)
+        if cache is not None:
+            found = cache.lookup(params, [keys[i] for i in rows], [keys[j] for j in cols])
+        missing = np.flatnonzero(np.isnan(found))
+        if len(missing):
+            found[missing] = dtw_distances(series[rows[missing]], series[cols[missing]], window,
+                                           None if thresholds is None else thresholds[missing])
+            if cache is not None:
+                cache.store(params, [keys[i] for i in rows[missing]], [keys[j] for j in cols[missing]],
+                            found[missing])
+        distances.set_pairs(rows, cols, found)
+
+    def kth_nearest(i):
+        return np.partition(distances.row(i), k - 1)[k - 1]
+
+    # 1) DTW exata para os k menores limites inferiores de cada peça
+    candidates = {(min(i, j), max(i, j)) for i in range(n)
+                  for j in np.argsort(lb.row(i), kind='stable')[:k].tolist()}
+    rows, cols = np.array(sorted(candidates)).T
+    compute(rows, cols)
+    kth = np.array([kth_nearest(i) for i in range(n)])
+
+    # 2) Os pares cujo limite inferior fica abaixo do k-ésimo vizinho de uma das peças, em ordem
+    #    crescente de limite; o k-ésimo vizinho só diminui, então os limites de abandono vão apertando
+    rows, cols = [], []
+    for i in range(n - 1):
+        row = lb.row_slice(i)
+        others = np.flatnonzero((lb.values[row] < np.maximum(kth[i], kth[i + 1:]))
+                                & np.isinf(distances.values[row])) + i + 1
+        rows.append(np.full(len(others), i))
+        cols.append(others)
+    rows, cols = np.concatenate(rows), np.concatenate(cols)
+    order = np.argsort(lb.values[lb.index(rows, cols)], kind='stable')
+    rows, cols = rows[order], cols[order]
+    for start in range(0, len(rows), chunk_size):
+        chunk_rows, chunk_cols = rows[start:start + chunk_size], cols[start:start + chunk_size]
+        thresholds = np.maximum(kth[chunk_rows], kth[chunk_cols])
+        relevant = lb.values[lb.index(chunk_rows, chunk_cols)] < thresholds
+        if relevant.any():
+            compute(chunk_rows[relevant], chunk_cols[relevant], thresholds[relevant])
+            for i in np.unique(np.concatenate([chunk_rows[relevant], chunk_cols[relevant]])):
+                kth[i] = kth_nearest(i)
+    if cache is not None:
+        cache.flush()
+    return cover_pairs(distances.ordered_pairs(), n)
+
+
+def fourier_descriptors(polygon, n_points=64, n_coefficients=8):
+    """Descritor de Fourier do contorno, invariante à translação, rotação e ponto inicial.
+
+    As magnitudes não são normalizadas pela escala: peças de tamanhos diferentes
+    continuam distantes, como na comparação DTW das coordenadas.
+    """
+    return descriptors_from_contours(resample_contour(polygon, n_points)[None], n_coefficients)[0]
+
+
+def descriptors_from_contours(contours, n_coefficients=8):
+    """Descritores de Fourier (como em fourier_descriptors) de contornos já reamostrados (P, L, 2)."""
+    n_points = contours.shape[1]
+    spectrum = np.fft.fft(contours[:, :, 0] + 1j * contours[:, :, 1], axis=1) / n_points
+    return np.abs(np.concatenate([spectrum[:, 1:n_coefficients + 1], spectrum[:, -n_coefficients:]], axis=1))
+
+
+def contour_series(polygons, n_points=64):
+    """Contornos reamostrados (P, n_points, 2) das peças.
+
+    Um PartStore (ver part_store.py) fornece os contornos direto das suas colunas,
+    sem montar os polígonos do shapely.
+    """
+    if hasattr(polygons, 'series'):
+        return polygons.series(n_points)
+    return np.stack([resample_contour(poly, n_points) for poly in polygons])
+
+
+def order_by_fourier(polygons, n_points=64, n_coefficients=8, neighbours=4):
+    """Ordenação pelos vizinhos mais próximos no espaço de descritores de Fourier (k-d tree)."""
+    n = len(polygons)
+    if n < 2:
+        return _ordered_pairs([], [], n)
+    descriptors = descriptors_from_contours(contour_series(polygons, n_points), n_coefficients)
+    k = min(neighbours, n - 1)
+    distances, indices = cKDTree(descriptors).query(descriptors, k=k + 1)
+    best = {}
+    for i in range(n):
+        for d, j in zip(distances[i], indices[i]):
+            if j != i:
+                pair = (min(i, j), max(i, j))
+                best[pair] = d
+    pairs = sorted(best)
+    return _ordered_pairs(pairs, [best[p] for p in pairs], n)
+
+
+# Métodos de ordenação disponíveis; novos métodos podem ser registrados aqui
+ORDERING_METHODS = {
+    'fastdtw': order_by_fastdtw,
+    'dtw': order_by_dtw,
+    'fourier': order_by_fourier,
+}
+
+
+def order_pieces(polygons, method='fourier', **options):
+    """Ordena as peças por similaridade de forma com o método escolhido.
+
+    Args:
+        polygons (list): Os polígonos a ordenar.
+        method (str): Nome de um método em ORDERING_METHODS.
+        **options: Parâmetros repassados ao método.
+
+    Returns:
+        list: Pares (ou tuplas unitárias) de índices, na ordem em que devem ser posicionados.
+    """
+    if method not in ORDERING_METHODS:
+        raise ValueError(f"Unknown ordering method {method!r}; expected one of {sorted(ORDERING_METHODS)}")
+    return ORDERING_METHODS[method](polygons, **options)
@@ -0,0 +1,194 @@
+"""
+Busca paralela de posições: rotações e folhas avaliadas num pool de processos.
+
+Cada combinação (folha, rotação) vira uma tarefa independente. A geometria
+vai para os processos como WKB; cada processo guarda as folhas que já
+reconstruiu (com o índice espacial e o cache de NFPs aquecidos). Cada processo
+tem a sua fila, e o processo principal lembra quantas peças de cada folha já
+mandou para cada um: como as folhas só crescem por append, uma tarefa leva só
+as peças depois dessas. O processo principal também só serializa as peças
+que algum processo ainda não tem; a folha inteira só é serializada de novo
+se o processo a descartou (limite de WORKER_SHEET_LIMIT).
+
+As folhas são avaliadas em ordem, em levas com tarefas suficientes para ocupar
+o pool; a primeira leva com alguma posição viável encerra a busca, porque a
+folha de menor índice sempre vence. Dentro da leva vence a de menor chave, com
+desempate determinístico independente da ordem em que as tarefas terminam.
+"""
+import os
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import shapely
+from shapely.geometry import box
+
+from batch_placement import first_fit_batch
+from nfp import best_nfp_position
+from raster_placement import find_position_raster
+from spatial_index import SheetLayout, as_sheet_layout
+
+# Folhas reconstruídas neste processo, pelo uid da folha no processo principal
+_worker_sheets = OrderedDict()
+WORKER_SHEET_LIMIT = 64
+
+# Resposta de uma tarefa cujo processo não tem as primeiras peças da folha
+STALE = 'stale'
+
+
+# Função para obter (ou atualizar) a cópia local de uma folha dentro do processo de trabalho;
+# `parts_wkb` são as peças da folha a partir da posição `start`
+def _worker_sheet(uid, clearance, start, parts_wkb):
+    sheet = _worker_sheets.get(uid)
+    if sheet is None or sheet.clearance != clearance or len(sheet) != start:
+        if start:
+            return None
+        sheet = SheetLayout(clearance)
+    # As folhas só crescem por append: basta acrescentar as peças novas
+    for poly in shapely.from_wkb(parts_wkb):
+        sheet.append(poly)
+    _worker_sheets[uid] = sheet
+    _worker_sheets.move_to_end(uid)
+    if len(_worker_sheets) > WORKER_SHEET_LIMIT:
+        _worker_sheets.popitem(last=False)
+    return sheet
+
+
+def _search_task(task):
+    """Procura a posição de uma rotação em uma folha (executado nos processos de trabalho).
+
+    Returns:
+        tuple: (chave de desempate, WKB do polígono posicionado), None, ou STALE se
+        o processo não tem as peças da folha antes de `start`.
+    """
+    (engine, sheet_index, rotation_index, rotated_wkb, uid, start, parts_wkb,
+     sheet_size, margin, clearance, step, on_invalid) = task
+    sheet = _worker_sheet(uid, clearance, start, parts_wkb)
+    if sheet is None:
+        return STALE
+    moving = shapely.from_wkb(rotated_wkb)
+    width, height = sheet_size
+
+    if engine == 'nfp':
+        position = best_nfp_position(moving, sheet, (margin, margin, width - margin, height - margin), clearance)
+        if position is None:
+            return None
+        x, y = position
+        placed = shapely.transform(moving, lambda c: c + (x, y))
+        # Mesma regra de find_position_nfp: menor y, depois menor x, depois a primeira rotação
+        return (sheet_index, y, x, rotation_index), placed.wkb
+
+    if engine == 'raster':
+        # `step` é o tamanho das células; mesma regra de desempate do NFP
+        placed = find_position_raster([moving], sheet, (margin, margin, width - margin, height - margin),
+                                      clearance, step)
+        if placed is None:
+            return None
+        x, y = placed.bounds[:2]
+        return (sheet_index, y, x, rotation_index), placed.wkb
+
+    xs = np.arange(margin, width - moving.bounds[2] - margin, step)
+    ys = np.arange(margin, height - moving.bounds[3] - margin, step)
+    placed = first_fit_batch(moving, sheet, box(0, 0, width, height), xs, ys, clearance, on_invalid)
+    if placed is None:
+        return None
+    # First-fit: a primeira rotação (na ordem dada) que encaixa vence, como na varredura serial
+    return (sheet_index, rotation_index), placed.wkb
+
+
+class ParallelPlacer:
+    """Pool de processos para avaliar rotações e folhas candidatas em paralelo.
+
+    Args:
+        max_workers (int): Quantidade de processos; usa todos os núcleos se None.
+    """
+
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers or os.cpu_count()
+        # Um executor de um processo por trabalhador: as tarefas de cada um seguem a ordem de envio
+        self._executors = [ProcessPoolExecutor(1) for _ in range(self.max_workers)]
+        self._sent = [OrderedDict() for _ in self._executors]  # uid -> peças já enviadas a cada processo
+        self._next = 0
+
+    # Função para obter as peças da folha que ainda faltam em algum processo: (primeira posição, WKB)
+    def _unsent(self, sheet):
+        base = min(sent.get(sheet.uid, 0) for sent in self._sent)
+        return base, shapely.to_wkb(np.asarray(sheet.polygons[base:], dtype=object))
+
+    # Função para enviar uma tarefa ao próximo processo, com só as peças da folha que ele ainda não tem;
+    # `tail_wkb` são as peças a partir da posição `base` (ver _unsent)
+    def _submit(self, sheet, base, tail_wkb, task):
+        worker = self._next
+        self._next = (worker + 1) % len(self._executors)
+        sent = self._sent[worker]
+        start = sent.get(sheet.uid, 0)
+        if start < base:
+            # O processo perdeu a folha (reenvio após STALE, ou registro descartado): serializa o que falta
+            parts_wkb = shapely.to_wkb(np.asarray(sheet.polygons[start:], dtype=object))
+        else:
+            parts_wkb = tail_wkb[start - base:]
+        sent[sheet.uid] = len(sheet)
+        sent.move_to_end(sheet.uid)
+        if len(sent) > WORKER_SHEET_LIMIT:
+            sent.popitem(last=False)
+        return worker, self._executors[worker].submit(_search_task, task[:5] + (start, parts_wkb) + task[5:])
+
+    def find_position(self, rotations, sheets, sheet_size, engine='nfp', margin=0, clearance=0,
+                      step=None, on_invalid='repair'):
+        """Encontra a melhor posição viável entre todas as rotações e folhas dadas.
+
+        Args:
+            rotations (list): Polígonos candidatos, um por rotação, já corrigidos.
+            sheets (list): Folhas candidatas (SheetLayout ou listas de polígonos).
+            sheet_size (tuple): (largura, altura) das folhas.
+            engine (str): 'nfp' ou 'raster' (menor y, depois x) ou 'batch'/'grid' (first-fit em grade).
+            margin (float): Margem entre as peças e a borda da folha (e origem da grade).
+            clearance (float): Folga mínima exigida entre as peças.
+            step (float): Passo da grade, para os motores em grade; tamanho das células, para 'raster'.
+            on_invalid (str): Tratamento de candidatas inválidas na grade (ver first_fit_batch).
+
+        Returns:
+            tuple: (índice da folha, polígono posicionado), ou None se não houver encaixe.
+        """
+        if engine in ('nfp', 'raster'):
+            rotations = [poly for poly in rotations if not poly.is_empty and poly.is_valid]
+        sheets = [as_sheet_layout(sheet, clearance) for sheet in sheets]
+        if not rotations or not sheets:
+            return None
+        rotations_wkb = shapely.to_wkb(np.asarray(rotations, dtype=object))
+        # Folhas por leva: o bastante para ocupar todos os processos
+        per_wave = -(-self.max_workers // len(rotations))
+        for first in range(0, len(sheets), per_wave):
+            pending = []
+            for sheet_index in range(first, min(first + per_wave, len(sheets))):
+                sheet = sheets[sheet_index]
+                base, tail_wkb = self._unsent(sheet)
+                for rotation_index, rotated_wkb in enumerate(rotations_wkb):
+                    task = (engine, sheet_index, rotation_index, rotated_wkb, sheet.uid,
+                            sheet_size, margin, clearance, step, on_invalid)
+                    pending.append((sheet, task, self._submit(sheet, base, tail_wkb, task)))
+
+            results = []
+            for sheet, task, (worker, future) in pending:
+                result = future.result()
+                if result == STALE:
+                    # O processo descartou a folha: manda de novo a folha inteira
+                    self._sent[worker].pop(sheet.uid, None)
+                    self._next = worker
+                    result = self._submit(sheet, len(sheet), (), task)[1].result()
+                if result is not None:
+                    results.append(result)
+            if results:
+                key, placed_wkb = min(results, key=lambda result: result[0])
+                return key[0], shapely.from_wkb(placed_wkb)
+        return None
+
+    def close(self):
+        for executor in self._executors:
+            executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
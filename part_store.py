@@ -0,0 +1,200 @@
+"""
+Armazenamento colunar das peças.
+
+Em vez de uma lista de objetos Polygon do shapely (e de listas de tuplas e
+dicionários derivados deles), as peças ficam em arrays contíguos:
+
+- `coords`: todas as coordenadas (float64, (n, 2)), anel após anel, no mesmo
+  formato de shapely.to_ragged_array (cada anel repete o primeiro ponto);
+- `ring_offsets`: início de cada anel em `coords` (mais o fim do último);
+- `part_offsets`: primeiro anel de cada peça (o contorno externo, seguido
+  dos furos) em `ring_offsets` (mais o fim da última);
+- `bounds` e `areas`: bounding box e área de cada peça;
+- colunas derivadas (contornos reamostrados e descritores de Fourier usados
+  pela ordenação), calculadas na primeira vez que são pedidas.
+
+O PartStore pode ser usado no lugar da lista de polígonos (len, iteração e
+indexação): os polígonos são montados todos de uma vez, com uma chamada
+vetorizada (shapely.from_ragged_array), na primeira vez que são pedidos, e
+reaproveitados daí em diante. As colunas podem vir direto dos .npz do cache
+de geometria (from_columns), sem passar por uma lista de polígonos; as
+bounding boxes e as áreas são calculadas das próprias colunas. A ordenação
+(ordering.contour_series) lê os contornos direto das colunas. As colunas
+podem ser gravadas numa pasta (um .npy por coluna) e abertas com
+memory-map, para trabalhos grandes ou para vários processos lerem as
+mesmas peças sem cópia.
+
+Exemplo:
+    store = load_part_store('components_svg')  # colunas do cache de geometria
+    order = order_pieces(store, 'fourier')
+    store.save('pecas.store')
+    store = PartStore.load('pecas.store')  # memory-mapped
+"""
+import os
+
+import numpy as np
+import shapely
+
+from ordering import descriptors_from_contours, resample_ring
+
+# Colunas gravadas por save (as derivadas entram com o nome e os parâmetros)
+COLUMNS = ('coords', 'ring_offsets', 'part_offsets', 'bounds', 'areas')
+
+
+class PartStore:
+    """Peças em arrays contíguos, com os polígonos do shapely montados uma vez, sob demanda.
+
+    Args:
+        coords (numpy.ndarray): Coordenadas (n, 2) de todos os anéis.
+        ring_offsets (numpy.ndarray): Início de cada anel em `coords`, mais o fim do último.
+        part_offsets (numpy.ndarray): Primeiro anel de cada peça, mais o fim da última.
+        bounds (numpy.ndarray): Bounding box (P, 4) de cada peça; calculada se None.
+        areas (numpy.ndarray): Área de cada peça; calculada se None.
+    """
+
+    def __init__(self, coords, ring_offsets, part_offsets, bounds=None, areas=None):
+        self.coords = coords
+        self.ring_offsets = ring_offsets
+        self.part_offsets = part_offsets
+        self._geometries = None  # polígonos montados na primeira vez que são pedidos
+        self.bounds = self._column_bounds() if bounds is None else bounds
+        self.areas = self._column_areas() if areas is None else areas
+        self._derived = {}  # (nome, parâmetros) -> coluna derivada
+
+    def _column_bounds(self):
+        """Bounding box de cada peça, direto de `coords` (sem montar os polígonos)."""
+        if len(self) == 0:
+            return np.empty((0, 4))
+        starts = self.ring_offsets[self.part_offsets[:-1]]
+        return np.hstack([np.minimum.reduceat(self.coords, starts), np.maximum.reduceat(self.coords, starts)])
+
+    def _column_areas(self):
+        """Área de cada peça pela fórmula do laço: o contorno externo menos os furos."""
+        if len(self) == 0:
+            return np.empty(0)
+        x, y = self.coords[:, 0], self.coords[:, 1]
+        # Soma acumulada dos produtos vetoriais de pontos consecutivos; cada anel repete o primeiro ponto
+        cross = np.concatenate(([0.0], np.cumsum(x[:-1] * y[1:] - x[1:] * y[:-1])))
+        rings = np.abs(cross[self.ring_offsets[1:] - 1] - cross[self.ring_offsets[:-1]]) / 2
+        sign = np.full(len(rings), -1.0)
+        sign[self.part_offsets[:-1]] = 1.0
+        return np.add.reduceat(sign * rings, self.part_offsets[:-1])
+
+    @classmethod
+    def from_polygons(cls, polygons):
+        """Monta o armazenamento a partir de uma lista de polígonos."""
+        polygons = np.asarray(list(polygons), dtype=object)
+        if len(polygons) == 0:
+            return cls(np.empty((0, 2)), np.zeros(1, dtype=np.int64), np.zeros(1, dtype=np.int64),
+                       np.empty((0, 4)), np.empty(0))
+        _, coords, (ring_offsets, part_offsets) = shapely.to_ragged_array(polygons)
+        store = cls(np.ascontiguousarray(coords, dtype=float), ring_offsets.astype(np.int64),
+                    part_offsets.astype(np.int64), shapely.bounds(polygons), shapely.area(polygons))
+        store._geometries = polygons
+        return store
+
+    @classmethod
+    def from_columns(cls, entries):
+        """Monta o armazenamento concatenando colunas ragged (ver geometry_cache.cached_columns).
+
+        Args:
+            entries (iterable): Tuplas (geom_type, coords, offsets), uma por SVG, no formato de
+                shapely.to_ragged_array; geom_type -1 marca um SVG sem polígonos.
+
+        Returns:
+            PartStore: As peças de todas as entradas, na ordem dada.
+        """
+        coords = [np.empty((0, 2))]
+        ring_offsets = [np.zeros(1, dtype=np.int64)]
+        part_offsets = [np.zeros(1, dtype=np.int64)]
+        for geom_type, entry_coords, offsets in entries:
+            if geom_type < 0:
+                continue
+            if geom_type != shapely.GeometryType.POLYGON:
+                raise ValueError(f'expected polygon columns, got {shapely.GeometryType(geom_type).name}')
+            rings, parts = offsets
+            # Os offsets de cada entrada começam em zero: desloca pelo que já foi concatenado
+            ring_offsets.append(np.asarray(rings[1:], dtype=np.int64) + ring_offsets[-1][-1])
+            part_offsets.append(np.asarray(parts[1:], dtype=np.int64) + part_offsets[-1][-1])
+            coords.append(entry_coords)
+        # Bounding boxes e áreas saem das colunas (ver __init__); os polígonos ficam para quando forem pedidos
+        return cls(np.ascontiguousarray(np.concatenate(coords), dtype=float), np.concatenate(ring_offsets),
+                   np.concatenate(part_offsets))
+
+    def __len__(self):
+        return len(self.part_offsets) - 1
+
+    def rings(self, index):
+        """Anéis da peça (o contorno externo primeiro), como views de `coords`."""
+        first, last = self.part_offsets[index], self.part_offsets[index + 1]
+        return [self.coords[self.ring_offsets[r]:self.ring_offsets[r + 1]] for r in range(first, last)]
+
+    def exterior(self, index):
+        """Contorno externo da peça (view de `coords`, fechado)."""
+        ring = self.part_offsets[index]
+        return self.coords[self.ring_offsets[ring]:self.ring_offsets[ring + 1]]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return list(self.geometries()[index])
+        if not -len(self) <= index < len(self):
+            raise IndexError('part index out of range')
+        return self.geometries()[index]
+
+    def __iter__(self):
+        return iter(self.geometries())
+
+    def geometries(self):
+        """Todos os polígonos (array do shapely), montados de uma vez na primeira chamada."""
+        if self._geometries is None:
+            if len(self) == 0:
+                self._geometries = np.empty(0, dtype=object)
+            else:
+                self._geometries = shapely.from_ragged_array(shapely.GeometryType.POLYGON, self.coords,
+                                                             (self.ring_offsets, self.part_offsets))
+        return self._geometries
+
+    def _column(self, name, params, compute):
+        key = (name, params)
+        if key not in self._derived:
+            self._derived[key] = compute()
+        return self._derived[key]
+
+    def series(self, n_points=64):
+        """Contornos externos reamostrados (P, n_points, 2), como ordering.resample_contour."""
+        def compute():
+            series = np.empty((len(self), n_points, 2))
+            for index in range(len(self)):
+                ring = self.exterior(index)
+                # Sentido anti-horário, como shapely.geometry.polygon.orient
+                x, y = ring[:, 0], ring[:, 1]
+                clockwise = np.dot(x[:-1], y[1:]) - np.dot(x[1:], y[:-1]) < 0
+                series[index] = resample_ring(ring[::-1] if clockwise else ring, n_points)
+            return series
+        return self._column('series', (n_points,), compute)
+
+    def descriptors(self, n_points=64, n_coefficients=8):
+        """Descritores de Fourier (P, 2 * n_coefficients), como ordering.fourier_descriptors."""
+        return self._column('descriptors', (n_points, n_coefficients),
+                            lambda: descriptors_from_contours(self.series(n_points), n_coefficients))
+
+    def save(self, directory):
+        """Grava as colunas (e as derivadas já calculadas) numa pasta, um .npy por coluna."""
+        os.makedirs(directory, exist_ok=True)
+        for name in COLUMNS:
+            np.save(os.path.join(directory, f'{name}.npy'), getattr(self, name))
+        for (name, params), column in self._derived.items():
+            np.save(os.path.join(directory, f"{name}-{'-'.join(map(str, params))}.npy"), column)
+
+    @classmethod
+    def load(cls, directory, mmap=True):
+        """Abre um armazenamento gravado com save (com memory-map, por padrão)."""
+        mode = 'r' if mmap else None
+        columns = {name: np.load(os.path.join(directory, f'{name}.npy'), mmap_mode=mode) for name in COLUMNS}
+        store = cls(**columns)
+        for filename in os.listdir(directory):
+            name, _, params = filename[:-len('.npy')].partition('-')
+            if params and name in ('series', 'descriptors'):
+                store._derived[(name, tuple(int(p) for p in params.split('-')))] = np.load(
+                    os.path.join(directory, filename), mmap_mode=mode)
+        return store
@@ -0,0 +1,247 @@
+"""
+Motor de posicionamento por rasterização (grade de ocupação).
+
+Cada folha ganha uma imagem booleana da região útil, com células de
+`resolution` mm, onde as peças posicionadas são marcadas à medida que entram
+na folha. Cada rotação candidata é rasterizada uma única vez, já dilatada
+pela folga entre as peças. A quantidade de células em conflito para todas as
+translações de uma vez sai da correlação cruzada das duas imagens
+por FFT. A transformada da folha é calculada uma vez por estado da folha e
+vale para todas as rotações, então o custo de cada posicionamento é o de
+duas transformadas por rotação, que depende do tamanho da folha e da
+resolução, não da quantidade de vértices das peças.
+
+As duas rasterizações são conservadoras: uma célula é marcada quando o seu
+centro está a menos de meia diagonal da forma, o que cobre todas as células
+que ela toca. Por isso uma translação sem conflito na imagem também é livre
+na geometria exata. Mesmo assim a posição escolhida passa por um teste
+exato com o shapely (folha e colisão), e as seguintes são tentadas se ele
+falhar. A escolha segue a regra do motor NFP: menor y, depois menor x,
+depois a rotação que aparece primeiro.
+
+Numa folha irregular (uma sobra do estoque, ver sheets.py) as células fora
+da região começam marcadas; essa imagem de base é rasterizada uma vez por
+região e copiada para cada folha nova dela.
+"""
+import weakref
+from collections import OrderedDict
+
+import numpy as np
+import shapely
+from scipy import fft
+
+import telemetry
+from spatial_index import as_sheet_layout
+
+# Tamanho padrão das células, em mm
+RASTER_RESOLUTION = 0.5
+
+# Posições viáveis (por rotação) conferidas na geometria exata antes de desistir da rotação
+VERIFY_LIMIT = 16
+
+
+# Função para marcar as células cujo centro está na forma dilatada (janela de células dada)
+def _cover(geom, dilation, x0, y0, resolution, rows, cols):
+    dilated = geom.buffer(dilation) if dilation > 0 else geom
+    shapely.prepare(dilated)
+    xs = x0 + (np.arange(cols.start, cols.stop) + 0.5) * resolution
+    ys = y0 + (np.arange(rows.start, rows.stop) + 0.5) * resolution
+    gx, gy = np.meshgrid(xs, ys)
+    return shapely.intersects_xy(dilated, gx, gy)
+
+
+class OccupancyGrid:
+    """Imagem das células ocupadas da região útil de uma folha.
+
+    As peças da folha são rasterizadas uma vez cada, quando aparecem pela
+    primeira vez (as folhas só crescem por append).
+
+    Args:
+        sheet_bounds (tuple): (xmin, ymin, xmax, ymax) da região útil.
+        resolution (float): Tamanho das células.
+        blocked (numpy.ndarray): Células já ocupadas antes da primeira peça (fora da região
+            de uma folha irregular); a imagem começa vazia se None.
+    """
+
+    def __init__(self, sheet_bounds, resolution, blocked=None):
+        self.sheet_bounds = sheet_bounds
+        self.resolution = resolution
+        x0, y0, x1, y1 = sheet_bounds
+        self.shape = (int((y1 - y0) // resolution), int((x1 - x0) // resolution))
+        self.grid = np.zeros(self.shape, dtype=bool) if blocked is None else blocked.copy()
+        self.parts = 0
+        self._spectra = {}  # borda -> (transformada da imagem com a borda, tamanho da FFT)
+
+    def spectrum(self, pad):
+        """Transformada da imagem com `pad` células livres em cada lado, e o tamanho usado."""
+        found = self._spectra.get(pad)
+        if found is None:
+            padded = np.pad(self.grid.astype(float), pad)
+            shape = tuple(fft.next_fast_len(n, real=True) for n in padded.shape)
+            found = self._spectra[pad] = (fft.rfft2(padded, shape), shape)
+        return found
+
+    def update(self, polygons):
+        """Marca as peças ainda não rasterizadas (as posteriores às `parts` primeiras)."""
+        x0, y0 = self.sheet_bounds[:2]
+        half_diagonal = self.resolution * np.sqrt(0.5)
+        if len(polygons) > self.parts:
+            self._spectra.clear()
+        for poly in polygons[self.parts:]:
+            minx, miny, maxx, maxy = poly.bounds
+            # Janela das células que a peça (dilatada) pode alcançar, recortada à folha
+            c0 = max(0, int(np.floor((minx - half_diagonal - x0) / self.resolution)))
+            r0 = max(0, int(np.floor((miny - half_diagonal - y0) / self.resolution)))
+            c1 = min(self.shape[1], int(np.ceil((maxx + half_diagonal - x0) / self.resolution)) + 1)
+            r1 = min(self.shape[0], int(np.ceil((maxy + half_diagonal - y0) / self.resolution)) + 1)
+            if c0 < c1 and r0 < r1:
+                self.grid[r0:r1, c0:c1] |= _cover(poly, half_diagonal, x0, y0, self.resolution,
+                                                  range(r0, r1), range(c0, c1))
+        self.parts = len(polygons)
+        return self
+
+
+class RasterCache:
+    """Imagens das folhas (por folha, enquanto ela existir) e máscaras das peças (LRU).
+
+    Args:
+        maxsize (int): Quantidade máxima de máscaras de peças guardadas.
+    """
+
+    def __init__(self, maxsize=4096):
+        self.maxsize = maxsize
+        self._sheets = weakref.WeakKeyDictionary()
+        self._regions = weakref.WeakKeyDictionary()
+        self._masks = OrderedDict()
+
+    def occupancy(self, sheet_layout, sheet_bounds, resolution, region=None):
+        """Imagem atualizada da folha (com as células fora de `region` marcadas, se dada)."""
+        grids = self._sheets.setdefault(sheet_layout, {})
+        key = (tuple(sheet_bounds), resolution)
+        grid = grids.get(key)
+        if grid is None:
+            blocked = None if region is None else self.blocked(region, sheet_bounds, resolution)
+            grid = grids[key] = OccupancyGrid(sheet_bounds, resolution, blocked)
+        return grid.update(sheet_layout.polygons)
+
+    def blocked(self, region, sheet_bounds, resolution):
+        """Células de `sheet_bounds` fora da região de uma folha irregular (calculadas uma vez)."""
+        grids = self._regions.setdefault(region, {})
+        key = (tuple(sheet_bounds), resolution)
+        blocked = grids.get(key)
+        if blocked is None:
+            base = OccupancyGrid(sheet_bounds, resolution)
+            frame = region.frame()
+            if frame.is_empty:
+                blocked = base.grid
+            else:
+                blocked = _cover(frame, resolution * np.sqrt(0.5), sheet_bounds[0], sheet_bounds[1], resolution,
+                                 range(base.shape[0]), range(base.shape[1]))
+            grids[key] = blocked
+        return blocked
+
+    def mask(self, moving, clearance, resolution):
+        """Máscara da peça dilatada pela folga, com a origem no canto da bounding box.
+
+        Returns:
+            tuple: (máscara, borda em células acrescentada em cada lado, células ocupadas
+                pela própria bounding box em (linhas, colunas)).
+        """
+        key = (moving.wkb, clearance, resolution)
+        found = self._masks.get(key)
+        if found is not None:
+            self._masks.move_to_end(key)
+            return found
+        half_diagonal = resolution * np.sqrt(0.5)
+        pad = int(np.ceil((clearance + half_diagonal) / resolution))
+        minx, miny, maxx, maxy = moving.bounds
+        size = (int(np.ceil((maxy - miny) / resolution)), int(np.ceil((maxx - minx) / resolution)))
+        # Centros das células relativos ao canto da bounding box, com `pad` células de borda
+        mask = _cover(moving, clearance + half_diagonal, minx - pad * resolution, miny - pad * resolution,
+                      resolution, range(size[0] + 2 * pad), range(size[1] + 2 * pad))
+        found = (mask.astype(float), pad, size)
+        self._masks[key] = found
+        if len(self._masks) > self.maxsize:
+            self._masks.popitem(last=False)
+        return found
+
+
+# Cache compartilhado entre chamadas de find_position_raster
+default_cache = RasterCache()
+
+
+def raster_offsets(moving, occupancy, clearance=0, cache=None):
+    """Translações livres de uma peça numa folha, pela correlação das imagens.
+
+    Args:
+        moving (shapely.geometry.Polygon): A peça (já rotacionada).
+        occupancy (OccupancyGrid): Imagem da folha.
+        clearance (float): Folga mínima exigida entre as peças.
+
+    Returns:
+        numpy.ndarray: Array (n, 2) com as translações (x, y) livres do canto da bounding box
+            da peça, na ordem da varredura (menor y, depois menor x).
+    """
+    cache = default_cache if cache is None else cache
+    mask, pad, (rows, cols) = cache.mask(moving, clearance, occupancy.resolution)
+    if rows > occupancy.shape[0] or cols > occupancy.shape[1]:
+        telemetry.count('rejected_too_large')
+        return np.empty((0, 2))
+    # A borda da máscara pode passar da região útil (a margem da folha não tem peças)
+    sheet_spectrum, shape = occupancy.spectrum(pad)
+    # Correlação circular; as translações válidas não dão a volta porque a FFT cobre a imagem inteira
+    conflicts = fft.irfft2(sheet_spectrum * np.conj(fft.rfft2(mask, shape)), shape)
+    conflicts = conflicts[:occupancy.shape[0] - rows + 1, :occupancy.shape[1] - cols + 1]
+    free_rows, free_cols = np.nonzero(conflicts < 0.5)
+    telemetry.count('raster_offsets', len(free_rows))
+    x0, y0 = occupancy.sheet_bounds[:2]
+    return np.column_stack([x0 + free_cols * occupancy.resolution, y0 + free_rows * occupancy.resolution])
+
+
+def find_position_raster(rotations, current_layout, sheet_bounds, clearance=0, resolution=RASTER_RESOLUTION,
+                         cache=None, region=None):
+    """Escolhe, entre as rotações dadas, a posição inferior-esquerda livre na imagem da folha.
+
+    Args:
+        rotations (list): Polígonos candidatos, um por rotação, já corrigidos.
+        current_layout (list | SheetLayout): Peças já posicionadas na folha.
+        sheet_bounds (tuple): (xmin, ymin, xmax, ymax) da região útil da folha.
+        clearance (float): Folga mínima exigida entre as peças.
+        resolution (float): Tamanho das células da imagem.
+        cache (RasterCache): Cache das imagens; usa o cache global se None.
+        region (sheets.SheetRegion): Região de uma folha irregular, dentro de `sheet_bounds`;
+            a folha é o retângulo `sheet_bounds` se None.
+
+    Returns:
+        shapely.geometry.Polygon: O polígono transladado, ou None se não for encontrado encaixe.
+    """
+    cache = default_cache if cache is None else cache
+    sheet_layout = as_sheet_layout(current_layout, clearance)
+    occupancy = cache.occupancy(sheet_layout, sheet_bounds, resolution, region)
+
+    candidates = []  # (y, x, índice da rotação)
+    for rotation_index, rotated_poly in enumerate(rotations):
+        if rotated_poly.is_empty or not rotated_poly.is_valid:
+            continue
+        minx, miny = rotated_poly.bounds[:2]
+        offsets = raster_offsets(rotated_poly, occupancy, clearance, cache)[:VERIFY_LIMIT]
+        candidates += [(y - miny, x - minx, rotation_index) for x, y in offsets]
+
+    # Conferência exata, na ordem da escolha (a rasterização conservadora quase nunca erra)
+    tol = 1e-9
+    for y, x, rotation_index in sorted(candidates):
+        placed = shapely.transform(rotations[rotation_index], lambda c: c + (x, y))
+        telemetry.count('candidates')
+        minx, miny, maxx, maxy = placed.bounds
+        if (minx < sheet_bounds[0] - tol or miny < sheet_bounds[1] - tol
+                or maxx > sheet_bounds[2] + tol or maxy > sheet_bounds[3] + tol):
+            telemetry.count('rejected_outside_sheet')
+            continue
+        if region is not None and not region.contains(placed):
+            telemetry.count('rejected_outside_sheet')
+            continue
+        if sheet_layout.collides(placed):
+            telemetry.count('rejected_collision')
+            continue
+        return placed
+    return None
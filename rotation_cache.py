@@ -0,0 +1,179 @@
+"""
+Cache das rotações candidatas de cada peça.
+
+A busca de posição tentava cada peça em várias folhas, e em cada tentativa
+candidate_rotations girava a peça em todos os ângulos, corrigia os giros
+inválidos (buffer(0)) e simplificava o contorno, sempre com o mesmo
+resultado. Aqui as rotações de cada peça são calculadas uma única vez (ou
+todas de antemão, em paralelo, com `precompute`) e guardadas já corrigidas,
+simplificadas e com o buffer de segurança da variante, transladadas para que
+a bounding box comece em (0, 0), junto com as bounds e as áreas. Cada
+tentativa de posicionamento só faz translações.
+
+As chaves são a função de rotação, os seus parâmetros e o WKB da peça, então
+a mesma peça em outra lista (por exemplo depois de recarregar os SVGs do
+cache em disco) também reaproveita as rotações.
+"""
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import numpy as np
+import shapely
+
+import telemetry
+
+
+class RotatedPart:
+    """Rotações de uma peça, com a bounding box começando em (0, 0).
+
+    Pode ser usada no lugar da lista de rotações (iteração, len, indexação).
+
+    Attributes:
+        polygons (list): Os polígonos, um por rotação, na ordem dos ângulos.
+        bounds (numpy.ndarray): Array (n, 4) com as bounds de cada rotação (mínimos iguais a zero).
+        areas (numpy.ndarray): Área de cada rotação.
+        offsets (numpy.ndarray): Array (n, 2) com o deslocamento subtraído de cada rotação.
+        centers (numpy.ndarray): Array (n, 2) com o centróide de cada rotação antes do
+            deslocamento: o centro em torno do qual a peça foi girada.
+    """
+
+    __slots__ = ('polygons', 'bounds', 'areas', 'offsets', 'centers')
+
+    def __init__(self, rotations):
+        rotations = np.asarray(rotations, dtype=object)
+        bounds = shapely.bounds(rotations)
+        # Rotações vazias (buffer negativo maior que a peça) ficam como estão
+        offsets = np.where(np.isnan(bounds[:, :2]), 0, bounds[:, :2])
+        self.polygons = [shapely.transform(poly, lambda c, o=offset: c - o)
+                         for poly, offset in zip(rotations, offsets)]
+        self.bounds = bounds - np.tile(offsets, 2)
+        self.areas = shapely.area(rotations)
+        self.offsets = offsets
+        centroids = shapely.centroid(rotations)
+        filled = ~shapely.is_empty(centroids)
+        self.centers = np.zeros((len(rotations), 2))
+        self.centers[filled] = shapely.get_coordinates(centroids[filled])
+
+    def __len__(self):
+        return len(self.polygons)
+
+    def __iter__(self):
+        return iter(self.polygons)
+
+    def __getitem__(self, index):
+        return self.polygons[index]
+
+    def transform(self, placed, angles):
+        """Transformação que leva a peça original a `placed`, uma das rotações transladada.
+
+        A rotação é a que `placed` repete vértice a vértice; uma posição corrigida
+        com buffer(0) fica com a rotação mais próxima (distância de Hausdorff).
+
+        Args:
+            placed (shapely.geometry.Polygon): A peça posicionada pela busca.
+            angles (array): O ângulo de cada rotação, em graus.
+
+        Returns:
+            tuple: (ângulo em graus, tx, ty), com placed ≈ rotate(peça, ângulo, origin=(0, 0)) + (tx, ty).
+        """
+        x, y = placed.bounds[:2]
+        coords = shapely.get_coordinates(placed)
+        for index, poly in enumerate(self.polygons):
+            own = shapely.get_coordinates(poly)
+            if own.shape == coords.shape and np.allclose(own + (x, y), coords):
+                break
+        else:
+            moved = [shapely.transform(poly, lambda c: c + (x, y)) for poly in self.polygons]
+            index = int(np.argmin(shapely.hausdorff_distance(moved, placed)))
+        angle = float(angles[index]) % 360
+        cos, sin = np.cos(np.radians(angle)), np.sin(np.radians(angle))
+        # rotação = R (peça - centro) + centro, menos o deslocamento, mais a posição (x, y)
+        (cx, cy), (ox, oy) = self.centers[index], self.offsets[index]
+        return angle, float(cx - (cx * cos - cy * sin) - ox + x), float(cy - (cx * sin + cy * cos) - oy + y)
+
+
+# Função para calcular as rotações de uma peça a partir do WKB (usada nos processos de trabalho)
+def _rotate_wkb(rotate, poly_wkb, args):
+    return RotatedPart(rotate(shapely.from_wkb(poly_wkb), *args))
+
+
+class RotationCache:
+    """Cache LRU das rotações normalizadas de cada peça.
+
+    Args:
+        maxsize (int): Quantidade máxima de peças (com os mesmos parâmetros) guardadas.
+    """
+
+    def __init__(self, maxsize=4096):
+        self.maxsize = maxsize
+        self._parts = OrderedDict()
+
+    def __len__(self):
+        return len(self._parts)
+
+    def clear(self):
+        self._parts.clear()
+
+    @staticmethod
+    def _key(rotate, poly_wkb, args):
+        return getattr(rotate, '__module__', None), getattr(rotate, '__qualname__', repr(rotate)), args, poly_wkb
+
+    def _remember(self, key, part):
+        self._parts[key] = part
+        if len(self._parts) > self.maxsize:
+            try:
+                self._parts.popitem(last=False)
+            except KeyError:
+                pass  # outra thread já esvaziou o cache
+
+    def rotations(self, rotate, poly, *args):
+        """Rotações normalizadas de `poly`, calculando-as só na primeira vez.
+
+        Args:
+            rotate (callable): rotate(poly, *args) -> lista de polígonos (candidate_rotations da variante).
+            poly (shapely.geometry.Polygon): A peça.
+            args: Parâmetros de `rotate` (ângulo, espessura da linha...), que fazem parte da chave.
+
+        Returns:
+            RotatedPart: As rotações, com bounds e áreas.
+        """
+        poly_wkb = shapely.to_wkb(poly)
+        key = self._key(rotate, poly_wkb, args)
+        part = self._parts.get(key)
+        if part is None:
+            telemetry.count('rotation_cache_misses')
+            part = RotatedPart(rotate(poly, *args))
+            self._remember(key, part)
+        else:
+            telemetry.count('rotation_cache_hits')
+            try:
+                self._parts.move_to_end(key)
+            except KeyError:
+                pass  # descartada por outra thread (async_nest roda trabalhos em threads)
+        return part
+
+    def precompute(self, rotate, polygons, *args, workers=1):
+        """Calcula de antemão as rotações das peças que ainda não estão no cache.
+
+        Args:
+            rotate (callable): Como em `rotations`; com workers > 1 deve poder ser enviada a
+                outros processos (uma função de módulo ou um partial dela).
+            polygons (list): As peças.
+            workers (int): Processos usados no cálculo.
+        """
+        wkbs = dict.fromkeys(shapely.to_wkb(np.asarray(polygons, dtype=object)).tolist())
+        missing = [poly_wkb for poly_wkb in wkbs if self._key(rotate, poly_wkb, args) not in self._parts]
+        with telemetry.span('precompute_rotations', parts=len(missing), workers=workers):
+            if workers > 1 and len(missing) > 1:
+                with ProcessPoolExecutor(max_workers=workers) as pool:
+                    parts = list(pool.map(partial(_rotate_wkb, rotate, args=args), missing,
+                                          chunksize=max(1, len(missing) // (4 * workers))))
+            else:
+                parts = [_rotate_wkb(rotate, poly_wkb, args) for poly_wkb in missing]
+            for poly_wkb, part in zip(missing, parts):
+                self._remember(self._key(rotate, poly_wkb, args), part)
+
+
+# Cache compartilhado entre as chamadas de find_position
+default_cache = RotationCache()
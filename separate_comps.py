@@ -1,161 +1,411 @@
-from svgpathtools import svg2paths2, wsvg, parse_path, Path, Line
-import xml.etree.ElementTree as ET
-import re
-import os
-
-#from svgwrite.mixins import ViewBox
-"""
-This script reads a .svg and processess it to output the
-necessary .png files.
-"""
-print('separating svg components from original svg...')
-
-def translatePath (path, x, y):
-    parse = re.split('[ ,]',path)
-    string =''
-    while parse:
-        elem = parse.pop(0)
-        if re.match('[A-Za-z]',elem):
-            string += elem + ' '
-        else:
-            string += str(float(elem) + x) + ','
-            string += str(float(parse.pop(0)) + y)
-        if parse:
-            string += ' '
-    return string
-
-# make sure that folder were svg components will be stored is empty
-files = os.listdir('./components_svg')
-for file in files:
-    os.remove('./components_svg' + file)
-
-# select figure in folder
-svg_name = 'harry-potter.svg'
-
-# open figure into svgFile and read into svgString
-svgFile = open(svg_name,'r')
-svgString = svgFile.read()
-svgFile.close()
-
-# remove section <defs> ... </defs> from svgString because it is not useful
-svgString = re.sub('<defs.*>.*</defs>','<defs/>',svgString, flags=re.DOTALL)
-svg_name = 'harry-potter_processed.svg'
-newSvgFile = open(svg_name,'w')
-newSvgFile.write(svgString)
-
-
-# reads .svg as a tree element
-tree = ET.parse(svg_name)
-root = tree.getroot()
-g_path_qty = []
-# finds the final g tag elements and the qty of paths in each one
-# this enumerator will be useful when working with svgpathtools
-for g_tag in root.findall('.//{http://www.w3.org/2000/svg}g'):
-    path_qty = len(g_tag.findall('{http://www.w3.org/2000/svg}path'))
-    if path_qty > 0:
-        g_path_qty.append(path_qty)
-
-# reads the svg with svgpathtools
-paths, attributes, svg_attributes = svg2paths2(svg_name)
-# figure line stroke width of 5mm to guarantee the distance
-strokeWidth = 5 * (float(svg_attributes['viewBox'].split()[2]) 
-    / float(svg_attributes['width'][:-2]))
-# extract some useful params
-width_mm = float(svg_attributes['width'][:-2])
-height_mm = float(svg_attributes['height'][:-2])
-width_px = float(svg_attributes['viewBox'].split()[2])
-height_px = float(svg_attributes['viewBox'].split()[3])
-
-# increases path line width to be 5mm, rounds linecaps, 
-# rounds linejoints, fills components with black
-for attribute in attributes:
-    # increases path line width to be 5mm
-    try:
-        attribute['style'] = re.sub('stroke-width:[0-9.]*', 
-            'stroke-width:' + str(strokeWidth),attribute['style'])
-    except:
-        pass
-    # rounds linecaps
-    try:
-        attribute['style'] = re.sub('stroke-linecap:[a-z]*', 
-            'stroke-linecap:round',attribute['style'])
-    except:
-        pass
-    # rounds linejoints
-    try:
-        attribute['style'] = re.sub('stroke-linejoin:[a-z]*', 
-            'stroke-linejoin:round',attribute['style'])
-    except:
-        pass
-    # removes linemiter limits because they do 
-    # not make sense in round joints
-    try:
-        attribute['style'] = re.sub(';stroke-miterlimit:[0-9.]*;', 
-            ';',attribute['style'])
-    except:
-        pass
-    # fills with black
-    try:
-        attribute['style'] = re.sub('fill:[0-9a-z.#]*',
-            'fill:black', attribute['style'])
-    except:
-        pass
-
-# removes transform attributes and includes it on path tag lines
-for i in range(0,len(paths)):
-    try:
-        translation = attributes[i].pop('transform')
-        translation = translation[translation.find('(') + 1: translation.find(')')].split(',')
-        paths[i] = parse_path(translatePath(paths[i].d(), float(translation[0]), float(translation[1])))
-    except:
-        continue
-
-# separates components
-components = []
-for idx, qty in enumerate(g_path_qty):
-    components.append([paths[0:qty], attributes[0:qty], svg_attributes])
-    paths = paths[qty:]
-    attributes = attributes[qty:]
-
-# moves components to the superior left corner of svg and adjust viewbox
-for idx, component in enumerate(components):
-    # component[h]: paths if h=0; attributes if h=1, svg_attributes if h=2
-    # component[0][p] is the component path
-    # component[0][p][l] is the line "l" of path "p"
-    # component[0][p][l][d] is the point "d" of line "l"
-    x_min = 50000
-    y_min = 50000
-    x_max = -50000
-    y_max = -50000
-    # gets the min and max x and y in component 
-    for path in component[0]:
-        for line in path:
-            for dot in line:
-                if dot.real < x_min: x_min = dot.real
-                if dot.real > x_max: x_max = dot.real
-                if dot.imag < y_min: y_min = dot.imag
-                if dot.imag > y_max: y_max = dot.imag
-
-    # translates position so that it fits in square(0,0,X,Y)
-    translation = [-x_min + strokeWidth/2, -y_min + strokeWidth/2]
-    for path_idx in range(0, len(component[0])):
-        #for i in range(0,len(paths)):
-        try:
-            component[0][path_idx] = parse_path(translatePath(component[0][path_idx].d(), float(translation[0]), float(translation[1])))
-        except:
-            continue
-   
-    # changes the viewBox and the size(in "mm") of svg
-    comp_width_px = x_max+strokeWidth-x_min
-    comp_height_px = y_max+strokeWidth-y_min
-    components[idx][2]['width'] = comp_width_px * width_mm / width_px
-    components[idx][2]['height'] = comp_height_px * height_mm / height_px
-    components[idx][2]['viewBox'] = ' '.join(map(str,
-        [0,0,comp_width_px,comp_height_px])) 
-    # if this step be performed outside the loop it does not work
-    # this is the only reason 
-    wsvg(paths = components[idx][0], attributes = components[idx][1], 
-        svg_attributes=components[idx][2], 
-            filename='./components_svg/comp'+str(idx).zfill(3)+'.svg')
-
-print('components separates with SUCCESS!')
\ No newline at end of file
+"""
+Separates the components of a paper model .svg into individual parts.
+
+A component is a <g> tag with <path> children. The .svg is read in a single
+streaming pass (ElementTree.iterparse): each component is yielded as soon as
+its </g> closes, with its paths moved to the superior left corner and their
+vertices as numpy arrays, so it can go straight to the nester. Writing one
+.svg file per component is an optional sink (write_components).
+
+Running this file keeps the old behaviour: it writes the components of
+harry-potter.svg to ./components_svg.
+"""
+from svgpathtools import parse_path, Line, QuadraticBezier, CubicBezier, Arc
+from svgwrite import Drawing
+import xml.etree.ElementTree as ET
+import numpy as np
+import re
+import os
+
+SVG_NS = '{http://www.w3.org/2000/svg}'
+
+# line stroke width (in mm) used to guarantee the distance between components
+STROKE_WIDTH_MM = 5
+
+_TRANSFORM = re.compile(r'(matrix|translate|scale|rotate|skewX|skewY)\s*\(([^)]*)\)')
+_NUMBER = re.compile(r'[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?')
+
+
+def parse_transform(transform):
+    """Parses a SVG transform attribute into a 3x3 matrix (identity if None)."""
+    matrix = np.eye(3)
+    for name, args in _TRANSFORM.findall(transform or ''):
+        values = [float(v) for v in _NUMBER.findall(args)]
+        if name == 'matrix':
+            a, b, c, d, e, f = values
+            step = [[a, c, e], [b, d, f], [0, 0, 1]]
+        elif name == 'translate':
+            tx, ty = values[0], values[1] if len(values) > 1 else 0
+            step = [[1, 0, tx], [0, 1, ty], [0, 0, 1]]
+        elif name == 'scale':
+            sx, sy = values[0], values[1] if len(values) > 1 else values[0]
+            step = [[sx, 0, 0], [0, sy, 0], [0, 0, 1]]
+        elif name == 'rotate':
+            angle = np.radians(values[0])
+            cx, cy = values[1:3] if len(values) == 3 else (0, 0)
+            cos, sin = np.cos(angle), np.sin(angle)
+            # rotation around (cx, cy): translate(cx, cy) rotate(angle) translate(-cx, -cy)
+            step = [[cos, -sin, cx - cos * cx + sin * cy], [sin, cos, cy - sin * cx - cos * cy], [0, 0, 1]]
+        elif name == 'skewX':
+            step = [[1, np.tan(np.radians(values[0])), 0], [0, 1, 0], [0, 0, 1]]
+        else:
+            step = [[1, 0, 0], [np.tan(np.radians(values[0])), 1, 0], [0, 0, 1]]
+        matrix = matrix @ np.array(step, dtype=float)
+    return matrix
+
+
+def _arc_to_cubics(arc):
+    # splits the arc in pieces of at most 90 degrees, each one a cubic Bezier
+    n = max(1, int(np.ceil(abs(arc.delta) / 90)))
+    angles = np.radians(arc.theta + arc.delta * np.arange(n + 1) / n)
+    k = 4 / 3 * np.tan(np.radians(arc.delta) / n / 4)
+    unit = np.exp(1j * angles)
+    controls = [unit[:-1], unit[:-1] * (1 + 1j * k), unit[1:] * (1 - 1j * k), unit[1:]]
+    points = np.column_stack([arc.center + arc.rot_matrix * (arc.radius.real * z.real + 1j * arc.radius.imag * z.imag)
+                              for z in controls])
+    points[0, 0], points[-1, 3] = arc.start, arc.end
+    return points
+
+
+def _bezier(points, t):
+    s = 1 - t
+    return (s ** 3 * points[..., 0] + 3 * s ** 2 * t * points[..., 1]
+            + 3 * s * t ** 2 * points[..., 2] + t ** 3 * points[..., 3])
+
+
+def _coordinate_extremes(p):
+    # values of a coordinate of cubic Beziers where the derivative is zero, inside (0, 1)
+    a = -p[:, 0] + 3 * p[:, 1] - 3 * p[:, 2] + p[:, 3]
+    b = 2 * (p[:, 0] - 2 * p[:, 1] + p[:, 2])
+    c = p[:, 1] - p[:, 0]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        discriminant = b * b - 4 * a * c
+        q = -0.5 * (b + np.copysign(np.sqrt(np.maximum(discriminant, 0)), b))
+        roots = np.column_stack([q / a, c / q])
+    valid = (discriminant >= 0)[:, None] & (roots > 0) & (roots < 1)
+    t = np.where(valid, roots, 0)  # t = 0 is the start point, which is already a candidate
+    return _bezier(p[:, None, :], t)
+
+
+def as_cubic(points, degree):
+    """Control points of the segments as cubic Beziers (exactly the same curves).
+
+    Args:
+        points (numpy.ndarray): Control points (n, 4), as in SegmentArray.
+        degree (numpy.ndarray): Degree of each segment.
+
+    Returns:
+        numpy.ndarray: Control points (n, 4) of the equivalent cubic Beziers.
+    """
+    # lines and quadratic Beziers are elevated to cubic Beziers
+    cubic = points.copy()
+    start, end = points[:, 0], points[np.arange(len(points)), degree]
+    line, quad = degree == 1, degree == 2
+    cubic[line, 1] = start[line] + (end[line] - start[line]) / 3
+    cubic[line, 2] = start[line] + 2 * (end[line] - start[line]) / 3
+    cubic[quad, 1] = start[quad] + 2 / 3 * (points[quad, 1] - start[quad])
+    cubic[quad, 2] = end[quad] + 2 / 3 * (points[quad, 1] - end[quad])
+    cubic[:, 3] = end
+    return cubic
+
+
+def segments_bbox(points, degree):
+    """Exact bounding box of each segment.
+
+    Args:
+        points (numpy.ndarray): Control points (n, 4), as in SegmentArray.
+        degree (numpy.ndarray): Degree of each segment.
+
+    Returns:
+        numpy.ndarray: Array (n, 4) with x_min, x_max, y_min, y_max of each segment.
+    """
+    cubic = as_cubic(points, degree)
+    start, end = cubic[:, 0], cubic[:, 3]
+    x = np.column_stack([start.real, end.real, _coordinate_extremes(cubic.real)])
+    y = np.column_stack([start.imag, end.imag, _coordinate_extremes(cubic.imag)])
+    return np.column_stack([x.min(axis=1), x.max(axis=1), y.min(axis=1), y.max(axis=1)])
+
+
+class SegmentArray:
+    """Segments of a path as numpy complex arrays.
+
+    Each row of `points` has the control points of a segment: [start, end, end, end]
+    for lines, [start, control, end, end] for quadratic and [start, control1,
+    control2, end] for cubic Beziers (`degree` is 1, 2 or 3). Arcs are converted
+    to cubic Beziers. Transformations work on all the segments at once and the
+    path is only turned back into a d string by d().
+    """
+
+    def __init__(self, points, degree):
+        self.points = points
+        self.degree = degree
+
+    @classmethod
+    def from_path(cls, path):
+        """Builds the arrays from a svgpathtools.Path."""
+        rows, degree = [], []
+        for segment in path:
+            if isinstance(segment, Line):
+                rows.append([segment.start, segment.end, segment.end, segment.end])
+                degree.append(1)
+            elif isinstance(segment, QuadraticBezier):
+                rows.append([segment.start, segment.control, segment.end, segment.end])
+                degree.append(2)
+            elif isinstance(segment, CubicBezier):
+                rows.append([segment.start, segment.control1, segment.control2, segment.end])
+                degree.append(3)
+            elif isinstance(segment, Arc):
+                cubics = _arc_to_cubics(segment)
+                rows.extend(cubics)
+                degree.extend([3] * len(cubics))
+        return cls(np.array(rows, dtype=complex).reshape(-1, 4), np.array(degree, dtype=np.int8))
+
+    @classmethod
+    def from_d(cls, d):
+        return cls.from_path(parse_path(d))
+
+    def __len__(self):
+        return len(self.points)
+
+    def transformed(self, matrix):
+        """Applies a 3x3 affine matrix (as returned by parse_transform)."""
+        (a, c, e), (b, d, f) = matrix[0], matrix[1]
+        x, y = self.points.real, self.points.imag
+        return SegmentArray((a * x + c * y + e) + 1j * (b * x + d * y + f), self.degree)
+
+    def translated(self, offset):
+        return SegmentArray(self.points + offset, self.degree)
+
+    def bbox(self):
+        """Exact bounding box of the path: (x_min, x_max, y_min, y_max)."""
+        boxes = segments_bbox(self.points, self.degree)
+        return boxes[:, 0].min(), boxes[:, 1].max(), boxes[:, 2].min(), boxes[:, 3].max()
+
+    @property
+    def start(self):
+        return self.points[0, 0]
+
+    @property
+    def end(self):
+        return self.points[-1, self.degree[-1]]
+
+    def subpaths(self):
+        """Splits the path where a segment does not start at the end of the previous one."""
+        ends = self.points[np.arange(len(self.points)), self.degree]
+        breaks = np.flatnonzero(self.points[1:, 0] != ends[:-1]) + 1
+        bounds = np.concatenate([[0], breaks, [len(self.points)]])
+        return [SegmentArray(self.points[a:b], self.degree[a:b]) for a, b in zip(bounds[:-1], bounds[1:]) if b > a]
+
+    def vertices(self):
+        """Array (n, 2) with the start point of each segment."""
+        return np.column_stack([self.points[:, 0].real, self.points[:, 0].imag])
+
+    def d(self):
+        """Serializes the segments as a SVG path d string (absolute commands)."""
+        parts = []
+        current = None
+        for row, degree in zip(self.points.tolist(), self.degree.tolist()):
+            if row[0] != current:
+                parts.append('M {},{}'.format(row[0].real, row[0].imag))
+            if degree == 1:
+                parts.append('L {},{}'.format(row[1].real, row[1].imag))
+            elif degree == 2:
+                parts.append('Q {},{} {},{}'.format(row[1].real, row[1].imag, row[2].real, row[2].imag))
+            else:
+                parts.append('C {},{} {},{} {},{}'.format(row[1].real, row[1].imag, row[2].real, row[2].imag,
+                                                          row[3].real, row[3].imag))
+            current = row[degree]
+        return ' '.join(parts)
+
+
+class Component:
+    """A component of the model, already moved to the superior left corner.
+
+    Attributes:
+        index (int): Position of the component in the document.
+        paths (list): SegmentArray of each outline.
+        attributes (list): Attributes of each path, with the cutting style applied.
+        vertices (list): Array (n, 2) with the start point of each segment of each path.
+        svg_attributes (dict): Attributes of the <svg> tag of the component (size and viewBox).
+    """
+
+    def __init__(self, index, paths, attributes, vertices, svg_attributes):
+        self.index = index
+        self.paths = paths
+        self.attributes = attributes
+        self.vertices = vertices
+        self.svg_attributes = svg_attributes
+
+
+def cutting_style(style, stroke_width):
+    """Applies the cutting style to a path style attribute.
+
+    Increases the line width to the stroke width, rounds linecaps and linejoints,
+    removes miter limits (they do not make sense in round joints) and fills with black.
+    """
+    style = re.sub('stroke-width:[0-9.]*', 'stroke-width:' + str(stroke_width), style)
+    style = re.sub('stroke-linecap:[a-z]*', 'stroke-linecap:round', style)
+    style = re.sub('stroke-linejoin:[a-z]*', 'stroke-linejoin:round', style)
+    style = re.sub(';stroke-miterlimit:[0-9.]*;', ';', style)
+    style = re.sub('fill:[0-9a-z.#]*', 'fill:black', style)
+    return style
+
+
+def _qualified_name(name, prefixes):
+    # turns '{uri}name' (ElementTree) into 'prefix:name' (as written in the .svg)
+    if name.startswith('{'):
+        uri, local = name[1:].split('}')
+        prefix = prefixes.get(uri)
+        return local if not prefix else prefix + ':' + local
+    return name
+
+
+def _component(index, elements, root_attributes, stroke_width, units):
+    paths, attributes = [], []
+    for path, attribute in elements:
+        if 'style' in attribute:
+            attribute['style'] = cutting_style(attribute['style'], stroke_width)
+        paths.append(path)
+        attributes.append(attribute)
+
+    # gets the min and max x and y in component (exact bounding box of all the segments)
+    boxes = segments_bbox(np.concatenate([path.points for path in paths]),
+                          np.concatenate([path.degree for path in paths]))
+    x_min, x_max = boxes[:, 0].min(), boxes[:, 1].max()
+    y_min, y_max = boxes[:, 2].min(), boxes[:, 3].max()
+
+    # translates position so that it fits in square(0,0,X,Y)
+    translation = complex(-x_min + stroke_width / 2, -y_min + stroke_width / 2)
+    paths = [path.translated(translation) for path in paths]
+    vertices = [path.vertices() for path in paths]
+
+    # changes the viewBox and the size(in "mm") of svg
+    comp_width_px = x_max + stroke_width - x_min
+    comp_height_px = y_max + stroke_width - y_min
+    svg_attributes = dict(root_attributes)
+    width_mm, height_mm, width_px, height_px = units
+    svg_attributes['width'] = comp_width_px * width_mm / width_px
+    svg_attributes['height'] = comp_height_px * height_mm / height_px
+    svg_attributes['viewBox'] = ' '.join(map(str, [0, 0, comp_width_px, comp_height_px]))
+    return Component(index, paths, attributes, vertices, svg_attributes)
+
+
+def iter_components(svg_name, stroke_width_mm=STROKE_WIDTH_MM):
+    """Yields the components of a .svg, one at a time, in document order.
+
+    The document is never loaded as a whole: <defs> are skipped and every
+    <g> is released as soon as its component is yielded. The transform
+    attributes of the path and of all its groups are applied to the geometry.
+
+    Args:
+        svg_name (str): Path of the .svg (or a file object).
+        stroke_width_mm (float): Stroke width, in mm, applied to the component outlines.
+
+    Returns:
+        generator: Component objects.
+    """
+    prefixes = {}
+    declarations = {}
+    root_attributes = None
+    stroke_width = units = None
+    defs_depth = 0
+    groups = []  # stack of open <g> tags: list of (SegmentArray, attributes) of their direct paths
+    parents = []  # stack of open tags
+    matrices = [np.eye(3)]  # stack of the current transformation matrix of the open tags
+    index = 0
+    for event, item in ET.iterparse(svg_name, events=('start-ns', 'start', 'end')):
+        if event == 'start-ns':
+            prefix, uri = item
+            prefixes.setdefault(uri, prefix)
+            declarations['xmlns:' + prefix if prefix else 'xmlns'] = uri
+            continue
+        tag = item.tag
+        if event == 'start':
+            parents.append(tag)
+            transform = item.get('transform')
+            matrices.append(matrices[-1] @ parse_transform(transform) if transform else matrices[-1])
+            if tag == SVG_NS + 'defs':
+                defs_depth += 1
+            elif root_attributes is None and tag == SVG_NS + 'svg':
+                # xmlns declarations and attributes of the <svg> tag are kept in the components
+                root_attributes = dict(declarations)
+                root_attributes.update({_qualified_name(k, prefixes): v for k, v in item.attrib.items()})
+                view_box = [float(v) for v in root_attributes['viewBox'].split()]
+                width_mm = float(root_attributes['width'][:-2])
+                height_mm = float(root_attributes['height'][:-2])
+                units = (width_mm, height_mm, view_box[2], view_box[3])
+                stroke_width = stroke_width_mm * (view_box[2] / width_mm)
+            elif tag == SVG_NS + 'g' and not defs_depth:
+                groups.append([])
+            continue
+
+        parents.pop()
+        matrix = matrices.pop()
+        if tag == SVG_NS + 'defs':
+            defs_depth -= 1
+            item.clear()
+        elif defs_depth:
+            continue
+        elif tag == SVG_NS + 'path' and parents and parents[-1] == SVG_NS + 'g':
+            attribute = {_qualified_name(k, prefixes): v for k, v in item.attrib.items()}
+            # the transform is applied to the geometry, so it is removed from the attributes
+            attribute.pop('transform', None)
+            path = SegmentArray.from_d(attribute.pop('d'))
+            groups[-1].append((path.transformed(matrix), attribute))
+        elif tag == SVG_NS + 'g':
+            elements = groups.pop()
+            item.clear()
+            if elements:
+                yield _component(index, elements, root_attributes, stroke_width, units)
+                index += 1
+
+
+def component_filename(folder, index):
+    return os.path.join(folder, 'comp' + str(index).zfill(3) + '.svg')
+
+
+def write_component(component, filename):
+    """Writes a component as a .svg; the paths are serialized only here."""
+    svg_attributes = dict(component.svg_attributes)
+    size = (svg_attributes.pop('width'), svg_attributes.pop('height'))
+    drawing = Drawing(filename=filename, size=size, debug=False, **svg_attributes)
+    for path, attribute in zip(component.paths, component.attributes):
+        drawing.add(drawing.path(d=path.d(), **attribute))
+    drawing.save(pretty=True)
+
+
+def write_components(components, folder='./components_svg', clear=True):
+    """Writes each component as a .svg in `folder` (compNNN.svg).
+
+    Args:
+        components (iterable): Component objects (for example from iter_components).
+        folder (str): Folder were svg components will be stored.
+        clear (bool): Removes the components written by a previous run first.
+
+    Returns:
+        int: Number of components written.
+    """
+    os.makedirs(folder, exist_ok=True)
+    # make sure that folder were svg components will be stored has no old components
+    if clear:
+        for file in os.listdir(folder):
+            if re.fullmatch('comp[0-9]+\\.svg', file):
+                os.remove(os.path.join(folder, file))
+    count = 0
+    for component in components:
+        write_component(component, component_filename(folder, component.index))
+        count += 1
+    return count
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Separates the components of a paper model .svg.')
+    parser.add_argument('svg_name', nargs='?', default='harry-potter.svg')
+    parser.add_argument('folder', nargs='?', default='./components_svg')
+    args = parser.parse_args()
+
+    print('separating svg components from original svg...')
+    write_components(iter_components(args.svg_name), args.folder)
+    print('components separates with SUCCESS!')
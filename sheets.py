@@ -0,0 +1,371 @@
+"""
+Estoque de folhas: tipos de folha com tamanhos, custos e quantidades diferentes.
+
+Sem estoque todas as folhas são iguais (a4_width x a4_height das variantes,
+ou sheet_size). Com um SheetInventory cada folha nova é de um tipo do
+estoque (A4, A3, Letter, um rolo, ou uma sobra irregular dada pelo contorno
+em vez de box(0, 0, w, h)):
+
+- a folha aberta para uma peça que não coube nas folhas já abertas é a de
+  menor custo por área útil entre os tipos ainda disponíveis em que a peça
+  cabe; depois do empacotamento, `reduce_cost` troca cada folha pela folha
+  mais barata do estoque em que todas as suas peças ainda caibam;
+- a região útil de cada tipo (o contorno recuado pela margem) é calculada
+  uma vez, e os inner-fit polygons (as translações que mantêm uma rotação de
+  uma peça dentro da região) ficam em cache na região. As rotações chegam
+  normalizadas (rotation_cache.py), então cada rotação de cada peça tem o IFP
+  calculado uma vez por tipo de folha, qualquer que seja a quantidade de
+  folhas abertas e de tentativas; numa sobra irregular o IFP é o retângulo
+  do IFP da bounding box menos o NFP da moldura (a parte da bounding box fora
+  da região), calculado com o mesmo cache de NFPs do motor 'nfp'.
+
+As folhas do estoque são SheetLayout com o tipo (`sheet_type`) e a região
+útil (`region`); as buscas de posição, o empacotamento e a compactação leem
+esses atributos quando existem. Um estoque é lido de um JSON com uma lista de
+tipos:
+
+    [{"name": "A4", "count": 50, "cost": 0.10},
+     {"name": "A3", "cost": 0.25},
+     {"name": "sobra-7", "polygon": [[0, 0], [300, 0], [300, 120], [140, 260], [0, 260]],
+      "count": 1, "cost": 0.02}]
+
+Os tipos com o nome de um tamanho padrão (STANDARD_SHEETS) não precisam das
+medidas; `count` ausente é ilimitado.
+"""
+import json
+from collections import Counter, OrderedDict
+
+import numpy as np
+import shapely
+from shapely.geometry import Polygon, box
+
+import telemetry
+from bin_packing import found_transform
+from nfp import NFP_EPSILON, default_cache as nfp_cache, inner_fit_polygon
+from spatial_index import SheetLayout
+
+# Tamanhos padrão, em milímetros (retrato)
+STANDARD_SHEETS = {
+    'A5': (148, 210),
+    'A4': (210, 297),
+    'A3': (297, 420),
+    'A2': (420, 594),
+    'Letter': (215.9, 279.4),
+    'Legal': (215.9, 355.6),
+    'Tabloid': (279.4, 431.8),
+}
+
+# Tolerância das verificações de contenção na região útil
+REGION_TOLERANCE = 1e-7
+
+# Marca de ausência no cache de IFPs (None é um valor válido: a peça não cabe)
+_MISSING = object()
+
+
+class SheetRegion:
+    """Região útil de um tipo de folha, com os inner-fit polygons em cache.
+
+    Args:
+        polygon (shapely.geometry.Polygon): A região (o contorno já recuado pela margem).
+        maxsize (int): Quantidade máxima de IFPs guardados.
+    """
+
+    def __init__(self, polygon, maxsize=4096):
+        self.polygon = polygon
+        self.bounds = polygon.bounds
+        self.area = polygon.area
+        self.rectangular = abs(box(*self.bounds).area - self.area) <= 1e-9 * max(self.area, 1.0)
+        self.maxsize = maxsize
+        self._tolerant = polygon.buffer(REGION_TOLERANCE, join_style='mitre')
+        shapely.prepare(self._tolerant)
+        self._frame = None
+        self._ifps = OrderedDict()
+
+    def contains(self, geom):
+        """Indica se `geom` está dentro da região (com a tolerância numérica)."""
+        if self.rectangular:
+            # Num retângulo basta comparar as bounding boxes
+            minx, miny, maxx, maxy = geom.bounds
+            return (minx >= self.bounds[0] - REGION_TOLERANCE and miny >= self.bounds[1] - REGION_TOLERANCE
+                    and maxx <= self.bounds[2] + REGION_TOLERANCE and maxy <= self.bounds[3] + REGION_TOLERANCE)
+        return self._tolerant.covers(geom)
+
+    def contains_many(self, geoms):
+        """Versão vetorizada de `contains` para um array de geometrias."""
+        return shapely.covers(self._tolerant, np.asarray(geoms, dtype=object))
+
+    def frame(self):
+        """A parte da bounding box fora da região (vazia numa folha retangular)."""
+        if self._frame is None:
+            self._frame = box(*self.bounds).difference(self.polygon)
+        return self._frame
+
+    def inner_fit(self, moving):
+        """Inner-fit polygon: translações de `moving` que o mantêm dentro da região.
+
+        Returns:
+            shapely.geometry.Polygon: O IFP, ou None se a peça não couber.
+        """
+        key = moving.wkb
+        # Um só get (o IFP pode ser None): outra thread pode descartar a chave entre duas leituras
+        ifp = self._ifps.get(key, _MISSING)
+        if ifp is not _MISSING:
+            telemetry.count('ifp_cache_hits')
+            try:
+                self._ifps.move_to_end(key)
+            except KeyError:
+                pass  # descartado por outra thread
+            return ifp
+        telemetry.count('ifp_computed')
+        ifp = inner_fit_polygon(moving, self.bounds)
+        if ifp is not None and not self.rectangular:
+            # Tira do IFP da bounding box as translações em que a peça encosta na moldura
+            nfps = nfp_cache.nfp(self.frame(), moving)
+            margin = NFP_EPSILON + 2 * nfp_cache.tolerance
+            nfps = nfps[shapely.dwithin(nfps, ifp, margin)]
+            if len(nfps):
+                ifp = ifp.difference(shapely.union_all(nfps).buffer(margin))
+            if ifp.is_empty:
+                ifp = None
+        self._ifps[key] = ifp
+        if len(self._ifps) > self.maxsize:
+            try:
+                self._ifps.popitem(last=False)
+            except KeyError:
+                pass
+        return ifp
+
+
+class SheetType:
+    """Um tipo de folha do estoque.
+
+    Args:
+        name (str): Nome do tipo; um nome de STANDARD_SHEETS dispensa as medidas.
+        width (float): Largura, em mm (folha retangular com o canto em (0, 0)).
+        height (float): Altura, em mm.
+        cost (float): Custo de cada folha.
+        count (int): Folhas disponíveis; None para ilimitadas.
+        polygon (shapely.geometry.Polygon | list): Contorno de uma sobra irregular, em mm,
+            no lugar do retângulo.
+    """
+
+    def __init__(self, name, width=None, height=None, cost=1.0, count=None, polygon=None):
+        if polygon is not None:
+            polygon = polygon if isinstance(polygon, Polygon) else Polygon(polygon)
+            if not polygon.is_valid or polygon.is_empty:
+                raise ValueError(f"Sheet type {name!r} has an invalid outline")
+            minx, miny, maxx, maxy = polygon.bounds
+            polygon = shapely.transform(polygon, lambda c: c - (minx, miny))
+            width, height = maxx - minx, maxy - miny
+        elif width is None or height is None:
+            if name not in STANDARD_SHEETS:
+                raise ValueError(f"Sheet type {name!r} needs width and height (or a polygon)")
+            width, height = STANDARD_SHEETS[name]
+        if count is not None and count < 0:
+            raise ValueError(f"Sheet type {name!r} has a negative count")
+        self.name = name
+        self.width = float(width)
+        self.height = float(height)
+        self.cost = float(cost)
+        self.count = count
+        self.outline = box(0, 0, width, height) if polygon is None else polygon
+        self._regions = {}  # margem -> SheetRegion
+
+    def __repr__(self):
+        return f"SheetType({self.name!r}, {self.width:g}x{self.height:g}, cost={self.cost:g}, count={self.count})"
+
+    @classmethod
+    def from_spec(cls, spec, scale=1.0):
+        """Monta o tipo a partir de um dicionário do JSON do estoque (medidas multiplicadas por `scale`)."""
+        unknown = set(spec) - {'name', 'width', 'height', 'cost', 'count', 'polygon'}
+        if unknown or 'name' not in spec:
+            raise ValueError(f"Invalid sheet type specification (needs 'name', got keys {sorted(spec)})")
+        size = {key: spec[key] * scale for key in ('width', 'height') if spec.get(key) is not None}
+        polygon = None if spec.get('polygon') is None else [(x * scale, y * scale) for x, y in spec['polygon']]
+        return cls(spec['name'], cost=spec.get('cost', 1.0), count=spec.get('count'), polygon=polygon, **size)
+
+    def region(self, margin=0):
+        """Região útil (o contorno recuado pela margem), calculada uma vez por margem."""
+        region = self._regions.get(margin)
+        if region is None:
+            usable = self.outline.buffer(-margin, join_style='mitre') if margin > 0 else self.outline
+            if usable.is_empty:
+                raise ValueError(f"Sheet type {self.name!r} has no usable area with a margin of {margin}")
+            if usable.geom_type != 'Polygon':
+                # Uma sobra estreita pode se partir ao recuar a margem: fica a maior parte
+                usable = max(usable.geoms, key=lambda part: part.area)
+            region = self._regions[margin] = SheetRegion(usable)
+        return region
+
+
+def read_sheet_types(source, scale=1.0):
+    """Lê os tipos de folha de um arquivo JSON (ou de uma lista já carregada).
+
+    Args:
+        source (str | list): Caminho do JSON, ou a lista de especificações.
+        scale (float): Milímetros por unidade das medidas.
+
+    Returns:
+        list: Os SheetType, na ordem dada.
+    """
+    if isinstance(source, str):
+        with open(source) as inventory_file:
+            source = json.load(inventory_file)
+    types = [SheetType.from_spec(spec, scale) for spec in source]
+    names = Counter(sheet_type.name for sheet_type in types)
+    repeated = sorted(name for name, n in names.items() if n > 1)
+    if repeated:
+        raise ValueError(f"Repeated sheet types in the inventory: {repeated}")
+    if not types:
+        raise ValueError('The sheet inventory is empty')
+    return types
+
+
+class InventorySheet(SheetLayout):
+    """Folha de um tipo do estoque: um SheetLayout com o tipo e a região útil.
+
+    Args:
+        sheet_type (SheetType): O tipo da folha.
+        margin (float): Margem entre as peças e a borda da folha.
+        clearance (float): Folga mínima exigida entre as peças.
+        polygons (iterable): Peças já posicionadas na folha.
+    """
+
+    def __init__(self, sheet_type, margin=0, clearance=0, polygons=()):
+        self.sheet_type = sheet_type
+        self.margin = margin
+        self.region = sheet_type.region(margin)
+        super().__init__(clearance, polygons)
+
+    @property
+    def usable_area(self):
+        return self.region.area
+
+    def empty(self):
+        """Folha vazia do mesmo tipo."""
+        return InventorySheet(self.sheet_type, self.margin, self.clearance)
+
+    def __repr__(self):
+        return f"InventorySheet({self.sheet_type.name!r}, clearance={self.clearance}, parts={len(self.polygons)})"
+
+
+class SheetInventory:
+    """Estoque de folhas, usado como `new_sheet` de bin_packing.pack.
+
+    Chamado sem argumentos devolve uma folha vazia do tipo preferido; pack usa
+    `candidates` para tentar os tipos disponíveis, do preferido ao último.
+
+    Args:
+        types (list): Os SheetType do estoque.
+        margin (float): Margem entre as peças e a borda das folhas.
+        clearance (float): Folga mínima exigida entre as peças.
+    """
+
+    def __init__(self, types, margin=0, clearance=0):
+        self.types = list(types)
+        self.margin = margin
+        self.clearance = clearance
+        # Preferência: menor custo por área útil, depois menor custo, depois a ordem do estoque
+        self.preference = sorted(self.types, key=lambda t: (t.cost / t.region(margin).area, t.cost))
+
+    def __call__(self):
+        for sheet in self.candidates(None, ()):
+            return sheet
+        raise ValueError('The sheet inventory is exhausted')
+
+    def remaining(self, sheets):
+        """Folhas ainda disponíveis de cada tipo (None = ilimitadas), descontando as já abertas."""
+        used = Counter(getattr(sheet, 'sheet_type', None) for sheet in sheets)
+        return {t: None if t.count is None else t.count - used[t] for t in self.types}
+
+    def candidates(self, poly, sheets):
+        """Folhas novas em que `poly` pode caber, do tipo preferido ao último.
+
+        Args:
+            poly (shapely.geometry.Polygon): A peça (None para qualquer tipo disponível).
+            sheets (list): As folhas já abertas (contam no estoque).
+        """
+        remaining = self.remaining(sheets)
+        for sheet_type in self.preference:
+            if remaining[sheet_type] is not None and remaining[sheet_type] <= 0:
+                continue
+            if poly is not None and poly.area > sheet_type.region(self.margin).area:
+                continue
+            yield InventorySheet(sheet_type, self.margin, self.clearance)
+
+    def cost(self, sheets):
+        """Custo total das folhas."""
+        return sum(sheet.sheet_type.cost for sheet in sheets)
+
+    def reduce_cost(self, result, polygons, place):
+        """Troca folhas do empacotamento por folhas mais baratas em que todas as suas peças caibam.
+
+        As folhas são revistas da mais cara para a mais barata; para cada uma, os
+        tipos mais baratos ainda disponíveis são tentados do mais barato ao mais
+        caro, reposicionando as peças da folha (maiores primeiro) na folha nova.
+
+        Args:
+            result (PackingResult): O empacotamento (alterado no lugar).
+            polygons (list): Os polígonos originais das peças (os índices de `result`).
+            place (callable): A busca de posição de bin_packing.pack.
+
+        Returns:
+            int: Quantidade de folhas trocadas.
+        """
+        swapped = 0
+        parts = [[] for _ in result.sheets]
+        for k, (_, sheet_index, _, _) in enumerate(result.placements):
+            parts[sheet_index].append(k)
+        with telemetry.span('reduce_cost', sheets=len(result.sheets)) as probe:
+            for sheet_index in sorted(range(len(result.sheets)), key=lambda i: -result.sheets[i].sheet_type.cost):
+                sheet = result.sheets[sheet_index]
+                remaining = self.remaining(result.sheets)
+                remaining[sheet.sheet_type] = None if remaining[sheet.sheet_type] is None \
+                    else remaining[sheet.sheet_type] + 1
+                cheaper = sorted((t for t in self.types
+                                  if t.cost < sheet.sheet_type.cost and remaining[t] != 0
+                                  and t.region(self.margin).area >= sum(poly.area for poly in sheet)),
+                                 key=lambda t: t.cost)
+                order = sorted(parts[sheet_index], key=lambda k: -polygons[result.placements[k][0]].area)
+                for sheet_type in cheaper:
+                    candidate = InventorySheet(sheet_type, self.margin, self.clearance)
+                    placed = {}
+                    for k in order:
+                        found = place(polygons[result.placements[k][0]], [candidate])
+                        if found is None:
+                            break
+                        candidate.append(found[1])
+                        placed[k] = found
+                    if len(placed) < len(order):
+                        continue
+                    for k, found in placed.items():
+                        result.placements[k] = (result.placements[k][0], sheet_index, found[1], found_transform(found))
+                    result.sheets[sheet_index] = candidate
+                    result.free_areas[sheet_index] = candidate.usable_area - sum(poly.area for poly in candidate)
+                    swapped += 1
+                    break
+            probe.set(swapped=swapped, cost=self.cost(result.sheets))
+        return swapped
+
+
+def unfilled_area(sheets, layout):
+    """Área não preenchida de cada folha do estoque (a área do contorno menos a das peças).
+
+    Args:
+        sheets (list): As folhas (InventorySheet), na ordem de `layout`.
+        layout (list): As peças de cada folha (as primeiras folhas de `sheets`).
+    """
+    return [sheet.sheet_type.outline.area - (shapely.union_all(list(polys)).area if len(polys) else 0)
+            for sheet, polys in zip(sheets, layout)]
+
+
+def sheet_dimensions(sheets, sheet_size):
+    """(largura, altura) de cada folha: a do tipo nas folhas do estoque, `sheet_size` nas demais."""
+    types = [getattr(sheet, 'sheet_type', None) for sheet in sheets]
+    return [tuple(sheet_size) if t is None else (t.width, t.height) for t in types]
+
+
+def sheet_areas(sheets, sheet_size):
+    """Área de cada folha: a do contorno nas folhas do estoque, largura x altura nas demais."""
+    types = [getattr(sheet, 'sheet_type', None) for sheet in sheets]
+    return [sheet_size[0] * sheet_size[1] if t is None else t.outline.area for t in types]
@@ -0,0 +1,233 @@
+"""
+Armazenamento e percurso das distâncias entre pares de peças.
+
+A ordenação só usa a primeira aparição de cada peça na lista de pares em
+ordem crescente de distância (bin_packing.placement_order), e essa primeira
+aparição é sempre o par da peça com a sua vizinha mais próxima. Então não é
+preciso guardar as distâncias num dicionário de tuplas nem ordenar todos os
+pares:
+
+- CondensedMatrix guarda a matriz simétrica só com o triângulo superior, num
+  array float32 (n(n-1)/2 valores, como scipy.spatial.distance.squareform);
+  inf marca os pares sem distância (não calculados ou abandonados);
+- CondensedMatrix.ordered_pairs percorre os pares em ordem crescente em
+  blocos: np.argpartition separa as menores distâncias ainda não
+  consumidas, só o bloco é ordenado e só os pares dele viram tuplas (os
+  valores e as posições ficam em arrays do NumPy); iter_ordered_pairs faz o
+  mesmo com um heap para listas pequenas de pares, e cover_pairs para assim
+  que todas as peças apareceram;
+- DistanceCache grava em disco as distâncias DTW exatas, indexadas pelo hash
+  do contorno reamostrado de cada peça (e pelos parâmetros da DTW), então
+  peças repetidas entre modelos ou execuções não são comparadas de novo.
+"""
+import hashlib
+import heapq
+import os
+import tempfile
+
+import numpy as np
+
+import telemetry
+from geometry_cache import DEFAULT_CACHE_DIR
+
+# Versão do formato do cache de distâncias; incrementar quando o cálculo mudar
+DISTANCE_CACHE_VERSION = 1
+
+
+class CondensedMatrix:
+    """Matriz de distâncias simétrica, guardada só com o triângulo superior.
+
+    Args:
+        n (int): Quantidade de peças.
+        values (numpy.ndarray): Os n(n-1)/2 valores, na ordem (0,1), (0,2), ..., (1,2), ...;
+            preenchidos com `fill` se None.
+        fill (float): Valor inicial dos pares.
+        dtype: Tipo dos valores.
+    """
+
+    def __init__(self, n, values=None, fill=np.inf, dtype=np.float32):
+        self.n = n
+        self.values = np.full(n * (n - 1) // 2, fill, dtype) if values is None else values
+
+    def index(self, i, j):
+        """Posição em `values` dos pares (i, j), i != j (aceita arrays)."""
+        low, high = np.minimum(i, j), np.maximum(i, j)
+        return self.n * low - low * (low + 1) // 2 + high - low - 1
+
+    def pair(self, k):
+        """Par (i, j), i < j, da posição `k` em `values` (aceita arrays)."""
+        k = np.asarray(k, dtype=np.int64)
+        n = self.n
+        i = n - 2 - np.floor(np.sqrt(-8 * k + 4 * n * (n - 1) - 7) / 2 - 0.5).astype(np.int64)
+        j = k + i + 1 - n * (n - 1) // 2 + (n - i) * (n - i - 1) // 2
+        return i, j
+
+    def row_slice(self, i):
+        """Fatia de `values` com os pares (i, j) para j > i, em ordem de j."""
+        start = self.n * i - i * (i + 1) // 2
+        return slice(start, start + self.n - i - 1)
+
+    def row(self, i):
+        """Distâncias da peça `i` a todas as outras (a diagonal fica inf)."""
+        row = np.full(self.n, np.inf, dtype=self.values.dtype)
+        if i > 0:
+            row[:i] = self.values[self.index(np.arange(i), i)]
+        row[i + 1:] = self.values[self.row_slice(i)]
+        return row
+
+    def __getitem__(self, pair):
+        i, j = pair
+        return 0.0 if i == j else float(self.values[self.index(i, j)])
+
+    def __setitem__(self, pair, value):
+        self.values[self.index(*pair)] = value
+
+    def set_pairs(self, rows, cols, distances):
+        """Grava as distâncias de vários pares de uma vez."""
+        self.values[self.index(np.asarray(rows), np.asarray(cols))] = distances
+
+    def to_square(self):
+        """Matriz quadrada (n, n), com a diagonal zero."""
+        square = np.zeros((self.n, self.n), dtype=self.values.dtype)
+        rows, cols = np.triu_indices(self.n, 1)
+        square[rows, cols] = square[cols, rows] = self.values
+        return square
+
+    def ordered_pairs(self, block=None):
+        """Pares com distância (finita) em ordem crescente, gerados sob demanda.
+
+        A cada bloco, np.argpartition separa as `block` menores distâncias que
+        restam (o tamanho dobra a cada bloco, começando em n); só elas são
+        ordenadas e convertidas em pares. Empates saem em ordem de posição,
+        como numa ordenação estável.
+
+        Args:
+            block (int): Tamanho do primeiro bloco; usa n se None.
+
+        Yields:
+            tuple: (i, j), i < j.
+        """
+        known = np.flatnonzero(np.isfinite(self.values))
+        distances = self.values[known]
+        block = max(1, self.n if block is None else block)
+        while len(known):
+            if len(known) > block:
+                # Todas as distâncias até a block-ésima menor, inclusive os empates com ela
+                threshold = np.partition(distances, block - 1)[block - 1]
+                chosen = distances <= threshold
+            else:
+                chosen = np.ones(len(known), dtype=bool)
+            positions, values = known[chosen], distances[chosen]
+            known, distances = known[~chosen], distances[~chosen]
+            rows, cols = self.pair(positions[np.argsort(values, kind='stable')])
+            yield from zip(rows.tolist(), cols.tolist())
+            block *= 2
+
+
+def iter_ordered_pairs(pairs, distances):
+    """Pares em ordem crescente de distância, gerados sob demanda por um heap.
+
+    Empates saem na ordem de `pairs`, como numa ordenação estável.
+    """
+    heap = [(d, position) for position, d in enumerate(distances)]
+    heapq.heapify(heap)
+    while heap:
+        _, position = heapq.heappop(heap)
+        yield tuple(int(k) for k in pairs[position])
+
+
+def cover_pairs(ordered_pairs, n):
+    """Consome os pares até que todas as `n` peças tenham aparecido.
+
+    As peças que não aparecem em nenhum par entram no fim como tuplas de um elemento,
+    como em ordering.order_pieces.
+
+    Returns:
+        list: Os pares consumidos, seguidos das peças sem par.
+    """
+    if n == 0:
+        return []
+    covered, seen = [], set()
+    for pair in ordered_pairs:
+        covered.append(pair)
+        seen.update(pair)
+        if len(seen) >= n:
+            break
+    return covered + [(i,) for i in range(n) if i not in seen]
+
+
+class DistanceCache:
+    """Cache em disco das distâncias DTW exatas, indexado pelos contornos das peças.
+
+    Cada conjunto de parâmetros (pontos por contorno, banda) fica num .npz com
+    os pares de hashes e as distâncias; as entradas novas só vão para o disco
+    em `flush`, somadas às que outros processos tenham gravado nesse meio-tempo.
+
+    Args:
+        cache_dir (str): Pasta do cache; usa a do cache de geometria se None.
+    """
+
+    def __init__(self, cache_dir=None):
+        self.cache_dir = DEFAULT_CACHE_DIR if cache_dir is None else cache_dir
+        self._tables = {}  # parâmetros -> {(hash, hash): distância}
+        self._dirty = {}   # parâmetros -> entradas ainda não gravadas
+
+    @staticmethod
+    def part_keys(series):
+        """Hash de cada contorno reamostrado (P, L, 2)."""
+        series = np.ascontiguousarray(series, dtype=np.float64)
+        return [hashlib.sha1(contour.tobytes()).hexdigest() for contour in series]
+
+    def _path(self, params):
+        return os.path.join(self.cache_dir, f"dtw-v{DISTANCE_CACHE_VERSION}-{'-'.join(map(str, params))}.npz")
+
+    @staticmethod
+    def _read(path):
+        try:
+            with np.load(path) as data:
+                return dict(zip(zip(data['a'].tolist(), data['b'].tolist()), data['distances'].tolist()))
+        except (OSError, ValueError, KeyError):
+            return {}
+
+    def _table(self, params):
+        if params not in self._tables:
+            self._tables[params] = self._read(self._path(params))
+        return self._tables[params]
+
+    def lookup(self, params, keys_a, keys_b):
+        """Distâncias guardadas dos pares (nan nos que faltam)."""
+        table = self._table(params)
+        found = np.array([table.get((a, b) if a < b else (b, a), np.nan) for a, b in zip(keys_a, keys_b)],
+                         dtype=float)
+        telemetry.count('dtw_cache_hits', int(np.count_nonzero(~np.isnan(found))))
+        return found
+
+    def store(self, params, keys_a, keys_b, distances):
+        """Guarda distâncias exatas (as infinitas, de pares abandonados, são ignoradas)."""
+        table, dirty = self._table(params), self._dirty.setdefault(params, {})
+        for a, b, d in zip(keys_a, keys_b, distances):
+            if np.isfinite(d):
+                key = (a, b) if a < b else (b, a)
+                table[key] = dirty[key] = float(d)
+
+    def flush(self):
+        """Grava as entradas novas (de forma atômica, somadas às que já estão no disco)."""
+        for params, dirty in self._dirty.items():
+            if not dirty:
+                continue
+            path = self._path(params)
+            table = self._read(path)
+            table.update(dirty)
+            keys = list(table)
+            os.makedirs(self.cache_dir, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.npz')
+            try:
+                with os.fdopen(fd, 'wb') as tmp_file:
+                    np.savez(tmp_file, a=np.array([a for a, _ in keys], dtype='U40'),
+                             b=np.array([b for _, b in keys], dtype='U40'),
+                             distances=np.array(list(table.values()), dtype=np.float32))
+                os.replace(tmp_path, path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+            dirty.clear()
@@ -0,0 +1,123 @@
+"""
+Índice espacial das peças já posicionadas em uma folha.
+
+Cada peça é corrigida (buffer(0)) e inflada pela folga mínima uma única vez,
+na inserção, e fica preparada para os testes do shapely. As consultas de
+colisão usam uma STRtree e só testam as vizinhas cujas bounding boxes
+se sobrepõem à do candidato.
+"""
+from itertools import count
+
+import numpy as np
+import shapely
+from shapely.strtree import STRtree
+
+import telemetry
+
+# Identificadores únicos das folhas (usados para reaproveitar índices em outros processos)
+_layout_ids = count()
+
+
+class SheetLayout:
+    """Peças posicionadas em uma folha, com índice espacial para testes de colisão.
+
+    A STRtree do shapely é imutável, então as inserções vão para uma pequena
+    lista ainda não indexada; a árvore é reconstruída quando essa lista cresce
+    demais, o que mantém o custo de cada inserção amortizado.
+
+    Pode ser usada no lugar da lista de polígonos de uma folha: suporta
+    append, len, iteração e indexação, devolvendo os polígonos originais.
+
+    Args:
+        clearance (float): Folga mínima exigida entre as peças.
+        polygons (iterable): Peças já posicionadas na folha.
+    """
+
+    def __init__(self, clearance=0, polygons=()):
+        self.uid = next(_layout_ids)
+        self.clearance = clearance
+        self.polygons = []
+        self._inflated = []
+        self._tree = None
+        self._indexed = 0
+        for poly in polygons:
+            self.append(poly)
+
+    def append(self, poly):
+        """Adiciona uma peça posicionada à folha."""
+        if not poly.is_valid:
+            poly = poly.buffer(0)
+        inflated = poly.buffer(self.clearance) if self.clearance > 0 else poly
+        shapely.prepare(inflated)
+        self.polygons.append(poly)
+        self._inflated.append(inflated)
+        # Reconstrói a árvore quando a parte não indexada passa de ~sqrt(n)
+        pending = len(self.polygons) - self._indexed
+        if pending > max(8, int(np.sqrt(len(self.polygons)))):
+            self._rebuild()
+
+    def _rebuild(self):
+        self._tree = STRtree(self._inflated)
+        self._indexed = len(self._inflated)
+
+    def __len__(self):
+        return len(self.polygons)
+
+    def __iter__(self):
+        return iter(self.polygons)
+
+    def __getitem__(self, index):
+        return self.polygons[index]
+
+    def __repr__(self):
+        return f"SheetLayout(clearance={self.clearance}, parts={len(self.polygons)})"
+
+    def neighbours(self, geom):
+        """Índices das peças cuja bounding box (já inflada) se sobrepõe à de `geom`."""
+        if self._tree is not None:
+            hits = self._tree.query(geom)
+        else:
+            hits = np.empty(0, dtype=np.intp)
+        pending = np.arange(self._indexed, len(self._inflated))
+        return np.concatenate([np.sort(hits), pending])
+
+    def collides(self, geom):
+        """Verifica se `geom` invade a folga de alguma peça da folha."""
+        neighbours = self.neighbours(geom)
+        telemetry.count('collision_queries')
+        telemetry.count('collision_neighbours', len(neighbours))
+        return any(self._inflated[i].intersects(geom) for i in neighbours)
+
+    def collides_many(self, geoms):
+        """Versão vetorizada de collides para um array de geometrias.
+
+        Returns:
+            numpy.ndarray: Array booleano, True onde a geometria colide com alguma peça.
+        """
+        geoms = np.asarray(geoms, dtype=object)
+        hit = np.zeros(len(geoms), dtype=bool)
+        if self._tree is not None:
+            # Filtra pelas bounding boxes e testa contra as peças preparadas da árvore
+            input_idx, tree_idx = self._tree.query(geoms)
+            inflated = np.asarray(self._inflated[:self._indexed], dtype=object)
+            touching = shapely.intersects(inflated[tree_idx], geoms[input_idx])
+            hit[input_idx[touching]] = True
+        pending = self._inflated[self._indexed:]
+        if pending:
+            hit |= shapely.intersects(geoms[:, None], np.asarray(pending, dtype=object)[None, :]).any(axis=1)
+        if telemetry.enabled():
+            telemetry.count('collision_queries', len(geoms))
+            telemetry.count('collision_neighbours', (len(input_idx) if self._tree is not None else 0)
+                            + len(geoms) * len(pending))
+        return hit
+
+
+def as_sheet_layout(current_layout, clearance=0):
+    """Retorna `current_layout` como SheetLayout com a folga pedida.
+
+    Uma SheetLayout com a mesma folga é retornada sem cópia; listas de
+    polígonos (ou folgas diferentes) geram um índice novo.
+    """
+    if isinstance(current_layout, SheetLayout) and current_layout.clearance == clearance:
+        return current_layout
+    return SheetLayout(clearance, current_layout)
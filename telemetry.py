@@ -0,0 +1,231 @@
+"""
+Telemetria opcional do pipeline de nesting: tempos por etapa e contadores.
+
+As etapas (carga dos SVGs, ordenação, empacotamento, cada find_position, as
+rotações com reparo por buffer(0)) abrem medições com `span`, e o código
+geométrico soma contadores com `count` (candidatas testadas, testes de
+colisão, rejeições por motivo, acertos de cache). Os contadores vão para a
+medição aberta mais interna e, quando ela termina, somam-se aos da medição
+que a contém; então a etapa 'pack' traz o total de todas as buscas.
+
+Cada medição terminada vira um evento (um dicionário) entregue ao destino
+ativo: LogSink (logging), JSONLinesSink (um JSON por linha) ou MemorySink
+(lista em memória, com um resumo por etapa). Sem destino ativo, que é o
+padrão, `span` devolve um objeto nulo compartilhado e `count` só lê uma
+variável global, então a instrumentação quase não custa nada.
+
+A telemetria é ligada com `recording(sink)` (ou `set_sink`), ou pela
+variável de ambiente PAPERMODEL_NEST_TELEMETRY com o caminho de um arquivo
+JSON lines. Nos processos de trabalho do ParallelPlacer e do otimizador só
+é registrado o que a variável de ambiente ligar. A pilha das medições
+abertas é de cada thread: trabalhos simultâneos (async_nest.NestingJob roda
+cada pipeline numa thread) não misturam contadores nem profundidade.
+
+Exemplo:
+    with telemetry.recording(telemetry.MemorySink()) as sink:
+        main('components_svg', engine='batch')
+    print(sink.summary()['find_position'])
+"""
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+# Destino ativo dos eventos (None = telemetria desligada) e pilha das medições abertas de cada thread
+_sink = None
+_local = threading.local()
+
+
+def _spans():
+    stack = getattr(_local, 'spans', None)
+    if stack is None:
+        stack = _local.spans = []
+    return stack
+
+
+def enabled():
+    """Indica se há um destino ativo (use para evitar cálculos feitos só para a telemetria)."""
+    return _sink is not None
+
+
+class _NullSpan:
+    """Medição usada com a telemetria desligada: não faz nada."""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def count(self, key, n=1):
+        pass
+
+    def set(self, **fields):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Span:
+    """Medição de uma etapa: tempo decorrido, campos descritivos e contadores.
+
+    Args:
+        name (str): Nome da etapa (o campo 'event' do evento).
+        fields (dict): Campos fixos do evento (por exemplo o motor de busca).
+    """
+
+    __slots__ = ('name', 'fields', 'counters', '_start', '_stack')
+
+    def __init__(self, name, fields):
+        self.name = name
+        self.fields = fields
+        self.counters = Counter()
+        self._start = None
+        self._stack = None
+
+    def __enter__(self):
+        # A pilha da thread que abriu a medição (o `with` termina na mesma thread)
+        self._stack = _spans()
+        self._stack.append(self)
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        seconds = time.perf_counter() - self._start
+        stack = self._stack
+        stack.remove(self)
+        if stack:
+            stack[-1].counters.update(self.counters)
+        event = {'event': self.name, 'seconds': seconds, 'depth': len(stack)}
+        event.update(self.fields)
+        if self.counters:
+            event['counters'] = dict(self.counters)
+        if exc_type is not None:
+            event['error'] = exc_type.__name__
+        if _sink is not None:
+            _sink.emit(event)
+        return False
+
+    def count(self, key, n=1):
+        self.counters[key] += n
+
+    def set(self, **fields):
+        self.fields.update(fields)
+
+
+def span(name, **fields):
+    """Abre a medição de uma etapa (use com `with`); não faz nada com a telemetria desligada."""
+    if _sink is None:
+        return _NULL_SPAN
+    return Span(name, fields)
+
+
+def count(key, n=1):
+    """Soma `n` ao contador `key` da medição aberta mais interna."""
+    if _sink is not None:
+        stack = _spans()
+        if stack:
+            stack[-1].counters[key] += n
+
+
+class LogSink:
+    """Envia cada evento para o logging, numa linha legível.
+
+    Args:
+        logger (logging.Logger): Logger de destino; usa o logger 'telemetry' se None.
+        level (int): Nível das mensagens.
+    """
+
+    def __init__(self, logger=None, level=logging.INFO):
+        self.logger = logging.getLogger('telemetry') if logger is None else logger
+        self.level = level
+
+    def emit(self, event):
+        details = ' '.join(f'{key}={value}' for key, value in event.items()
+                           if key not in ('event', 'seconds', 'depth', 'counters'))
+        counters = ' '.join(f'{key}={value}' for key, value in event.get('counters', {}).items())
+        self.logger.log(self.level, '%s%s %.4fs %s %s', '  ' * event['depth'], event['event'],
+                        event['seconds'], details, counters)
+
+    def close(self):
+        pass
+
+
+class JSONLinesSink:
+    """Grava cada evento como uma linha JSON (acrescentando ao arquivo, se existir).
+
+    Args:
+        path (str): Caminho do arquivo .jsonl.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'a')
+        self._lock = threading.Lock()  # uma linha inteira por evento, mesmo com várias threads
+
+    def emit(self, event):
+        line = json.dumps(event, default=str) + '\n'
+        with self._lock:
+            self._file.write(line)
+
+    def close(self):
+        self._file.close()
+
+
+class MemorySink:
+    """Guarda os eventos em memória, para análise no próprio processo."""
+
+    def __init__(self):
+        self.events = []
+
+    def emit(self, event):
+        self.events.append(event)
+
+    def close(self):
+        pass
+
+    def summary(self):
+        """Totais por etapa: quantidade de medições, tempo somado e contadores somados.
+
+        Returns:
+            dict: {nome da etapa: {'calls': int, 'seconds': float, 'counters': dict}}.
+        """
+        totals = {}
+        for event in self.events:
+            total = totals.setdefault(event['event'], {'calls': 0, 'seconds': 0.0, 'counters': Counter()})
+            total['calls'] += 1
+            total['seconds'] += event['seconds']
+            total['counters'].update(event.get('counters', {}))
+        for total in totals.values():
+            total['counters'] = dict(total['counters'])
+        return totals
+
+
+def set_sink(sink):
+    """Troca o destino dos eventos (None desliga a telemetria); retorna o destino anterior."""
+    global _sink
+    previous, _sink = _sink, sink
+    return previous
+
+
+@contextmanager
+def recording(sink):
+    """Liga a telemetria com o destino dado dentro do bloco `with` e depois o fecha."""
+    previous = set_sink(sink)
+    try:
+        yield sink
+    finally:
+        set_sink(previous)
+        sink.close()
+
+
+if os.environ.get('PAPERMODEL_NEST_TELEMETRY'):
+    set_sink(JSONLinesSink(os.environ['PAPERMODEL_NEST_TELEMETRY']))
+    atexit.register(_sink.close)